@@ -66,6 +66,17 @@ class ArgumentParser:
             default="../../droidlet/artifacts/datasets/annotated_data/",
             help="path to annotated data",
         )
+        nsp_parser.add_argument(
+            "--nsp_parse_cache",
+            default="",
+            help="sqlite file caching the parsing model outputs, not stored on disk if empty",
+        )
+        nsp_parser.add_argument(
+            "--nsp_cpu_inference",
+            default="",
+            choices=["", "quantize"],
+            help="run the parsing model on CPU; quantize: with int8 dynamically quantized linear layers",
+        )
         nsp_parser.add_argument(
             "--ground_truth_data_dir",
             default="../../droidlet/artifacts/datasets/ground_truth/",
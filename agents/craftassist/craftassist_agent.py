@@ -36,7 +36,7 @@ if __name__ == "__main__":
 from droidlet.dialog.dialogue_manager import DialogueManager
 from droidlet.dialog.dialogue_task import build_question_json
 from droidlet.base_util import Pos, Look, npy_to_blocks_list
-from droidlet.shared_data_struct.craftassist_shared_utils import Player, Item
+from droidlet.shared_data_struct.craftassist_shared_utils import Player, Item, PathPlanner
 from agents.droidlet_agent import DroidletAgent
 from droidlet.memory.memory_nodes import PlayerNode
 from droidlet.perception.semantic_parsing.nsp_querier import NSPQuerier
@@ -101,6 +101,8 @@ class CraftAssistAgent(DroidletAgent):
         self.no_default_behavior = opts.no_default_behavior
         self.agent_type = "craftassist"
         self.point_targets = []
+        # Move tasks reuse the paths to their target when the agent drifts off them
+        self.path_planner = PathPlanner()
         self.last_chat_time = 0
         # areas must be perceived at each step
         # List of tuple (XYZ, radius), each defines a cube
@@ -5,6 +5,7 @@ import os
 import faulthandler
 import signal
 import random
+import threading
 import sentry_sdk
 from multiprocessing import set_start_method
 from collections import namedtuple
@@ -94,6 +95,11 @@ class CraftAssistSwarmMaster(CraftAssistAgent):
         self.swarm_workers = [
             CraftAssistSwarmWorker_Wrapper(opts, idx=i) for i in range(1, self.num_agents)
         ]
+        # held by the main loop while it steps, and by the memory server thread
+        # while it handles a worker query
+        self.memory_lock = threading.Lock()
+        # seconds start() sleeps after a step, set by task_step when there is nothing to do
+        self._idle_sleep = 0
 
         super(CraftAssistSwarmMaster, self).__init__(opts)
 
@@ -133,6 +139,8 @@ class CraftAssistSwarmMaster(CraftAssistAgent):
             "check_memid_exists": self.memory.check_memid_exists,
             "get_mem_by_id": self.memory.get_mem_by_id,
             "basic_search": self.memory.basic_search,
+            "get_watch_version": self.memory.get_watch_version,
+            "get_block_changes": self.memory.get_block_changes,
             "get_block_object_by_xyz": self.memory.get_block_object_by_xyz,
             "get_block_object_ids_by_xyz": self.memory.get_block_object_ids_by_xyz,
             "get_object_info_by_xyz": self.memory.get_object_info_by_xyz,
@@ -146,8 +154,14 @@ class CraftAssistSwarmMaster(CraftAssistAgent):
             "set_memory_updated_time": self.memory.set_memory_updated_time,
             "set_memory_attended_time": self.memory.set_memory_attended_time,
             "add_chat": self.memory.add_chat,
+            "_batch": self.handle_batch_query,
         }
 
+    def handle_batch_query(self, *commands):
+        """run a list of (command_name, args) from a worker in one transaction"""
+        with self.memory.batch():
+            return tuple(self.handle_query_dict[name](*args) for name, args in commands)
+
     def if_swarm_task(self, mem):
         for i in range(1, self.num_agents):
             if "swarm_worker_{}".format(i) in mem.get_tags():
@@ -177,7 +191,8 @@ class CraftAssistSwarmMaster(CraftAssistAgent):
         query = "SELECT MEMORY FROM Task WHERE ((running>=1) AND (paused <= 0))"
         _, task_mems = self.memory.basic_search(query)
         if not task_mems:
-            time.sleep(sleep_time)
+            # start() sleeps once the memory lock is released
+            self._idle_sleep = sleep_time
             return
         for mem in task_mems:
             if not self.if_swarm_task(mem):
@@ -276,6 +291,9 @@ class CraftAssistSwarmMaster(CraftAssistAgent):
                         self.init_status[i] = True
 
     def step_handle_worker_memory_queries(self):
+        """handle all the memory queries waiting from the workers,
+        returns the number handled"""
+        count = 0
         for i in range(self.num_agents - 1):
             flag = True
             while flag:
@@ -283,8 +301,21 @@ class CraftAssistSwarmMaster(CraftAssistAgent):
                     flag = False
                 else:
                     query = self.swarm_workers[i].memory_send_queue.get_nowait()
-                    response = self.handle_memory_query(query)
+                    with self.memory_lock:
+                        response = self.handle_memory_query(query)
                     self.swarm_workers[i].memory_receive_queue.put(response)
+                    count += 1
+        return count
+
+    def serve_worker_memory_queries(self, poll_time=0.001):
+        """memory server loop, run in its own thread so that worker queries are
+        answered as they arrive instead of once per master step"""
+        while not self._shutdown:
+            try:
+                if self.step_handle_worker_memory_queries() == 0:
+                    time.sleep(poll_time)
+            except Exception as e:
+                self.handle_exception(e)
 
     def start(self):
         # count forever unless the shutdown signal is given
@@ -292,13 +323,18 @@ class CraftAssistSwarmMaster(CraftAssistAgent):
             swarm_worker.start()
 
         self.init_status = [False] * (self.num_agents - 1)
+        memory_server = threading.Thread(target=self.serve_worker_memory_queries, daemon=True)
+        memory_server.start()
         while not self._shutdown:
             try:
-                if all(self.init_status):
-                    self.step()
-                self.step_assign_new_tasks_to_workers()
-                self.step_update_tasks_with_worker_data()
-                self.step_handle_worker_memory_queries()
+                with self.memory_lock:
+                    self._idle_sleep = 0
+                    if all(self.init_status):
+                        self.step()
+                    self.step_assign_new_tasks_to_workers()
+                    self.step_update_tasks_with_worker_data()
+                if self._idle_sleep:
+                    time.sleep(self._idle_sleep)
 
             except Exception as e:
                 self.handle_exception(e)
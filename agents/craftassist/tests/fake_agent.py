@@ -10,8 +10,9 @@ from typing import List, Tuple
 from droidlet.lowlevel.minecraft.mc_util import XYZ, IDM, Block
 from droidlet.memory.memory_nodes import ChatNode
 from droidlet.base_util import Look, Pos
-from droidlet.shared_data_struct.craftassist_shared_utils import Item, Player
+from droidlet.shared_data_struct.craftassist_shared_utils import Item, Player, PathPlanner
 from agents.droidlet_agent import DroidletAgent
+from agents.scheduler import TaskScheduler
 from droidlet.memory.craftassist.mc_memory import MCAgentMemory
 from droidlet.memory.craftassist.mc_memory_nodes import VoxelObjectNode
 from agents.craftassist.craftassist_agent import CraftAssistAgent
@@ -94,6 +95,9 @@ class FakeAgent(DroidletAgent):
         self.low_level_data = low_level_data
         super(FakeAgent, self).__init__(opts)
         self.do_heuristic_perception = do_heuristic_perception
+        # step every task every tick, so the tests don't depend on how fast they run
+        self.scheduler = TaskScheduler(tick_budget=None)
+        self.path_planner = PathPlanner()
         self.no_default_behavior = True
         self.last_task_memid = None
         pos = (0, 63, 0)
@@ -9,7 +9,7 @@ import datetime
 import os
 
 from agents.core import BaseAgent
-from agents.scheduler import EmptyScheduler
+from agents.scheduler import TaskScheduler
 
 from droidlet.event import sio, dispatch
 from droidlet.interpreter import InterpreterBase
@@ -23,6 +23,13 @@ random.seed(0)
 DATABASE_FILE_FOR_DASHBOARD = "dashboard_data.db"
 DEFAULT_BEHAVIOUR_TIMEOUT = 20
 MEMORY_DUMP_KEYFRAME_TIME = 0.5
+# the memory tables shown in the dashboard; their rows are keyed by the memid
+DASHBOARD_MEMORY_TABLES = {
+    "memories": "Memories",
+    "triples": "Triples",
+    "reference_objects": "ReferenceObjects",
+    "named_abstractions": "NamedAbstractions",
+}
 
 
 # a BaseAgent with:
@@ -44,11 +51,14 @@ class DroidletAgent(BaseAgent):
         self.areas_to_perceive = []
         self.perceive_on_chat = False
         self.agent_type = None
-        self.scheduler = EmptyScheduler()
+        self.scheduler = TaskScheduler()
 
         self.dashboard_memory_dump_time = time.time()
+        # sid -> the memory version the dashboard client is synced to (None if it
+        # needs a snapshot), and the sids whose last memory message isn't acked yet
+        self.dashboard_memory_versions = {}
+        self.dashboard_memory_unacked = set()
         self.dashboard_memory = {
-            "db": {},
             "objects": [],
             "humans": [],
             "chatResponse": {},
@@ -99,6 +109,18 @@ class DroidletAgent(BaseAgent):
             payload = {"commandList": out}
             sio.emit("updateSearchList", payload)
 
+        @sio.on("memoryStateAck")
+        def ack_memory_state(sid, version):
+            """The dashboard client has applied the memory state up to version,
+            or wants a snapshot if version is None"""
+            self.dashboard_memory_versions[sid] = version
+            self.dashboard_memory_unacked.discard(sid)
+
+        @sio.on("disconnect")
+        def forget_memory_client(sid):
+            self.dashboard_memory_versions.pop(sid, None)
+            self.dashboard_memory_unacked.discard(sid)
+
         @sio.on("get_agent_type")
         def report_agent_type(sid):
             sio.emit("updateAgentType", {"agent_type": self.agent_type})
@@ -302,11 +324,11 @@ class DroidletAgent(BaseAgent):
         self.maybe_dump_memory_to_dashboard()
 
     def task_step(self, sleep_time=0.25):
-        query = "SELECT MEMORY FROM Task WHERE prio={}".format(TaskNode.CHECK_PRIO)
-        _, task_mems = self.memory.basic_search(query)
-        for mem in task_mems:
-            if mem.task.init_condition.check():
-                mem.get_update_status({"prio": TaskNode.CHECK_PRIO + 1})
+        # the conditions of tasks waiting on other tasks only read the db when those
+        # change (see WatchedCondition); only build the TaskNodes of the tasks activated
+        for memid, task in self.memory.get_tasks_by_prio(TaskNode.CHECK_PRIO):
+            if task.init_condition.check():
+                TaskNode(self.memory, memid).get_update_status({"prio": TaskNode.CHECK_PRIO + 1})
 
         query = "SELECT MEMORY FROM Task WHERE ((prio>{}) AND (paused <= 0))".format(
             TaskNode.CHECK_PRIO
@@ -315,15 +337,19 @@ class DroidletAgent(BaseAgent):
         if not task_mems:
             time.sleep(sleep_time)
             return
+        # the scheduler orders the tasks and ends the tick when they have used its budget;
+        # the tasks it didn't get to stay running, and age until they are stepped
         task_mems = self.scheduler.filter(task_mems)
-        task_mems.sort(reverse=True, key=lambda x: x.prio)
         for mem in task_mems:
+            if not self.scheduler.can_step(mem.memid):
+                break
             # prio/finished could have been changed by another Task, e.g. a ControlBlock
             mem.update_node()
             if mem.prio > TaskNode.CHECK_PRIO:
-                # FIXME set the other ones to running=0.  doesn't matter rn bc scheduler is empty, everything runs
                 mem.get_update_status({"running": 1})
+                start = time.perf_counter()
                 mem.task.step()
+                self.scheduler.record(mem.memid, time.perf_counter() - start)
                 if mem.task.finished:
                     mem.update_task()
 
@@ -446,19 +472,37 @@ class DroidletAgent(BaseAgent):
             fn(self)
 
     def maybe_dump_memory_to_dashboard(self):
+        """Send each dashboard client the rows of the DASHBOARD_MEMORY_TABLES that changed
+        since the version it has acked: a "memoryState" snapshot the first time, then
+        "memoryStateDelta"s.  A client gets nothing new until it acks the last message"""
         if time.time() - self.dashboard_memory_dump_time > MEMORY_DUMP_KEYFRAME_TIME:
             self.dashboard_memory_dump_time = time.time()
-            memories_main = self.memory._db_read("SELECT * FROM Memories")
-            triples = self.memory._db_read("SELECT * FROM Triples")
-            reference_objects = self.memory._db_read("SELECT * FROM ReferenceObjects")
-            named_abstractions = self.memory._db_read("SELECT * FROM NamedAbstractions")
-            self.dashboard_memory["db"] = {
-                "memories": memories_main,
-                "triples": triples,
-                "reference_objects": reference_objects,
-                "named_abstractions": named_abstractions,
-            }
-            sio.emit("memoryState", self.dashboard_memory["db"])
+            tables = list(DASHBOARD_MEMORY_TABLES.values())
+            changes = {}
+            for sid, since_version in self.dashboard_memory_versions.items():
+                if sid in self.dashboard_memory_unacked:
+                    continue
+                if since_version not in changes:
+                    changes[since_version] = self.memory.get_changes(tables, since_version)
+                version, memids, rows = changes[since_version]
+                if version == since_version:
+                    continue
+                msg = {k: rows[table] for k, table in DASHBOARD_MEMORY_TABLES.items()}
+                msg["version"] = version
+                if memids is None:
+                    sio.emit("memoryState", msg, room=sid)
+                else:
+                    # the client replaces the rows of the memids with the ones in msg
+                    msg["from_version"] = since_version
+                    msg["memids"] = memids
+                    sio.emit("memoryStateDelta", msg, room=sid)
+                self.dashboard_memory_versions[sid] = version
+                self.dashboard_memory_unacked.add(sid)
+            # changes all the clients have are not needed anymore
+            versions = [v for v in self.dashboard_memory_versions.values() if v is not None]
+            self.memory.prune_changes(
+                min(versions) if versions else self.memory.get_changes_version()
+            )
 
     def log_to_dashboard(self, **kwargs):
         """Emits the event to the dashboard and/or logs it in a file"""
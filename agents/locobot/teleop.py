@@ -11,9 +11,7 @@ import functools
 
 from droidlet import dashboard
 from droidlet.dashboard.o3dviz import O3DViz
-import numpy as np
 from scipy.spatial import distance
-import open3d as o3d
 from droidlet.lowlevel.hello_robot.remote.obstacle_utils import get_points_in_front, is_obstacle, get_o3d_pointcloud, get_ground_plane
 
 import time
@@ -190,8 +188,7 @@ if __name__ == "__main__":
         "image_quality": 10,  # from 10 to 100, 100 being best
     }
 
-    all_points = None
-    all_colors = None
+    frame_count = 0
     first = True
     prev_stg = None
     path_count = 0
@@ -237,22 +234,9 @@ if __name__ == "__main__":
         points, colors = rgb_depth.ptcloud.reshape(-1, 3), rgb_depth.rgb.reshape(-1, 3)
         colors = colors / 255.
 
-        if all_points is None:
-            all_points = points
-            all_colors = colors
-        else:
-            all_points = np.concatenate((all_points, points), axis=0)
-            all_colors = np.concatenate((all_colors, colors), axis=0)
-
-        opcd = o3d.geometry.PointCloud()
-        opcd.points = o3d.utility.Vector3dVector(all_points)
-        opcd.colors = o3d.utility.Vector3dVector(all_colors)
-        opcd = opcd.voxel_down_sample(0.03)
-
-        all_points = np.asarray(opcd.points)
-        all_colors = np.asarray(opcd.colors)
-        
-        o3dviz.put('pointcloud', opcd)
+        # only the voxels this frame adds to the map are sent to the visualizer
+        o3dviz.put_points('pointcloud', frame_count, points, colors, voxel_size=0.03)
+        frame_count += 1
         # obstacle, cpcd, crop, bbox, rest = mover.is_obstacle_in_front(return_viz=True)
         # if obstacle:
         #     crop.paint_uniform_color([0.0, 1.0, 1.0])
@@ -1,7 +1,109 @@
 """
 Copyright (c) Facebook, Inc. and its affiliates.
 """
+import logging
+import time
+
+# debts smaller than this (e.g. left by repaying in float steps) count as paid
+DEBT_EPSILON = 1e-9
+
 
 class EmptyScheduler:
+    """steps every runnable task every tick, highest prio first"""
+
     def filter(self, task_mems):
-        return task_mems
+        return sorted(task_mems, reverse=True, key=lambda x: x.prio)
+
+    def can_step(self, memid):
+        return True
+
+    def record(self, memid, elapsed):
+        pass
+
+
+class TaskScheduler:
+    """
+    chooses which of the runnable top-level tasks are stepped in a tick, and in which order.
+
+    the tasks are stepped in order of prio, plus aging * the number of ticks the task
+    has been waiting, so a low prio task can't be starved forever.  the tick ends when
+    the tasks have used tick_budget seconds, so perception and chat handling run
+    again soon even when a heavy task (e.g. a Build or a Dig) is active.
+
+    a step can't be interrupted, so a task whose step takes more than its task_budget
+    is preempted across ticks instead: the excess (up to the cost of one step) is its
+    debt, and a task in debt is skipped until the debt is paid back at task_budget per
+    tick.  the first task of a tick is always stepped, so something makes progress
+    every tick.
+
+    Args:
+        tick_budget (float): seconds all the task steps of a tick may use; if None, every
+            task is stepped every tick, highest prio first
+        task_budget (float): seconds a task's step may use each tick
+        aging (float): prio a task gains for each tick it waits
+
+    Attributes:
+        tick_times (dict): memid -> seconds the task's step used in the last tick
+        total_times (dict): memid -> seconds the task's steps have used in total
+    """
+
+    def __init__(self, tick_budget=0.1, task_budget=0.05, aging=1.0):
+        self.tick_budget = tick_budget
+        self.task_budget = task_budget
+        self.aging = aging
+        self.tick_start = time.perf_counter()
+        self.tick_times = {}
+        self.total_times = {}
+        self.debts = {}
+        self.waiting = {}
+
+    def filter(self, task_mems):
+        """start a new tick, and return the task_mems in the order they should be stepped"""
+        memids = set(m.memid for m in task_mems)
+        for memid in list(self.debts):
+            if memid not in memids:
+                self.debts.pop(memid)
+                self.waiting.pop(memid, None)
+                self.total_times.pop(memid, None)
+        # the tasks that weren't stepped last tick age, and pay back some of their debt
+        for memid in memids:
+            if memid not in self.tick_times:
+                self.waiting[memid] = self.waiting.get(memid, 0) + 1
+                self.debts[memid] = _clamp_debt(self.debts.get(memid, 0.0) - self.task_budget)
+            else:
+                self.waiting[memid] = 0
+                self.debts.setdefault(memid, 0.0)
+
+        self.tick_times = {}
+        self.tick_start = time.perf_counter()
+        if self.tick_budget is None:
+            return sorted(task_mems, reverse=True, key=lambda m: m.prio)
+        return sorted(
+            task_mems,
+            reverse=True,
+            key=lambda m: (self.debts[m.memid] <= 0, m.prio + self.aging * self.waiting[m.memid]),
+        )
+
+    def can_step(self, memid):
+        """should the task with this memid be stepped now?  if not, neither should the
+        tasks after it in the order given by filter()"""
+        if not self.tick_times:
+            return True
+        if self.tick_budget is None:
+            return True
+        if self.debts.get(memid, 0.0) > 0:
+            return False
+        return time.perf_counter() - self.tick_start < self.tick_budget
+
+    def record(self, memid, elapsed):
+        """the task with this memid was stepped this tick, and it took elapsed seconds"""
+        self.tick_times[memid] = self.tick_times.get(memid, 0.0) + elapsed
+        self.total_times[memid] = self.total_times.get(memid, 0.0) + elapsed
+        debt = self.debts.get(memid, 0.0) + elapsed - self.task_budget
+        self.debts[memid] = _clamp_debt(min(debt, elapsed))
+        if elapsed > self.task_budget:
+            logging.debug("task {} step took {:.3f}s".format(memid, elapsed))
+
+
+def _clamp_debt(debt):
+    return debt if debt > DEBT_EPSILON else 0.0
@@ -0,0 +1,57 @@
+"""
+Copyright (c) Facebook, Inc. and its affiliates.
+"""
+import unittest
+from agents.scheduler import TaskScheduler
+
+
+class FakeTaskMem:
+    def __init__(self, memid, prio):
+        self.memid = memid
+        self.prio = prio
+
+
+def tick(scheduler, task_mems, elapsed):
+    """run a tick of the agent's task loop, the steps taking elapsed[memid] seconds"""
+    stepped = []
+    for mem in scheduler.filter(task_mems):
+        if not scheduler.can_step(mem.memid):
+            break
+        scheduler.record(mem.memid, elapsed.get(mem.memid, 0.0))
+        stepped.append(mem.memid)
+    return stepped
+
+
+class TaskSchedulerTest(unittest.TestCase):
+    def test_aging(self):
+        # no budget: only the first task of each tick is stepped
+        scheduler = TaskScheduler(tick_budget=0.0, aging=1.0)
+        tasks = [FakeTaskMem("high", 5), FakeTaskMem("low", 0)]
+        stepped = [tick(scheduler, tasks, {}) for _ in range(10)]
+        self.assertEqual(stepped[0], ["high"])
+        # after waiting 6 ticks (counting the first), the low prio task is ahead of the high prio one
+        self.assertEqual(stepped.index(["low"]), 5)
+
+    def test_debt(self):
+        scheduler = TaskScheduler(tick_budget=10.0, task_budget=0.05)
+        tasks = [FakeTaskMem("heavy", 5), FakeTaskMem("light", 0)]
+        self.assertEqual(tick(scheduler, tasks, {"heavy": 0.2}), ["heavy", "light"])
+        self.assertAlmostEqual(scheduler.debts["heavy"], 0.15)
+
+        # the heavy task is skipped while it pays back its debt, at task_budget per tick
+        skipped = 0
+        while tick(scheduler, tasks, {}) == ["light"]:
+            skipped += 1
+        self.assertEqual(skipped, 3)
+        self.assertEqual(scheduler.debts["heavy"], 0.0)
+        self.assertEqual(tick(scheduler, tasks, {}), ["heavy", "light"])
+
+    def test_first_task_always_steps(self):
+        scheduler = TaskScheduler(tick_budget=10.0, task_budget=0.05)
+        tasks = [FakeTaskMem("heavy", 5)]
+        for _ in range(3):
+            self.assertEqual(tick(scheduler, tasks, {"heavy": 1.0}), ["heavy"])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -10,6 +10,7 @@ import torch
 import open3d as o3d
 from open3d.visualization import O3DVisualizer, gui
 from droidlet.parallel import BackgroundTask
+from droidlet.dashboard.point_clouds import voxel_downsample, add_new_voxels
 
 attributes = {
     "TriangleMesh": {
@@ -31,6 +32,11 @@ attributes = {
 }
 
 
+# commands coming in faster than this are queued for the next tick instead of each
+# drawing a frame
+RENDER_INTERVAL = 1.0 / 30
+
+
 def serialize(m):
     class_type = type(m)
     class_name = class_type.__name__
@@ -71,8 +77,11 @@ class O3dViz:
         self.cam_pos = [-5, 0, 1]  # 5 cm behind origin
         self.y_axis = [0, 0, 1]  # y axis is z-inward
         self.keys = set()
+        # name of a streamed point cloud -> the frames of its chunks
+        self.chunks = {}
         self._init = False
         self.counter = 0
+        self.last_tick = 0.0
 
     def put(self, name, obj):
         cmd = "add"
@@ -82,10 +91,21 @@ class O3dViz:
             self.keys.add(name)
         self.q.put([name, cmd, obj])
 
+    def put_points(self, name, frame, points, colors=None):
+        """add (or replace) the chunk of the point cloud name for this frame"""
+        pcd = o3d.geometry.PointCloud()
+        pcd.points = o3d.utility.Vector3dVector(np.asarray(points, dtype=np.float64))
+        if colors is not None:
+            pcd.colors = o3d.utility.Vector3dVector(np.asarray(colors, dtype=np.float64))
+        self.chunks.setdefault(name, set()).add(frame)
+        self.put("{}/{}".format(name, frame), pcd)
+
     def remove(self, name):
         cmd = "remove"
         self.keys.discard(name)
         self.q.put([name, cmd, None])
+        for frame in self.chunks.pop(name, ()):
+            self.remove("{}/{}".format(name, frame))
 
     def set_camera(self, look_at, position, y_axis):
         self.look_at = look_at
@@ -159,12 +179,16 @@ class O3dViz:
         while True:
             self.run_tick(threaded=True)
 
+    def render_due(self):
+        return time.time() - self.last_tick >= RENDER_INTERVAL
+
     def run_tick(self, threaded=False):
         self.init()
 
         app, w = self.app, self.w
 
         app.run_one_tick()
+        self.last_tick = time.time()
 
         if threaded:
             time.sleep(0.001)
@@ -176,36 +200,43 @@ class O3dViz:
             self.counter = 0
             self.start_time = time.time_ns()
 
-        try:
-            name, command, geometry = self.q.get_nowait()
+        # apply everything queued since the last tick; only the last command for each
+        # geometry matters, so a geometry replaced several times is only re-added once
+        pending = {}
+        while True:
+            try:
+                name, command, geometry = self.q.get_nowait()
+            except queue.Empty:
+                break
+            pending.pop(name, None)
+            pending[name] = (command, geometry)
 
+        for name, (command, geometry) in pending.items():
             try:
                 if command == "remove":
-                    w.remove_geometry(name)
-                elif command == "replace":
-                    w.remove_geometry(name)
-                    w.add_geometry(name, geometry)
-                elif command == "add":
+                    if w.scene.has_geometry(name):
+                        w.remove_geometry(name)
+                else:
+                    if w.scene.has_geometry(name):
+                        w.remove_geometry(name)
                     w.add_geometry(name, geometry)
                     if not self.first_object_added:
                         w.reset_camera_to_default()
                         self.first_object_added = True
-
             except:
                 print("failed to add geometry to scene")
-            if self.reset_camera:
-                # Look at A from camera placed at B with Y axis
-                # pointing at C
-                # useful for pyrobot co-ordinates
-                w.scene.camera.look_at(self.look_at, self.cam_pos, self.y_axis)
-
-                # useful for initial camera co-ordinates
-                # w.scene.camera.look_at([0, 0, 1],
-                #                        [0, 0, -1],
-                #                        [0, -1, 0])
-                self.reset_camera = False
-        except queue.Empty:
-            pass
+
+        if self.reset_camera:
+            # Look at A from camera placed at B with Y axis
+            # pointing at C
+            # useful for pyrobot co-ordinates
+            w.scene.camera.look_at(self.look_at, self.cam_pos, self.y_axis)
+
+            # useful for initial camera co-ordinates
+            # w.scene.camera.look_at([0, 0, 1],
+            #                        [0, 0, -1],
+            #                        [0, -1, 0])
+            self.reset_camera = False
         w.post_redraw()
 
 
@@ -226,13 +257,22 @@ def viz_tick(o3dviz, command=None):
             o3dviz.add_robot(*ser)
         elif name == "remove":
             o3dviz.remove(ser)
+        elif name == "put_points":
+            o3dviz.put_points(*ser)
         else:
             geometry = deserialize(ser)
             o3dviz.put(name, geometry)
-    o3dviz.run_tick(threaded=False)
+    # while commands keep coming, they are applied together at the next due tick
+    if command is None or o3dviz.render_due():
+        o3dviz.run_tick(threaded=False)
 
 
 class O3DVizProcess(BackgroundTask):
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        # name of a streamed point cloud -> the sorted keys of the voxels sent for it
+        self.sent_voxels = {}
+
     def put(self, name, geometry):
         try:
             super().get_nowait()
@@ -242,7 +282,45 @@ class O3DVizProcess(BackgroundTask):
         ser = serialize(geometry)
         super().put([name, ser])
 
+    def put_points(self, name, frame, points, colors=None, voxel_size=None):
+        """
+        add a chunk of points to the point cloud name, instead of re-sending the whole
+        cloud with put.  the chunks of a cloud are drawn together; a chunk with the frame
+        of an earlier one replaces it.
+
+        Args:
+            name (str): the point cloud
+            frame: the key of the chunk, e.g. the count of the camera frame
+            points: an (N, 3) array
+            colors: an (N, 3) array of rgb colors in [0, 1], or None
+            voxel_size (float): if given, the chunk is downsampled to a point per voxel of
+                this size (see voxel_downsample), and the voxels already sent for the
+                cloud are dropped; use the same voxel_size for all the chunks of a cloud.
+                once MAX_SENT_VOXELS have been sent, the cloud is cleared and drawn again
+                from this chunk
+        """
+        try:
+            super().get_nowait()
+        except queue.Empty:
+            pass
+
+        points = np.asarray(points, dtype=np.float32).reshape(-1, 3)
+        if colors is not None:
+            colors = np.asarray(colors, dtype=np.float32).reshape(-1, 3)
+        if voxel_size:
+            points, colors, keys = voxel_downsample(points, colors, voxel_size)
+            new, sent, reset = add_new_voxels(self.sent_voxels.get(name), keys)
+            if reset and name in self.sent_voxels:
+                self.remove(name)
+            self.sent_voxels[name] = sent
+            points = points[new]
+            colors = None if colors is None else colors[new]
+            if len(points) == 0:
+                return
+        super().put(["put_points", [name, frame, points, colors]])
+
     def remove(self, name):
+        self.sent_voxels.pop(name, None)
         super().put(["remove", name])
 
     def add_robot(self, base_state, base=True, canonical=True, height=1.41):
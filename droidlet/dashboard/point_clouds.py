@@ -0,0 +1,59 @@
+"""
+Copyright (c) Facebook, Inc. and its affiliates.
+"""
+import numpy as np
+
+# voxel coordinates are packed 21 bits each into voxel_downsample's keys
+VOXEL_OFFSET = 1 << 20
+# the most voxels kept track of for a streamed point cloud, see add_new_voxels
+MAX_SENT_VOXELS = 1 << 22
+
+
+def voxel_downsample(points, colors, voxel_size):
+    """
+    keep one point per voxel of a voxel_size grid: the mean of the points in it (and the
+    mean of their colors)
+
+    Args:
+        points: an (N, 3) float array
+        colors: an (N, 3) float array, or None
+        voxel_size (float): side length of the voxels
+
+    Returns:
+        the (M, 3) points, the (M, 3) colors (or None), and a sorted (M,) int64 array with a
+        key for each voxel that is the same for every call with the same voxel_size
+    """
+    voxels = np.floor(points / voxel_size).astype(np.int64) + VOXEL_OFFSET
+    keys = (voxels[:, 0] << 42) | (voxels[:, 1] << 21) | voxels[:, 2]
+    keys, inverse, counts = np.unique(keys, return_inverse=True, return_counts=True)
+    inverse = inverse.reshape(-1)
+
+    def mean(x):
+        sums = [np.bincount(inverse, weights=x[:, i], minlength=len(keys)) for i in range(3)]
+        return (np.stack(sums, axis=1) / counts[:, None]).astype(x.dtype)
+
+    return mean(points), None if colors is None else mean(colors), keys
+
+
+def add_new_voxels(sent, keys, max_voxels=MAX_SENT_VOXELS):
+    """
+    find the voxels of keys that haven't been sent yet, and add them to the sent ones
+
+    Args:
+        sent: a sorted int64 array of the keys of the voxels sent, or None for none
+        keys: a sorted int64 array of unique voxel keys, as from voxel_downsample
+        max_voxels (int): if the sent voxels would be more than this, they are forgotten,
+            and the cloud should be drawn again from keys
+
+    Returns:
+        a boolean mask of the new keys, the sent keys with them, and whether the sent
+        voxels were forgotten
+    """
+    reset = sent is None or len(sent) + len(keys) > max_voxels
+    if reset:
+        return np.ones(len(keys), dtype=bool), keys, reset
+    idx = np.searchsorted(sent, keys)
+    inside = idx < len(sent)
+    new = np.ones(len(keys), dtype=bool)
+    new[inside] = sent[idx[inside]] != keys[inside]
+    return new, np.insert(sent, idx[new], keys[new]), reset
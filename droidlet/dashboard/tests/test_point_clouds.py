@@ -0,0 +1,47 @@
+"""
+Copyright (c) Facebook, Inc. and its affiliates.
+"""
+import unittest
+import numpy as np
+from droidlet.dashboard.point_clouds import voxel_downsample, add_new_voxels
+
+
+class PointCloudsTest(unittest.TestCase):
+    def test_voxel_downsample(self):
+        rng = np.random.RandomState(0)
+        points = (rng.rand(2000, 3) * 2 - 1).astype(np.float32)
+        colors = rng.rand(2000, 3).astype(np.float32)
+        down, down_colors, keys = voxel_downsample(points, colors, 0.25)
+
+        voxels = {}
+        for i, v in enumerate(map(tuple, np.floor(points / 0.25).astype(int))):
+            voxels.setdefault(v, []).append(i)
+        self.assertEqual(len(down), len(voxels))
+        self.assertEqual(down.dtype, np.float32)
+        self.assertTrue((np.diff(keys) > 0).all())
+        for p, c in zip(down, down_colors):
+            idx = voxels[tuple(np.floor(p / 0.25).astype(int))]
+            self.assertTrue(np.allclose(p, points[idx].mean(axis=0), atol=1e-5))
+            self.assertTrue(np.allclose(c, colors[idx].mean(axis=0), atol=1e-5))
+
+        # the keys only depend on the voxels
+        _, none, shifted_keys = voxel_downsample(points[::-1] + 0.01, None, 0.25)
+        self.assertIsNone(none)
+        self.assertGreater(len(np.intersect1d(keys, shifted_keys)), len(keys) // 2)
+
+    def test_add_new_voxels(self):
+        new, sent, reset = add_new_voxels(None, np.array([3, 5, 9]))
+        self.assertTrue(new.all() and reset)
+        new, sent, reset = add_new_voxels(sent, np.array([1, 5, 7, 9, 12]))
+        self.assertEqual(new.tolist(), [True, False, True, False, True])
+        self.assertEqual(sent.tolist(), [1, 3, 5, 7, 9, 12])
+        self.assertFalse(reset)
+
+        # past max_voxels, the sent voxels are forgotten
+        new, sent, reset = add_new_voxels(sent, np.array([2, 3]), max_voxels=7)
+        self.assertTrue(new.all() and reset)
+        self.assertEqual(sent.tolist(), [2, 3])
+
+
+if __name__ == "__main__":
+    unittest.main()
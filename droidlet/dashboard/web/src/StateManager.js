@@ -77,9 +77,11 @@ class StateManager {
     last_reply: "",
   };
   session_id = null;
+  memoryState = null; // the last memory snapshot with the deltas applied
 
   constructor() {
     this.processMemoryState = this.processMemoryState.bind(this);
+    this.processMemoryDelta = this.processMemoryDelta.bind(this);
     this.setChatResponse = this.setChatResponse.bind(this);
     this.setLastChatActionDict = this.setLastChatActionDict.bind(this);
     this.setConnected = this.setConnected.bind(this);
@@ -230,6 +232,7 @@ class StateManager {
       console.log("connect event");
       this.setConnected(true);
       this.socket.emit("get_memory_objects");
+      this.socket.emit("memoryStateAck", null);
       this.socket.emit("get_agent_type");
     });
 
@@ -237,6 +240,7 @@ class StateManager {
       console.log("reconnect event");
       this.setConnected(true);
       this.socket.emit("get_memory_objects");
+      this.socket.emit("memoryStateAck", null);
       this.socket.emit("get_agent_type");
     });
 
@@ -244,6 +248,7 @@ class StateManager {
       console.log("disconnect event");
       this.setConnected(false);
       this.memory = this.initialMemoryState;
+      this.memoryState = null;
       // clear state of all components
       this.refs.forEach((ref) => {
         if (!(ref instanceof TimelineDetails)) {
@@ -257,6 +262,7 @@ class StateManager {
     socket.on("setChatResponse", this.setChatResponse);
     socket.on("setLastChatActionDict", this.setLastChatActionDict);
     socket.on("memoryState", this.processMemoryState);
+    socket.on("memoryStateDelta", this.processMemoryDelta);
     socket.on("updateState", this.updateStateManagerMemory);
     socket.on("updateAgentType", this.updateAgentType);
 
@@ -883,11 +889,41 @@ class StateManager {
   }
 
   processMemoryState(msg) {
+    // a snapshot of the agent's memory tables
+    this.memoryState = msg;
     this.refs.forEach((ref) => {
       if (ref instanceof MemoryList) {
         ref.setState({ isLoaded: true, memory: msg });
       }
     });
+    // the agent sends nothing more until we ack
+    this.socket.emit("memoryStateAck", msg.version);
+  }
+
+  processMemoryDelta(msg) {
+    /**
+     * The rows of the memories in msg.memids changed after msg.from_version:
+     * drop their old rows and add the ones in msg.  If we don't have the
+     * state at msg.from_version, ask for a snapshot.
+     */
+    if (!this.memoryState || this.memoryState.version !== msg.from_version) {
+      this.socket.emit("memoryStateAck", null);
+      return;
+    }
+    const changed = new Set(msg.memids);
+    const tables = [
+      "memories",
+      "triples",
+      "reference_objects",
+      "named_abstractions",
+    ];
+    let memoryState = { version: msg.version };
+    tables.forEach((table) => {
+      memoryState[table] = this.memoryState[table]
+        .filter((row) => !changed.has(row[0]))
+        .concat(msg[table]);
+    });
+    this.processMemoryState(memoryState);
   }
 
   processRGB(res) {
@@ -268,8 +268,8 @@ class Build(Task):
     """Perform a Build task.
 
     Agent will first clean up all blocks that needed to be removed, then start
-    to build blocks. Both destroying and building operations are stepped one block
-    at a time.
+    to build blocks. Each step destroys or builds up to BLOCKS_PER_STEP blocks that
+    are in reach.
 
     The farthest block agent can destroy/build a three blocks away (by default).
     If a block is out of reach, a child move task will be added to task stack first.
@@ -296,6 +296,7 @@ class Build(Task):
         self.old_blocks_list = None
         self.old_origin = None
         self.PLACE_REACH = task_data.get("PLACE_REACH", 3)
+        self.BLOCKS_PER_STEP = task_data.get("BLOCKS_PER_STEP", 8)
 
         # negative schematic related
         self.is_destroy_schm = task_data.get("is_destroy_schm", False)
@@ -334,9 +335,9 @@ class Build(Task):
             self.origin[1] = h[0, 0]
 
         # get blocks occupying build area and save state for undo()
-        ox, oy, oz = self.origin
-        sy, sz, sx, _ = self.schematic.shape
-        current = agent.get_blocks(ox, ox + sx - 1, oy, oy + sy - 1, oz, oz + sz - 1)
+        self.current_blocks = None
+        self.block_changes_position = None
+        current = self.get_current_blocks(agent)
         self.old_blocks_list = npy_to_blocks_list(current, self.origin)
         if len(self.old_blocks_list) > 0:
             self.old_origin = np.min(strip_idmeta(self.old_blocks_list), axis=0)
@@ -351,30 +352,14 @@ class Build(Task):
             return
         self.interrupted = False
         # get blocks occupying build area
-        ox, oy, oz = self.origin
-        sy, sz, sx, _ = self.schematic.shape
-        current = agent.get_blocks(ox, ox + sx - 1, oy, oy + sy - 1, oz, oz + sz - 1)
+        current = self.get_current_blocks(agent)
 
         # are we done?
-        # TODO: diff ignores block meta right now because placing stairs and
-        # chests in the appropriate orientation is non-trivial
-        diff = (
-            (current[:, :, :, 0] != self.schematic[:, :, :, 0])
-            & (self.attempts > 0)
-            & np.isin(current[:, :, :, 0], BUILD_IGNORE_BLOCKS, invert=True)
-        )
-
-        # ignore negative blocks if there is already air there
-        diff &= (self.schematic[:, :, :, 0] + current[:, :, :, 0]) >= 0
-
-        if self.embed:
-            diff &= self.schematic[:, :, :, 0] != 0  # don't delete blocks if self.embed
-
-        for pair in BUILD_INTERCHANGEABLE_PAIRS:
-            diff &= np.isin(current[:, :, :, 0], pair, invert=True) | np.isin(
-                self.schematic[:, :, :, 0], pair, invert=True
-            )
-
+        diff = self.get_diff(current)
+        if not np.any(diff):
+            # the kept blocks could have missed a change, look again before finishing
+            current = self.get_current_blocks(agent, refresh=True)
+            diff = self.get_diff(current)
         if not np.any(diff):
             self.finish(agent)
             return
@@ -400,28 +385,108 @@ class Build(Task):
             self.finish(agent)
             return
 
-        # get next block to place
-        yzx = self.get_next_place_target(agent, current, diff)
-        idm = self.schematic[tuple(yzx)]
-        current_idm = current[tuple(yzx)]
-
-        # try placing block
-        target = yzx[[2, 0, 1]] + self.origin
-        logging.debug("trying to place {} @ {}".format(idm, target))
+        # get next blocks to place
+        targets = self.get_place_targets(agent, diff)
+        target = targets[0][[2, 0, 1]] + self.origin
         if tuple(target) in (tuple(agent.pos), tuple(agent.pos + [0, 1, 0])):
             # can't place block where you're standing, so step out of the way
             self.step_any_dir(agent)
             return
-        if manhat_dist(agent.pos, target) <= self.PLACE_REACH:
-            self.try_place_block(target, yzx, current_idm, idm, agent)
-            return
-        else:
+        if manhat_dist(agent.pos, target) > self.PLACE_REACH:
             # too far to place; move first
             task = Move(agent, {"target": target, "approx": self.PLACE_REACH})
             self.add_child_task(task)
+            return
+
+        # try placing blocks in order while they are in reach, so the lower ones go first
+        for i, yzx in enumerate(targets[: self.BLOCKS_PER_STEP]):
+            target = yzx[[2, 0, 1]] + self.origin
+            if tuple(target) in (tuple(agent.pos), tuple(agent.pos + [0, 1, 0])):
+                break
+            if manhat_dist(agent.pos, target) > self.PLACE_REACH:
+                break
+            idm = self.schematic[tuple(yzx)]
+            if i > 0:
+                # the blocks placed before may have changed this one (e.g. falling sand)
+                x, y, z = target.tolist()
+                B = agent.get_blocks(x, x, y, y, z, z)
+                self.update_current_blocks([((x, y, z), B[0, 0, 0])])
+            current_idm = current[tuple(yzx)]
+            if current_idm[0] == idm[0]:
+                continue
+            logging.debug("trying to place {} @ {}".format(idm, target))
+            self.try_place_block(target, yzx, current_idm, idm, agent)
+
+    def get_current_blocks(self, agent, refresh=False):
+        """Return the yzxb-ordered blocks occupying the build area.
+
+        They are fetched once, and then kept up to date from the blocks perception
+        saw change (see MCAgentMemory.get_block_changes) and the ones this task changed.
+
+        Args:
+        - refresh: fetch them again
+        """
+        changes = None
+        if hasattr(agent.memory, "get_block_changes"):
+            self.block_changes_position, changes = agent.memory.get_block_changes(
+                self.block_changes_position
+            )
+        if self.current_blocks is None or changes is None or refresh:
+            ox, oy, oz = self.origin
+            sy, sz, sx, _ = self.schematic.shape
+            self.current_blocks = agent.get_blocks(
+                ox, ox + sx - 1, oy, oy + sy - 1, oz, oz + sz - 1
+            )
+        else:
+            self.update_current_blocks(changes)
+        return self.current_blocks
+
+    def update_current_blocks(self, blocks):
+        """Apply the changed blocks, a list of (xyz, idm), to the kept build area"""
+        for xyz, idm in blocks:
+            x, y, z = np.subtract(xyz, self.origin)
+            if all(0 <= c < n for c, n in zip((y, z, x), self.current_blocks.shape)):
+                self.current_blocks[y, z, x, :] = idm
+
+    def get_diff(self, current):
+        """Return a yzx-ordered boolean mask of the blocks that need addressing
+
+        Args:
+        - current: yzxb-ordered current state of the region
+        """
+        # TODO: diff ignores block meta right now because placing stairs and
+        # chests in the appropriate orientation is non-trivial
+        diff = (
+            (current[:, :, :, 0] != self.schematic[:, :, :, 0])
+            & (self.attempts > 0)
+            & np.isin(current[:, :, :, 0], BUILD_IGNORE_BLOCKS, invert=True)
+        )
+
+        # ignore negative blocks if there is already air there
+        diff &= (self.schematic[:, :, :, 0] + current[:, :, :, 0]) >= 0
+
+        if self.embed:
+            diff &= self.schematic[:, :, :, 0] != 0  # don't delete blocks if self.embed
+
+        for pair in BUILD_INTERCHANGEABLE_PAIRS:
+            diff &= np.isin(current[:, :, :, 0], pair, invert=True) | np.isin(
+                self.schematic[:, :, :, 0], pair, invert=True
+            )
+        return diff
 
     def remove_blocks(self, xyzs, agent):
         logging.debug("Excavating {} blocks first".format(len(xyzs)))
+        # dig the blocks in reach from the top down, so nothing is left hanging
+        in_reach = [xyz for xyz in xyzs if manhat_dist(agent.pos, xyz) <= self.DIG_REACH]
+        in_reach.sort(key=lambda xyz: (-xyz[1], manhat_dist(agent.pos, xyz)))
+        if in_reach:
+            dug = [xyz for xyz in in_reach[: self.BLOCKS_PER_STEP] if agent.dig(*xyz)]
+            for target in dug:
+                self.perceive_removed_blocks(target, agent)
+            # the blocks left where the dug ones were, e.g. if something flowed in
+            self.refresh_current_blocks(agent, dug)
+            return
+
         target = self.get_next_destroy_target(agent, xyzs)
         if target is None:
             logging.debug("No path from {} to {}".format(agent.pos, xyzs))
@@ -429,15 +494,18 @@ class Build(Task):
             self.finished = True
             return
 
-        if manhat_dist(agent.pos, target) <= self.DIG_REACH:
-            success = agent.dig(*target)
-            if success:
-                self.perceive_removed_blocks(target, agent)
-        else:
-            mv = Move(agent, {"target": target, "approx": self.DIG_REACH})
-            self.add_child_task(mv)
+        mv = Move(agent, {"target": target, "approx": self.DIG_REACH})
+        self.add_child_task(mv)
 
-        return
+    def refresh_current_blocks(self, agent, xyzs):
+        """fetch the blocks in the box around xyzs into the kept build area"""
+        if not xyzs:
+            return
+        (mx, my, mz), (Mx, My, Mz) = np.min(xyzs, axis=0), np.max(xyzs, axis=0)
+        B = agent.get_blocks(mx, Mx, my, My, mz, Mz)
+        self.update_current_blocks(
+            [((x + mx, y + my, z + mz), B[y, z, x]) for (y, z, x) in np.ndindex(B.shape[:3])]
+        )
 
     # FIXME, this should go in agent...
     # is being done here just so its easy to know agent placed block
@@ -458,8 +526,8 @@ class Build(Task):
                 interesting, player_placed, agent_placed, target, (0, 0)
             )
             self.add_tags(agent, (target, (0, 0)))
-        # this is just clearing the changed blocks
-        agent.get_changed_blocks()
+        # this is just clearing the changed blocks (perception won't see them)
+        self.update_current_blocks(agent.get_changed_blocks())
 
     def try_place_block(self, target, yzx, current_idm, idm, agent):
         assert current_idm[0] != idm[0], "current={} idm={}".format(current_idm, idm)
@@ -469,6 +537,7 @@ class Build(Task):
         x, y, z = target.tolist()
         if agent.place_block(x, y, z):
             B = agent.get_blocks(x, x, y, y, z, z)
+            self.update_current_blocks([((x, y, z), B[0, 0, 0])])
             if B[0, 0, 0, 0] == idm[0]:
                 self.new_blocks.append((target, tuple(idm)))
                 self.perceive_placed_block((x, y, z), idm, agent)
@@ -516,6 +585,7 @@ class Build(Task):
             interesting, player_placed, agent_placed, target, tuple(idm)
         )
         changed_blocks = agent.get_changed_blocks()
+        self.update_current_blocks(changed_blocks)
         self.add_tags(agent, (target, tuple(idm)))
 
     def add_tags(self, agent, block):
@@ -564,8 +634,8 @@ class Build(Task):
             agent.send_chat("I finished digging this.")
         self.finished = True
 
-    def get_next_place_target(self, agent, current, diff):
-        """Return the next block that will be targeted for placing
+    def get_place_targets(self, agent, diff):
+        """Return the blocks to place, in the order they will be targeted
 
         In order:
         1. don't build over your own body
@@ -574,19 +644,20 @@ class Build(Task):
         4. build closer blocks first
 
         Args:
-        - current: yzxb-ordered current state of the region
         - diff: a yzx-ordered boolean mask of blocks that need addressing
+
+        Returns: an array of yzx positions relative to the origin
         """
         relpos_yzx = (agent.pos - self.origin)[[1, 2, 0]]
 
-        diff_yzx = list(np.argwhere(diff))
-        diff_yzx.sort(key=lambda yzx: manhat_dist(yzx, relpos_yzx))  # 4
-        diff_yzx.sort(key=lambda yzx: -self.attempts[tuple(yzx)])  # 3
-        diff_yzx.sort(key=lambda yzx: yzx[0])  # 2
-        diff_yzx.sort(
-            key=lambda yzx: tuple(yzx) in (tuple(relpos_yzx), tuple(relpos_yzx + [1, 0, 0]))
-        )  # 1
-        return diff_yzx[0]
+        diff_yzx = np.argwhere(diff)
+        dist = np.abs(diff_yzx - relpos_yzx).sum(axis=1)  # 4
+        attempts = self.attempts[tuple(diff_yzx.T)].astype("int32")  # 3
+        on_body = (diff_yzx == relpos_yzx).all(axis=1) | (
+            diff_yzx == relpos_yzx + [1, 0, 0]
+        ).all(axis=1)  # 1
+        order = np.lexsort((dist, -attempts, diff_yzx[:, 0], on_body))
+        return diff_yzx[order]
 
     def get_next_destroy_target(self, agent, xyzs):
         p = agent.pos
@@ -725,6 +796,7 @@ class Destroy(Task):
         self.dig_message = True if "dig_message" in task_data else False
         self.submitted_build_task = False
         self.DIG_REACH = task_data.get("DIG_REACH", 3)
+        self.BLOCKS_PER_STEP = task_data.get("BLOCKS_PER_STEP", 8)
         self.last_stepped_time = agent.memory.get_time()
         TaskNode(agent.memory, self.memid).update_task(task=self)
 
@@ -765,6 +837,7 @@ class Destroy(Task):
                     "dig_message": self.dig_message,
                     "is_destroy_schm": not self.dig_message,
                     "DIG_REACH": self.DIG_REACH,
+                    "BLOCKS_PER_STEP": self.BLOCKS_PER_STEP,
                 },
             )
             self.add_child_task(build_task)
@@ -11,6 +11,7 @@ from droidlet.interpreter import InterpreterBase
 from droidlet.interpreter.robot import dance
 from droidlet.memory.memory_nodes import PlayerNode
 from agents.droidlet_agent import DroidletAgent
+from agents.scheduler import TaskScheduler
 from droidlet.perception.semantic_parsing.nsp_querier import NSPQuerier
 from droidlet.dialog.dialogue_manager import DialogueManager
 from droidlet.memory.robot.loco_memory import LocoAgentMemory
@@ -407,6 +408,8 @@ class FakeAgent(DroidletAgent):
             opts.log_timeline = False
             opts.enable_timeline = False
         super(FakeAgent, self).__init__(opts)
+        # no tick budget, every runnable task is stepped each tick
+        self.scheduler = TaskScheduler(tick_budget=None)
         self.no_default_behavior = True
         self.last_task_memid = None
         pos = (0.0, 0.0)
@@ -1,8 +1,9 @@
 import os
 import math
+import time
 import numpy as np
 import Pyro4
-from slam_pkg.utils.fmm_planner import FMMPlanner
+from slam_pkg.utils.fmm_planner import CachedFMMPlanner
 from rich import print
 
 Pyro4.config.SERIALIZER = "pickle"
@@ -19,11 +20,48 @@ class Planner(object):
     def __init__(self, slam):
         self.slam = slam
         self.map_resolution = self.slam.get_map_resolution()
+        # distance fields are kept across calls, keyed by goal, see CachedFMMPlanner
+        self.planner = CachedFMMPlanner()
+        self.map_version = None
+        self.traversable_map = None
+        self.metrics = {
+            "calls": 0,
+            "map_fetches": 0,
+            "total_latency": 0.0,
+            "last_latency": 0.0,
+        }
+
+    def get_traversable_map(self):
+        """fetch the traversable map from slam, if it has changed since the last call"""
+        map_version = self.slam.get_map_version()
+        if map_version != self.map_version:
+            self.traversable_map = self.slam.get_traversable_map()
+            self.planner.update_map(self.traversable_map)
+            self.map_version = map_version
+            self.metrics["map_fetches"] += 1
+        return self.traversable_map
+
+    def get_planning_metrics(self):
+        """returns counts and latencies (in seconds) of get_short_term_goal calls"""
+        metrics = dict(self.metrics)
+        metrics["fmm_computations"] = self.planner.fmm_computations
+        metrics["mean_latency"] = metrics["total_latency"] / max(metrics["calls"], 1)
+        return metrics
 
     def get_short_term_goal(self, robot_location, goal, step_size=25):
         """
         robot_location is simply get_base_state
         """
+        start = time.time()
+        try:
+            return self._get_short_term_goal(robot_location, goal, step_size)
+        finally:
+            latency = time.time() - start
+            self.metrics["calls"] += 1
+            self.metrics["total_latency"] += latency
+            self.metrics["last_latency"] = latency
+
+    def _get_short_term_goal(self, robot_location, goal, step_size):
 
         # convert real co-ordinates to map co-ordinates
         goal_map_location = self.slam.real2map(goal[:2])
@@ -33,18 +71,16 @@ class Planner(object):
         robot_map_location = self.slam.robot2map(robot_location)
 
         # get occupancy map
-        traversable_map = self.slam.get_traversable_map()
+        traversable_map = self.get_traversable_map()
 
         # if the goal is an obstacle, you can't go there. Return
         if not is_traversable(goal_map_location, traversable_map):
             return False
 
-        # construct a planner
-        self.planner = FMMPlanner(traversable_map, step_size=int(step_size / self.map_resolution))
-
-        # set the goal and location in planner, get short-term-goal
-        self.planner.set_goal(goal_map_location)
-        stg = self.planner.get_short_term_goal(robot_map_location)
+        # get short-term-goal, reusing the distance field to the goal if it is still valid
+        stg = self.planner.get_short_term_goal(
+            goal_map_location, robot_map_location, step_size=int(step_size / self.map_resolution)
+        )
 
         # if the goal is an obstacle, you can't go there. Return
         if not is_traversable(stg, traversable_map):
@@ -1,6 +1,8 @@
+from collections import OrderedDict
 import numpy as np
 import skfmm
 from numpy import ma
+from scipy.ndimage import binary_dilation
 
 
 class FMMPlanner(object):
@@ -35,15 +37,14 @@ class FMMPlanner(object):
 
         # print(f'fmm_dist.shape {self.fmm_dist.shape}')
 
-    def get_short_term_goal(self, state):
+    def get_window(self, state):
         """
-        Given the current state of robot, function outputs where should robot move based on map and step size
-        :param state: state of robot in map space [x_robot_map_co-ordinate, y_robot_map_co-ordinate]
+        Returns the distances in the (2 * step_size + 1) square around the rounded state,
+        padded with large values beyond the edges of the map
+        :param state: rounded state of robot in map space [x, y]
         :type state: list
-        :return: short term goal in map space where robot should move [x_map_co-ordinate, y_map_co-ordinate]
-        :rtype: list
+        :rtype: np.ndarray
         """
-        state = [round(x) for x in state]
         # print(f'get stg for state {state[1], state[0]}')
         # pad the map with
         # to handle corners pad the dist with step size and values equal to max
@@ -51,11 +52,22 @@ class FMMPlanner(object):
             self.fmm_dist, self.step_size, "constant", constant_values=self.fmm_dist.shape[0] ** 2
         )
         # take subset of distance around the start
-        subset = dist[
+        return dist[
             state[1] + self.step_size - self.step_size : state[1] + 2 * self.step_size + 1,
             state[0] + self.step_size - self.step_size : state[0] + 2 * self.step_size + 1,
         ]
 
+    def get_short_term_goal(self, state):
+        """
+        Given the current state of robot, function outputs where should robot move based on map and step size
+        :param state: state of robot in map space [x_robot_map_co-ordinate, y_robot_map_co-ordinate]
+        :type state: list
+        :return: short term goal in map space where robot should move [x_map_co-ordinate, y_map_co-ordinate]
+        :rtype: list
+        """
+        state = [round(x) for x in state]
+        subset = self.get_window(state)
+
         # print(f'subset.shape {subset.shape}')
 
         # find the index which has minimum distance
@@ -68,3 +80,78 @@ class FMMPlanner(object):
         sy = stg_y - self.step_size + state[1]
         # print(f'self.fmm_dist {self.fmm_dist[sy][sx], self.fmm_dist[state[1]][state[0]]}')
         return sx, sy
+
+
+class CachedFMMPlanner(object):
+    def __init__(self, step_size=5, max_goals=8):
+        """
+        Keeps the FMM distance fields of the last max_goals goals, and reuses them across
+        map updates for as long as the short-term goal they give can't have changed.
+
+        The fast marching front reaches cells in increasing order of distance, so when
+        the map changes, cells whose old distance is below that of every changed cell
+        (and their neighbours) keep their distance; every other cell stays above that
+        bound.  Each cached field records the bound as valid_below, and is reused as long
+        as the minimum of the window around the robot is below it.
+
+        :param step_size: as in FMMPlanner
+        :param max_goals: number of goals to keep distance fields for
+        :type step_size: int
+        :type max_goals: int
+        """
+        self.step_size = step_size
+        self.max_goals = max_goals
+        self.traversable = None
+        self.planners = OrderedDict()
+        self.fmm_computations = 0
+
+    def update_map(self, traversable):
+        """
+        :param traversable: 2D np.ndarray boolean map, as in FMMPlanner
+        :type traversable: np.ndarray
+        """
+        traversable = np.asarray(traversable)
+        if self.traversable is None or self.traversable.shape != traversable.shape:
+            self.planners.clear()
+        else:
+            changed = self.traversable != traversable
+            if not changed.any():
+                return
+            # the FMM update of a cell only uses its direct neighbours
+            changed = binary_dilation(changed, np.ones((3, 3), dtype=bool))
+            for planner in self.planners.values():
+                # slack for the step between a changed cell and its neighbours
+                planner.valid_below = min(planner.valid_below, planner.fmm_dist[changed].min() - 2)
+        self.traversable = traversable
+
+    def get_planner(self, goal, state, step_size=None):
+        """
+        Returns an FMMPlanner for goal whose short-term goal from state is the same as
+        that of a planner built on the current map.  step_size defaults to self.step_size.
+        """
+        step_size = self.step_size if step_size is None else step_size
+        key = (round(goal[0]), round(goal[1]))
+        state = [round(x) for x in state]
+        planner = self.planners.get(key)
+        if planner is not None:
+            # the distance field doesn't depend on the step size
+            planner.step_size = step_size
+        if planner is None or planner.get_window(state).min() >= planner.valid_below:
+            planner = FMMPlanner(self.traversable, step_size=step_size)
+            planner.set_goal(goal)
+            planner.valid_below = np.inf
+            self.fmm_computations += 1
+        self.planners[key] = planner
+        self.planners.move_to_end(key)
+        while len(self.planners) > self.max_goals:
+            self.planners.popitem(last=False)
+        return planner
+
+    def get_short_term_goal(self, goal, state, step_size=None):
+        """
+        :param goal: goal point in map space [x_goal_co-ordinate, y_goal_co-ordinate]
+        :param state: state of robot in map space [x_robot_map_co-ordinate, y_robot_map_co-ordinate]
+        :param step_size: defaults to self.step_size
+        :return: short term goal in map space, as FMMPlanner.get_short_term_goal
+        """
+        return self.get_planner(goal, state, step_size).get_short_term_goal(state)
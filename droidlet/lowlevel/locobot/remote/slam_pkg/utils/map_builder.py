@@ -3,38 +3,77 @@ import sys
 import os
 
 sys.path.append(os.path.join(os.path.dirname(__file__), "../../"))
-from slam_pkg.utils.depth_util import transform_pose, bin_points
+from slam_pkg.utils.depth_util import transform_pose
 from slam_pkg.utils import depth_util as du
 
 
 class MapBuilder(object):
-    def __init__(self, map_size_cm=4000, resolution=5, obs_thr=1, agent_min_z=5, agent_max_z=70):
+    def __init__(
+        self,
+        map_size_cm=4000,
+        resolution=5,
+        obs_thr=1,
+        agent_min_z=5,
+        agent_max_z=70,
+        tile_size=64,
+    ):
         """
         :param map_size_cm: size of map in cm, assumes square map
         :param resolution: resolution of map, 1 pix = resolution distance(in cm) in real world
         :param obs_thr: number of depth points to be in bin to considered it as obstacle
         :param agent_min_z: robot min z (in cm), depth points below this will be considered as free space
         :param agent_max_z: robot max z (in cm), depth points above this will be considered as free space
+        :param tile_size: side (in pixels) of the square tiles the map is stored in
 
         :type map_size_cm: int
         :type resolution: int
         :type obs_thr: int
         :type agent_min_z: int
         :type agent_max_z: int
+        :type tile_size: int
+
+        The map is stored sparsely, as a dict of tiles keyed by (tile_row, tile_col), and
+        only the tiles hit by a point cloud are allocated and updated.  map_size_cm fixes
+        the map frame (its centre is the real world origin) and the extent of the dense
+        .map, but points outside it are kept too, in tiles with negative or large keys.
+        Every tile records the version of the map it was last changed in, see
+        get_changed_tiles().
         """
         self.map_size_cm = map_size_cm
         self.resolution = resolution
         self.obs_threshold = obs_thr
         self.z_bins = [agent_min_z, agent_max_z]
+        self.tile_size = tile_size
+        self.tiles = {}
+        self.tile_versions = {}
+        self.version = 0
 
-        self.map = np.zeros(
-            (
-                int(self.map_size_cm // self.resolution),
-                int(self.map_size_cm // self.resolution),
-                len(self.z_bins) + 1,
-            ),
-            dtype=np.float32,
-        )
+    @property
+    def map_shape(self):
+        """shape of the dense map, (map_size, map_size, len(z_bins) + 1)"""
+        map_size = int(self.map_size_cm // self.resolution)
+        return (map_size, map_size, len(self.z_bins) + 1)
+
+    @property
+    def map(self):
+        """
+        dense map over the map_size_cm square, as get_map()
+        """
+        return self.get_region(0, self.map_shape[0], 0, self.map_shape[1])
+
+    def _touch(self, keys):
+        self.version += 1
+        for key in keys:
+            self.tile_versions[key] = self.version
+
+    def _get_tile(self, key):
+        tile = self.tiles.get(key)
+        if tile is None:
+            tile = np.zeros(
+                (self.tile_size, self.tile_size, len(self.z_bins) + 1), dtype=np.float32
+            )
+            self.tiles[key] = tile
+        return tile
 
     def update_map(self, pcd, pose=None):
         """
@@ -42,8 +81,8 @@ class MapBuilder(object):
         :param pcd: point cloud in global frame, in meter
 
         :type pcd: np.ndarray [num_points, 3]
-        :return: map of the environment, values [1-> obstacle, 0->free, unknown space]
-        :rtype: np.ndarray
+        :return: keys of the tiles that were changed
+        :rtype: list
         """
 
         # convert point from m to cm
@@ -53,20 +92,42 @@ class MapBuilder(object):
         geocentric_pc_for_map = transform_pose(
             pcd, (self.map_size_cm / 2.0, self.map_size_cm / 2.0, np.pi / 2.0)
         )
-        geocentric_flat = bin_points(
-            geocentric_pc_for_map, self.map.shape[0], self.z_bins, self.resolution
-        )
-
-        self.map = self.map + geocentric_flat
-
-        map_gt = self.map[:, :, 1] / self.obs_threshold
-        map_gt[map_gt >= 0.5] = 1.0
-        map_gt[map_gt < 0.5] = 0.0
+        # bin the points as bin_points does, without dropping the ones off the map
+        XYZ_cm = geocentric_pc_for_map[np.logical_not(np.isnan(geocentric_pc_for_map[:, 0]))]
+        if len(XYZ_cm) == 0:
+            return []
+        n_z_bins = len(self.z_bins) + 1
+        X_bin = np.round(XYZ_cm[:, 0] / self.resolution).astype(np.int64)
+        Y_bin = np.round(XYZ_cm[:, 1] / self.resolution).astype(np.int64)
+        Z_bin = np.digitize(XYZ_cm[:, 2], bins=self.z_bins).astype(np.int64)
 
-        return map_gt
+        T = self.tile_size
+        tile_rows, tile_cols = Y_bin // T, X_bin // T
+        ind = ((Y_bin % T) * T + X_bin % T) * n_z_bins + Z_bin
+        # pack the tile keys into one integer to group the points by tile
+        row_min, col_min = tile_rows.min(), tile_cols.min()
+        width = tile_cols.max() - col_min + 1
+        packed_keys, inverse = np.unique(
+            (tile_rows - row_min) * width + tile_cols - col_min, return_inverse=True
+        )
+        tile_size = T * T * n_z_bins
+        counts = np.bincount(
+            inverse.reshape(-1) * tile_size + ind, minlength=len(packed_keys) * tile_size
+        ).reshape(len(packed_keys), T, T, n_z_bins)
+        changed = []
+        for packed_key, tile_counts in zip(packed_keys, counts):
+            key = (int(packed_key // width + row_min), int(packed_key % width + col_min))
+            self._get_tile(key)[:] += tile_counts
+            changed.append(key)
+        self._touch(changed)
+        return changed
 
     def add_obstacle(self, location):
-        self.map[round(location[1]), round(location[0]), 1] = 1
+        i, j = round(location[1]), round(location[0])
+        T = self.tile_size
+        key = (i // T, j // T)
+        self._get_tile(key)[i % T, j % T, 1] = 1
+        self._touch([key])
 
     def reset_map(self, map_size, z_bins=None, obs_thr=None):
         """
@@ -80,14 +141,62 @@ class MapBuilder(object):
         if obs_thr is not None:
             self.obs_threshold = obs_thr
 
-        self.map = np.zeros(
-            (
-                self.map_size_cm // self.resolution,
-                self.map_size_cm // self.resolution,
-                len(self.z_bins) + 1,
-            ),
-            dtype=np.float32,
+        # the cleared tiles are reported as changed
+        cleared = list(self.tiles.keys())
+        self.tiles = {}
+        self._touch(cleared)
+
+    def get_changed_tiles(self, since_version):
+        """
+        returns the keys of the tiles changed after the given version of the map;
+        pass the .version of the last sync to get the tiles changed since then
+        :rtype: list
+        """
+        return [k for k, v in self.tile_versions.items() if v > since_version]
+
+    def get_tile_bounds(self, key):
+        """
+        returns the (row_start, row_end, col_start, col_end) map indices covered by tile key
+        """
+        T = self.tile_size
+        return (key[0] * T, (key[0] + 1) * T, key[1] * T, (key[1] + 1) * T)
+
+    def get_region(self, row_start, row_end, col_start, col_end):
+        """
+        returns the dense map over rows [row_start, row_end) and columns [col_start, col_end),
+        which can extend beyond the map_size_cm square; unknown space is 0
+        :rtype: np.ndarray dim:[row_end - row_start, col_end - col_start, 3]
+        """
+        T = self.tile_size
+        region = np.zeros(
+            (row_end - row_start, col_end - col_start, len(self.z_bins) + 1), dtype=np.float32
         )
+        for ti in range(row_start // T, (row_end - 1) // T + 1):
+            for tj in range(col_start // T, (col_end - 1) // T + 1):
+                tile = self.tiles.get((ti, tj))
+                if tile is None:
+                    continue
+                i0, i1 = max(row_start, ti * T), min(row_end, (ti + 1) * T)
+                j0, j1 = max(col_start, tj * T), min(col_end, (tj + 1) * T)
+                region[i0 - row_start : i1 - row_start, j0 - col_start : j1 - col_start] = tile[
+                    i0 - ti * T : i1 - ti * T, j0 - tj * T : j1 - tj * T
+                ]
+        return region
+
+    def get_obstacle_indices(self, threshold=1.0):
+        """
+        returns the (rows, cols) map indices of all cells, on or off the map_size_cm
+        square, with at least threshold points between agent_min_z and agent_max_z
+        """
+        rows, cols = [], []
+        T = self.tile_size
+        for (ti, tj), tile in self.tiles.items():
+            i, j = np.nonzero(tile[:, :, 1] >= threshold)
+            rows.append(i + ti * T)
+            cols.append(j + tj * T)
+        if not rows:
+            return np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.int64)
+        return np.concatenate(rows), np.concatenate(cols)
 
     def get_map(self):
         """
@@ -134,8 +243,8 @@ class MapBuilder(object):
         real_loc = du.transform_pose(
             loc,
             (
-                -self.map.shape[0] / 2.0,
-                self.map.shape[1] / 2.0,
+                -self.map_shape[0] / 2.0,
+                self.map_shape[1] / 2.0,
                 -np.pi / 2.0,
             ),
         )
@@ -143,3 +252,26 @@ class MapBuilder(object):
         real_loc /= 100  # to convert from cm to meter
         real_loc = real_loc.reshape(3)
         return real_loc[:2]
+
+    def map2real_array(self, locs):
+        """
+        convert an array of map locations to real world locations, as map2real
+        :param locs: map locations [[x_pixel_location, y_pixel_location], ...]
+
+        :type locs: np.ndarray [num_locations, 2]
+
+        :rtype: np.ndarray [num_locations, 2]
+        """
+        locs = np.asarray(locs, dtype=np.float64).reshape(-1, 2)
+        locs = np.concatenate([locs, np.zeros((len(locs), 1))], axis=1)
+        real_locs = du.transform_pose(
+            locs,
+            (
+                -self.map_shape[0] / 2.0,
+                self.map_shape[1] / 2.0,
+                -np.pi / 2.0,
+            ),
+        )
+        real_locs *= self.resolution
+        real_locs /= 100
+        return real_locs[:, :2]
@@ -48,6 +48,12 @@ class SLAM(object):
         # in any meaningful way
         self.init_state = (0.0, 0.0, 0.0)
         self.prev_bot_state = (0.0, 0.0, 0.0)
+        # incremented every time the traversable map changes, so clients
+        # can tell whether they need to fetch it again
+        self.map_version = 0
+        self.traversable = None
+        # version of the map_builder map the traversable map was last synced with
+        self.map_builder_version = 0
 
         self.update_map()
         assert self.traversable is not None
@@ -93,26 +99,62 @@ class SLAM(object):
     def update_map(self):
         pcd = self.robot.get_current_pcd()[0]
         self.map_builder.update_map(pcd)
+        self.update_traversable()
+
+    def update_traversable(self):
+        """
+        recompute the traversable map around the map tiles that changed since the last call
+        """
+        changed = self.map_builder.get_changed_tiles(self.map_builder_version)
+        self.map_builder_version = self.map_builder.version
+        n_rows, n_cols = self.map_builder.map_shape[:2]
+        if self.traversable is None or self.traversable.shape != (n_rows, n_cols):
+            self.traversable = np.ones((n_rows, n_cols), dtype=bool)
+            self.map_version += 1
+        if not changed:
+            return
 
         # explore the map by robot shape
-        obstacle = self.map_builder.map[:, :, 1] >= 1.0
         selem = disk(self.robot_rad / self.map_builder.resolution)
-        traversable = binary_dilation(obstacle, selem) != True
-        self.traversable = traversable
+        r = selem.shape[0] // 2
+        bounds = np.array([self.map_builder.get_tile_bounds(k) for k in changed])
+        # the dilation spreads obstacles by r, so cells within r of a changed tile can change
+        i0, i1 = max(bounds[:, 0].min() - r, 0), min(bounds[:, 1].max() + r, n_rows)
+        j0, j1 = max(bounds[:, 2].min() - r, 0), min(bounds[:, 3].max() + r, n_cols)
+        if i0 >= i1 or j0 >= j1:
+            return
+        obstacle = self.map_builder.get_region(i0 - r, i1 + r, j0 - r, j1 + r)[:, :, 1] >= 1.0
+        traversable = binary_dilation(obstacle, selem)[r : r + i1 - i0, r : r + j1 - j0] != True
+        if not np.array_equal(traversable, self.traversable[i0:i1, j0:j1]):
+            self.traversable[i0:i1, j0:j1] = traversable
+            self.map_version += 1
+
+    def get_map_changes(self, since_version):
+        """
+        returns (version, regions): the current version of the occupancy map, and the
+        (row_start, row_end, col_start, col_end) map regions changed after since_version
+        """
+        return (
+            self.map_builder.version,
+            [
+                self.map_builder.get_tile_bounds(k)
+                for k in self.map_builder.get_changed_tiles(since_version)
+            ],
+        )
+
+    def get_map_version(self):
+        return self.map_version
 
     def get_map_resolution(self):
         return self.map_resolution
 
     def get_map(self):
         """returns the location of obstacles created by slam only for the obstacles,"""
-        # get the index correspnding to obstacles
-        indices = np.where(self.map_builder.map[:, :, 1] >= 1.0)
+        # get the index correspnding to obstacles, including those off the
+        # (map_size x map_size) square the traversable map covers
+        rows, cols = self.map_builder.get_obstacle_indices()
         # convert them into robot frame
-        real_world_locations = [
-            self.map2real([indice[0], indice[1]]).tolist()
-            for indice in zip(indices[0], indices[1])
-        ]
-        return real_world_locations
+        return self.map_builder.map2real_array(np.stack([rows, cols], axis=1)).tolist()
 
     def reset_map(self, z_bins=None, obs_thr=None):
         self.map_builder.reset_map(self.map_size, z_bins=z_bins, obs_thr=obs_thr)
@@ -0,0 +1,68 @@
+"""
+Copyright (c) Facebook, Inc. and its affiliates.
+"""
+import os
+import sys
+import unittest
+import numpy as np
+
+# the remote services run with remote/ on the path, importing the remote package needs pyrobot
+sys.path.append(os.path.join(os.path.dirname(__file__), "../remote"))
+from slam_pkg.utils.fmm_planner import FMMPlanner, CachedFMMPlanner
+
+
+def short_term_goal(traversable, goal, state, step_size=5):
+    """the short-term goal of a planner built on the whole map"""
+    planner = FMMPlanner(traversable, step_size=step_size)
+    planner.set_goal(goal)
+    return planner.get_short_term_goal(state)
+
+
+class CachedFMMPlannerTest(unittest.TestCase):
+    def setUp(self):
+        # a room with a wall between the robot and the goal, open at the top
+        self.traversable = np.ones((60, 60), dtype=bool)
+        self.traversable[10:, 30] = False
+        self.goal = (50, 30)
+        self.state = (10, 30)
+        self.planner = CachedFMMPlanner(step_size=5)
+        self.planner.update_map(self.traversable)
+
+    def test_same_goal_reuses_field(self):
+        stg = self.planner.get_short_term_goal(self.goal, self.state)
+        planner = self.planner.get_planner(self.goal, (12, 28))
+        self.assertEqual(self.planner.fmm_computations, 1)
+        self.assertIs(planner, self.planner.planners[self.goal])
+        self.assertEqual(stg, short_term_goal(self.traversable, self.goal, self.state))
+
+    def test_change_near_path_recomputes(self):
+        self.planner.get_short_term_goal(self.goal, self.state)
+        # close the gap in the wall, on the way to the goal
+        traversable = self.traversable.copy()
+        traversable[:10, 30] = False
+        self.planner.update_map(traversable)
+        self.assertLess(self.planner.planners[self.goal].valid_below, np.inf)
+        stg = self.planner.get_short_term_goal(self.goal, self.state)
+        self.assertEqual(self.planner.fmm_computations, 2)
+        self.assertEqual(stg, short_term_goal(traversable, self.goal, self.state))
+
+    def test_change_far_from_path_keeps_field(self):
+        self.planner.get_short_term_goal(self.goal, self.state)
+        # a new obstacle behind the robot, farther from the goal than its window
+        traversable = self.traversable.copy()
+        traversable[40:45, 2:6] = False
+        self.planner.update_map(traversable)
+        self.assertLess(self.planner.planners[self.goal].valid_below, np.inf)
+        for state in [self.state, (12, 20), (20, 5)]:
+            stg = self.planner.get_short_term_goal(self.goal, state)
+            self.assertEqual(stg, short_term_goal(traversable, self.goal, state))
+        self.assertEqual(self.planner.fmm_computations, 1)
+
+    def test_new_map_shape_clears_fields(self):
+        self.planner.get_short_term_goal(self.goal, self.state)
+        self.planner.update_map(np.ones((80, 80), dtype=bool))
+        self.assertEqual(len(self.planner.planners), 0)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,64 @@
+"""
+Copyright (c) Facebook, Inc. and its affiliates.
+"""
+import os
+import sys
+import unittest
+import numpy as np
+
+# the remote services run with remote/ on the path, importing the remote package needs pyrobot
+sys.path.append(os.path.join(os.path.dirname(__file__), "../remote"))
+from slam_pkg.utils.map_builder import MapBuilder
+from slam_pkg.utils.depth_util import bin_points, transform_pose
+
+
+def dense_counts(mb, pcd):
+    """the counts of the dense map of the map_size_cm square MapBuilder used to keep"""
+    pcd = transform_pose(pcd * 100, (mb.map_size_cm / 2.0, mb.map_size_cm / 2.0, np.pi / 2.0))
+    return bin_points(pcd, mb.map_shape[0], mb.z_bins, mb.resolution)
+
+
+class MapBuilderTest(unittest.TestCase):
+    def setUp(self):
+        self.mb = MapBuilder(map_size_cm=400, resolution=5, tile_size=16)
+        rng = np.random.default_rng(0)
+        self.clouds = [
+            np.concatenate(
+                [rng.uniform(-1.9, 1.9, size=(500, 2)), rng.uniform(0, 1, size=(500, 1))], axis=1
+            )
+            for _ in range(2)
+        ]
+
+    def test_matches_dense_map(self):
+        expected = np.zeros(self.mb.map_shape)
+        for pcd in self.clouds:
+            self.mb.update_map(pcd)
+            expected += dense_counts(self.mb, pcd)
+            np.testing.assert_array_equal(self.mb.get_map(), expected)
+
+    def test_points_off_the_map(self):
+        self.mb.update_map(self.clouds[0])
+        version = self.mb.version
+        # 3m from the origin is off the 4m square, in a tile left of the map
+        changed = self.mb.update_map(np.array([[0.0, 3.0, 0.3]]))
+        self.assertEqual(changed, [(2, -2)])
+        self.assertEqual(self.mb.get_changed_tiles(version), changed)
+        # the dense map over the square doesn't change
+        np.testing.assert_array_equal(self.mb.get_map(), dense_counts(self.mb, self.clouds[0]))
+        # the map grows past its left edge to keep the point, at row 40, column -20
+        region = self.mb.get_region(0, 80, -32, 80)
+        np.testing.assert_array_equal(region[:, 32:], self.mb.get_map())
+        self.assertEqual(list(zip(*np.nonzero(region[:, :32]))), [(40, 12, 1)])
+        rows, cols = self.mb.get_obstacle_indices()
+        self.assertIn((40, -20), set(zip(rows, cols)))
+
+    def test_reset_map(self):
+        changed = self.mb.update_map(self.clouds[0])
+        version = self.mb.version
+        self.mb.reset_map(400)
+        self.assertFalse(self.mb.get_map().any())
+        self.assertEqual(sorted(self.mb.get_changed_tiles(version)), sorted(changed))
+
+
+if __name__ == "__main__":
+    unittest.main()
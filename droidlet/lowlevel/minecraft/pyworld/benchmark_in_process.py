@@ -0,0 +1,120 @@
+"""
+Copyright (c) Facebook, Inc. and its affiliates.
+"""
+# flake8: noqa
+
+import argparse
+import time
+import numpy as np
+from droidlet.lowlevel.minecraft.pyworld.world import World
+from droidlet.lowlevel.minecraft.pyworld.fake_mobs import SimpleMob, make_mob_opts, step_mobs
+from droidlet.lowlevel.minecraft.pyworld_mover import InProcessPyWorldMover, Lockstep
+
+MOB_NAMES = ["cow", "chicken", "rabbit", "pig", "sheep"]
+
+
+class Opt:
+    pass
+
+
+class ScriptedAgent:
+    """
+    does what an agent's step asks of its mover: perceive (its player, the changed
+    blocks, chats, line of sight and the blocks around it), then wander, and now and
+    then place or dig a block
+    """
+
+    def __init__(self, mover, rng):
+        self.mover = mover
+        self.rng = rng
+        self.count = 0
+        self.mover.set_held_item((1, 0))
+        self.moves = [
+            mover.step_pos_x,
+            mover.step_neg_x,
+            mover.step_pos_z,
+            mover.step_neg_z,
+            mover.step_pos_y,
+            mover.step_neg_y,
+        ]
+
+    def step(self):
+        p = self.mover.get_player()
+        self.mover.get_changed_blocks()
+        self.mover.get_incoming_chats()
+        self.mover.get_line_of_sight()
+        x, y, z = p.pos
+        self.mover.get_blocks(x - 5, x + 5, y - 5, y + 5, z - 5, z + 5)
+        self.moves[self.rng.randint(len(self.moves))]()
+        if self.count % 5 == 0:
+            self.mover.set_look(self.rng.uniform(-np.pi, np.pi), self.rng.uniform(-1.0, 0.5))
+            loc = (x + self.rng.randint(-3, 4), y + self.rng.randint(-1, 3), z + 2)
+            if self.rng.rand() < 0.5:
+                self.mover.place_block(*loc)
+            else:
+                self.mover.dig(*loc)
+        self.count += 1
+
+
+def make_world(sl, num_mobs, seed):
+    np.random.seed(seed)
+    opts = Opt()
+    opts.sl = sl
+    mobs = [SimpleMob(make_mob_opts(MOB_NAMES[i % len(MOB_NAMES)])) for i in range(num_mobs)]
+    spec = {"players": [], "mobs": mobs, "item_stacks": [], "agent": {}}
+    return World(opts, spec)
+
+
+def run(num_worlds, agents_per_world, args):
+    worlds = [make_world(args.sl, args.mobs, seed) for seed in range(num_worlds)]
+    rng = np.random.RandomState(0)
+    agents = []
+    for w in worlds:
+        for i in range(agents_per_world):
+            mover = InProcessPyWorldMover(w, name="agent{}".format(i))
+            agents.append(ScriptedAgent(mover, rng))
+    lockstep = Lockstep(agents, worlds)
+    t = time.perf_counter()
+    for _ in range(args.steps):
+        lockstep.step()
+    elapsed = time.perf_counter() - t
+    print(
+        "{} worlds x {} agents: {:.0f} agent-steps/s, {:.2f} ms per lockstep step".format(
+            num_worlds,
+            agents_per_world,
+            len(agents) * args.steps / elapsed,
+            elapsed / args.steps * 1000,
+        )
+    )
+
+
+def run_mobs(num_worlds, mobs_per_world, args):
+    worlds = [make_world(args.sl, mobs_per_world, seed) for seed in range(num_worlds)]
+    mobs = [m for w in worlds for m in w.mobs]
+    times = []
+    for step in [lambda: [m.step() for m in mobs], lambda: step_mobs(mobs)]:
+        t = time.perf_counter()
+        for _ in range(args.steps):
+            step()
+        times.append((time.perf_counter() - t) / args.steps * 1000)
+    print(
+        "{} worlds x {} mobs: SimpleMob.step {:.2f} ms, step_mobs {:.2f} ms".format(
+            num_worlds, mobs_per_world, *times
+        )
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--sl", type=int, default=64, help="side length of the worlds")
+    parser.add_argument("--mobs", type=int, default=4, help="mobs in each world")
+    parser.add_argument("--steps", type=int, default=200)
+    args = parser.parse_args()
+    for num_worlds, agents_per_world in [(1, 1), (1, 8), (16, 1), (16, 4)]:
+        run(num_worlds, agents_per_world, args)
+    for num_worlds, mobs_per_world in [(1, 4), (1, 64), (16, 4), (64, 8)]:
+        run_mobs(num_worlds, mobs_per_world, args)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,99 @@
+"""
+Copyright (c) Facebook, Inc. and its affiliates.
+"""
+# flake8: noqa
+
+import argparse
+import time
+import numpy as np
+from droidlet.lowlevel.minecraft.pyworld.world import World
+from droidlet.shared_data_struct.craftassist_shared_utils import PathPlanner
+from droidlet.lowlevel.minecraft.craftassist_cuberite_utils.block_data import PASSABLE_BLOCKS
+
+
+class Opt:
+    pass
+
+
+def make_world(sl, clutter, seed):
+    """a pyworld World with hills, and stone pillars on a fraction clutter of the columns"""
+    np.random.seed(seed)
+    opts = Opt()
+    opts.sl = sl
+    opts.hill_scale = 8.0
+    spec = {"players": [], "mobs": [], "item_stacks": [], "agent": {"pos": (0, 0, 0)}}
+    world = World(opts, spec)
+    pillars = np.random.rand(sl, sl) < clutter
+    heights = np.random.randint(1, 6, size=(sl, sl))
+    for x, z in zip(*np.nonzero(pillars)):
+        y = standing_height(world, x, z)
+        world.blocks[x, y : y + heights[x, z], z, 0] = 1
+    return world
+
+
+def standing_height(world, x, z):
+    """the lowest y where something standing at (x, y, z) has its feet and head free"""
+    passable = np.isin(world.blocks[x, :, z, 0], PASSABLE_BLOCKS)
+    for y in range(1, world.sl - 1):
+        if passable[y] and passable[y + 1] and not passable[y - 1]:
+            return y
+    return 0
+
+
+def random_pos(world, rng):
+    x, z = rng.randint(0, world.sl, size=2)
+    return (x, standing_height(world, x, z), z)
+
+
+def report(label, latencies):
+    latencies = np.array(latencies) * 1000
+    print(
+        "{}: {} plans, p50 {:.2f} ms, p99 {:.2f} ms, mean {:.2f} ms".format(
+            label,
+            len(latencies),
+            np.percentile(latencies, 50),
+            np.percentile(latencies, 99),
+            latencies.mean(),
+        )
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--sl", type=int, default=64, help="side length of the worlds")
+    parser.add_argument("--worlds", type=int, default=5)
+    parser.add_argument("--moves", type=int, default=20, help="moves planned in each world")
+    parser.add_argument("--clutter", type=float, default=0.2)
+    args = parser.parse_args()
+
+    latencies = {"plan": [], "replan after drift": [], "replan after block change": []}
+    for seed in range(args.worlds):
+        world = make_world(args.sl, args.clutter, seed)
+        rng = np.random.RandomState(seed)
+        planner = PathPlanner()
+        for _ in range(args.moves):
+            start, target = random_pos(world, rng), random_pos(world, rng)
+            t = time.perf_counter()
+            path = planner.plan(world.get_blocks, start, target)
+            latencies["plan"].append(time.perf_counter() - t)
+            if path is None or len(path) < 3:
+                continue
+
+            # the agent is pushed off its path
+            x, y, z = path[len(path) // 2]
+            t = time.perf_counter()
+            planner.plan(world.get_blocks, (x + 1, y, z), target)
+            latencies["replan after drift"].append(time.perf_counter() - t)
+
+            # a block is placed next to the path
+            world.blocks[x, y, z - 1, 0] = 1
+            t = time.perf_counter()
+            planner.plan(world.get_blocks, path[1], target)
+            latencies["replan after block change"].append(time.perf_counter() - t)
+        print("world {}: {} searches for {} plans".format(seed, planner.searches, 3 * args.moves))
+    for label, l in latencies.items():
+        report(label, l)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,283 @@
+"""
+Copyright (c) Facebook, Inc. and its affiliates.
+"""
+import itertools
+import numpy as np
+
+CHUNK_SIZE = 16
+# fewer points than this are read one by one, which beats sorting them by chunk
+SMALL_POINTS = 16
+
+
+class ChunkedBlocks:
+    """
+    a sparse stand-in for the dense (sl, sl, sl, 2) numpy array of blocks of a pyworld
+    World.  the world is cut into chunk_size**3 chunks; chunks of air aren't stored,
+    and chunks filled with a single block (e.g. bedrock under the ground) are stored as
+    that one block.  so the memory used grows with the surface of the things in the
+    world, not with sl**3.
+
+    indexing with ints and slices (as in blocks[x, :, z, 0] or blocks[:, 0:r] = idm),
+    and with a tuple of integer arrays (as in blocks[xs, ys, zs]), works as for the dense
+    array.  reads return numpy arrays.
+
+    Args:
+        shape: the shape of the dense array, (X, Y, Z, 2)
+        dtype: the dtype of the dense array
+        chunk_size (int): the side length of the chunks
+    """
+
+    def __init__(self, shape, dtype="int32", chunk_size=CHUNK_SIZE):
+        self.shape = tuple(shape)
+        self.ndim = len(self.shape)
+        self.dtype = np.dtype(dtype)
+        self.chunk_size = chunk_size
+        # (cx, cy, cz) -> chunk_size x chunk_size x chunk_size x 2 array,
+        # read-only (a broadcast of a single block) if the chunk is uniform
+        self.chunks = {}
+
+    def __len__(self):
+        return self.shape[0]
+
+    def __array__(self, dtype=None):
+        return self[:] if dtype is None else self[:].astype(dtype)
+
+    def copy(self):
+        """a dense numpy copy"""
+        return self[:]
+
+    def __getitem__(self, key):
+        key = self._expand_key(key)
+        point = self._point(key)
+        if point is not None:
+            chunk = self.chunks.get(point[0])
+            if chunk is None:
+                return np.zeros(self.shape[3:], dtype=self.dtype)[key[3:]]
+            out = chunk[point[1] + key[3:]]
+            return out.copy() if isinstance(out, np.ndarray) else out
+        if self._is_fancy(key):
+            locs, shape = self._points(key)
+            return self._get_points(locs).reshape(shape + self.shape[3:])[(Ellipsis,) + key[3:]]
+        lo, hi, local = self._box(key)
+        return self._read(lo, hi)[local]
+
+    def __setitem__(self, key, value):
+        key = self._expand_key(key)
+        value = np.asarray(value)
+        point = self._point(key)
+        if point is not None:
+            chunk = self._writable(point[0])
+            chunk[point[1] + key[3:]] = value
+            self._store(point[0], chunk)
+            return
+        if self._is_fancy(key):
+            locs, shape = self._points(key)
+            target = np.empty(self.shape[3:], dtype=bool)[key[3:]].shape
+            value = np.broadcast_to(value, shape + target).reshape((-1,) + target)
+            self._set_points(locs, value, key[3:])
+            return
+        lo, hi, local = self._box(key)
+        if any(l.step != 1 for l in local[:3] if isinstance(l, slice)):
+            box = self._read(lo, hi)
+            box[local] = value
+            self._write(lo, hi, box, ())
+            return
+        # line the value up with the box, putting back the axes indexed by an int
+        target = np.empty(self.shape[3:], dtype=bool)[key[3:]].shape
+        kept = [b - a for a, b, l in zip(lo, hi, local) if isinstance(l, slice)]
+        dropped = [i for i, l in enumerate(local[:3]) if not isinstance(l, slice)]
+        values = np.broadcast_to(value, tuple(kept) + target)
+        values = np.expand_dims(values, dropped) if dropped else values
+        self._write(lo, hi, values, key[3:], zero=not value.any())
+
+    def nonzero_blocks(self):
+        """
+        Returns:
+            an (N, 3) array with the locations of the blocks with a nonzero id, and
+            an (N, 2) array with their idms
+        """
+        c = self.chunk_size
+        locs = [np.zeros((0, 3), dtype="int64")]
+        idms = [np.zeros((0,) + self.shape[3:], dtype=self.dtype)]
+        for key in sorted(self.chunks):
+            chunk = self.chunks[key]
+            nz = np.nonzero(chunk[:, :, :, 0])
+            locs.append(np.stack(nz, axis=1) + np.array(key) * c)
+            idms.append(chunk[nz])
+        return np.concatenate(locs), np.concatenate(idms)
+
+    def _expand_key(self, key):
+        if not isinstance(key, tuple):
+            key = (key,)
+        if len(key) > self.ndim:
+            raise IndexError("too many indices for blocks of shape {}".format(self.shape))
+        return key + (slice(None),) * max(3 - len(key), 0)
+
+    def _point(self, key):
+        """the chunk and the position in it indexed by 3 ints, or None for other indices"""
+        p = []
+        for k, n in zip(key[:3], self.shape[:3]):
+            if not isinstance(k, (int, np.integer)):
+                return None
+            i = int(k) + n if k < 0 else int(k)
+            if i < 0 or i >= n:
+                raise IndexError("index {} is out of bounds for size {}".format(k, n))
+            p.append(i)
+        c = self.chunk_size
+        return tuple(i // c for i in p), tuple(i % c for i in p)
+
+    def _is_fancy(self, key):
+        return any(isinstance(k, (list, np.ndarray)) for k in key[:3])
+
+    def _box(self, key):
+        """
+        split an index of ints and slices into the box it reads or writes, from lo to hi,
+        and the index into that box
+        """
+        lo, hi, local = [], [], []
+        for k, n in zip(key[:3], self.shape[:3]):
+            if isinstance(k, slice):
+                r = range(*k.indices(n))
+                if len(r) == 0:
+                    lo.append(0)
+                    hi.append(0)
+                    local.append(slice(0, 0, 1))
+                    continue
+                a = min(r[0], r[-1])
+                lo.append(a)
+                hi.append(max(r[0], r[-1]) + 1)
+                stop = r[-1] - a + (1 if r.step > 0 else -1)
+                local.append(slice(r[0] - a, stop if stop >= 0 else None, r.step))
+            elif isinstance(k, (int, np.integer)):
+                i = int(k) + n if k < 0 else int(k)
+                if i < 0 or i >= n:
+                    raise IndexError("index {} is out of bounds for size {}".format(k, n))
+                lo.append(i)
+                hi.append(i + 1)
+                local.append(0)
+            else:
+                raise IndexError("blocks can't be indexed with {}".format(k))
+        return lo, hi, tuple(local) + key[3:]
+
+    def _points(self, key):
+        """the (N, 3) locations indexed by a tuple of integer arrays, and the arrays' shape"""
+        xyz = [np.asarray(k) for k in key[:3]]
+        if not xyz[0].shape == xyz[1].shape == xyz[2].shape:
+            xyz = np.broadcast_arrays(*xyz)
+        shape = xyz[0].shape
+        locs = np.stack(xyz, axis=-1).reshape(-1, 3)
+        if locs.dtype.kind not in "iu":
+            raise IndexError("blocks can only be indexed with integer arrays")
+        n = np.array(self.shape[:3])
+        negative = locs < 0
+        if negative.any():
+            locs = locs + negative * n
+        if (locs < 0).any() or (locs >= n).any():
+            raise IndexError("index out of bounds for blocks of shape {}".format(self.shape))
+        return locs, shape
+
+    def _chunks_in(self, lo, hi, stored_only=True):
+        """
+        the chunks intersecting the box from lo to hi (all of them, or only the stored
+        ones), with the part of the box in each
+        """
+        c = self.chunk_size
+        ranges = [range(a // c, (b - 1) // c + 1) for a, b in zip(lo, hi)]
+        if any(b <= a for a, b in zip(lo, hi)):
+            return
+        if stored_only and np.prod([len(r) for r in ranges]) > len(self.chunks):
+            keys = [k for k in self.chunks if all(i in r for i, r in zip(k, ranges))]
+        else:
+            keys = itertools.product(*ranges)
+            if stored_only:
+                keys = [k for k in keys if k in self.chunks]
+        for key in keys:
+            a = tuple(max(l, i * c) for l, i in zip(lo, key))
+            b = tuple(min(h, i * c + c) for h, i in zip(hi, key))
+            yield key, a, b
+
+    def _writable(self, key):
+        chunk = self.chunks.get(key)
+        if chunk is None:
+            c = self.chunk_size
+            return np.zeros((c, c, c) + self.shape[3:], dtype=self.dtype)
+        if not chunk.flags.writeable:
+            return np.array(chunk)
+        return chunk
+
+    def _store(self, key, chunk):
+        """store the chunk, dropping it if it is all air, and squeezing it if it is uniform"""
+        first = chunk[0, 0, 0]
+        # most chunks aren't uniform, and their far corner shows it
+        if (chunk[-1, -1, -1] == first).all() and (chunk == first).all():
+            if first.any():
+                self.chunks[key] = np.broadcast_to(first.copy(), chunk.shape)
+            else:
+                self.chunks.pop(key, None)
+        else:
+            self.chunks[key] = chunk
+
+    def _read(self, lo, hi):
+        out = np.zeros(tuple(b - a for a, b in zip(lo, hi)) + self.shape[3:], dtype=self.dtype)
+        for key, a, b in self._chunks_in(lo, hi):
+            origin = [i * self.chunk_size for i in key]
+            out[_slices(a, b, lo)] = self.chunks[key][_slices(a, b, origin)]
+        return out
+
+    def _write(self, lo, hi, values, target, zero=False):
+        """write values (lined up with the box from lo to hi) into blocks[box][target]"""
+        # writing air doesn't touch the chunks that aren't stored
+        for key, a, b in self._chunks_in(lo, hi, stored_only=zero):
+            origin = [i * self.chunk_size for i in key]
+            chunk = self._writable(key)
+            chunk[_slices(a, b, origin) + target] = values[_slices(a, b, lo)]
+            self._store(key, chunk)
+
+    def _group(self, locs):
+        """the chunks with one of the locs, with the indices of the locs in each and their
+        positions in the chunk"""
+        if len(locs) == 0:
+            return
+        c = self.chunk_size
+        keys = locs // c
+        # one int per chunk, so grouping the locs is a 1d sort
+        n = np.array(self.shape[:3]) // c + 1
+        packed = (keys[:, 0] * n[1] + keys[:, 1]) * n[2] + keys[:, 2]
+        if packed.min() == packed.max():
+            key = tuple(keys[0].tolist())
+            yield key, np.arange(len(locs)), locs - np.array(key) * c
+            return
+        order = np.argsort(packed, kind="stable")
+        packed = packed[order]
+        starts = np.flatnonzero(np.concatenate(([True], packed[1:] != packed[:-1])))
+        ends = np.append(starts[1:], len(order))
+        for start, end in zip(starts.tolist(), ends.tolist()):
+            idx = order[start:end]
+            key = tuple(keys[idx[0]].tolist())
+            yield key, idx, locs[idx] - np.array(key) * c
+
+    def _get_points(self, locs):
+        out = np.zeros((len(locs),) + self.shape[3:], dtype=self.dtype)
+        if len(locs) <= SMALL_POINTS:
+            c = self.chunk_size
+            for i, (x, y, z) in enumerate(locs.tolist()):
+                chunk = self.chunks.get((x // c, y // c, z // c))
+                if chunk is not None:
+                    out[i] = chunk[x % c, y % c, z % c]
+            return out
+        for key, idx, l in self._group(locs):
+            chunk = self.chunks.get(key)
+            if chunk is not None:
+                out[idx] = chunk[l[:, 0], l[:, 1], l[:, 2]]
+        return out
+
+    def _set_points(self, locs, values, target):
+        for key, idx, l in self._group(locs):
+            chunk = self._writable(key)
+            chunk[(l[:, 0], l[:, 1], l[:, 2]) + target] = values[idx]
+            self._store(key, chunk)
+
+
+def _slices(a, b, origin):
+    """the slices of the box from a to b, in an array starting at origin"""
+    return tuple(slice(s - o, e - o) for s, e, o in zip(a, b, origin))
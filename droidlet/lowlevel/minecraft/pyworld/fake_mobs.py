@@ -155,3 +155,92 @@ class LoopMob(SimpleMob):
         #        print("in loopmob step, pos is " + str(self.pos))
         self.look = self.move_sequence[c][1]
         self.count += 1
+
+
+def random_directions(n):
+    d = np.random.randn(n, 2)
+    return d / np.linalg.norm(d, axis=1, keepdims=True)
+
+
+def step_mobs(mobs):
+    """
+    step a list of SimpleMobs, which can be in different worlds, together: the moves
+    are the same as SimpleMob.step's, but computed with numpy ops over all the mobs,
+    and one block lookup per world for each height a mob can step up
+    """
+    if len(mobs) == 0:
+        return
+    n = len(mobs)
+    worlds = {}
+    for i, m in enumerate(mobs):
+        worlds.setdefault(id(m.world), (m.world, []))[1].append(i)
+    worlds = [(w, np.array(idx)) for w, idx in worlds.values()]
+
+    def block_ids(xs, ys, zs, mask):
+        ids = np.zeros(n, dtype="int64")
+        for w, idx in worlds:
+            idx = idx[mask[idx]]
+            if len(idx) > 0:
+                ids[idx] = w.blocks[xs[idx], ys[idx], zs[idx], 0]
+        return ids
+
+    shift = np.array([m.world.coord_shift for m in mobs], dtype="float64")
+    sl = np.array([m.world.sl for m in mobs])
+    pos = np.array([m.pos for m in mobs], dtype="float64") - shift
+    x, y, z = pos[:, 0].copy(), pos[:, 1].copy(), pos[:, 2].copy()
+    direction = np.array([m.direction for m in mobs], dtype="float64")
+    loitering = np.array([m.loitering for m in mobs])
+    loiter_time = np.array([m.loiter_time for m in mobs])
+    loiter_prob = np.array([m.loiter_prob for m in mobs])
+    direction_change_prob = np.array([m.direction_change_prob for m in mobs])
+    speed = np.array([m.speed for m in mobs], dtype="float64")
+    step_height = np.array([m.step_height for m in mobs])
+
+    # check if falling:
+    fy = np.clip(np.floor(y).astype("int64"), 0, sl)
+    rx = np.clip(np.round(x).astype("int64"), 0, sl - 1)
+    rz = np.clip(np.round(z).astype("int64"), 0, sl - 1)
+    falling = (y > 0) & (block_ids(rx, fy - 1, rz, y > 0) == 0)
+    pos[falling, 1] -= FALL_SPEED
+
+    loitered = ~falling & (loitering >= 0)
+    loitering[loitered] += 1
+    loitering[loitered & (loitering > loiter_time)] = -1
+    free = ~falling & ~loitered
+    start_loitering = free & (np.random.rand(n) < loiter_prob)
+    loitering[start_loitering] = 0
+    moving = free & ~start_loitering
+    change = moving & (np.random.rand(n) < direction_change_prob)
+    direction[change] = random_directions(change.sum())
+
+    # if hitting boundary, reverse...
+    for axis, c in ((0, x), (1, z)):
+        out = np.round(c + direction[:, axis] * speed)
+        out = (out < 0) | (out >= sl)
+        direction[moving & out, axis] *= -1
+    new_x = x + direction[:, 0] * speed
+    new_z = z + direction[:, 1] * speed
+    nx = np.clip(np.round(new_x).astype("int64"), 0, sl - 1)
+    nz = np.clip(np.round(new_z).astype("int64"), 0, sl - 1)
+
+    # is there a block in new location? if no go there, if yes go up
+    blocked = moving.copy()
+    redirect = np.zeros(n, dtype=bool)
+    for i in range(step_height.max()):
+        trying = blocked & (i < step_height)
+        top = trying & (fy + i >= sl)
+        redirect |= top
+        blocked &= ~top
+        trying &= ~top
+        moved = trying & (block_ids(nx, fy + i, nz, trying) == 0)
+        pos[moved] = np.stack((new_x, y + i, new_z), axis=1)[moved]
+        blocked &= ~moved
+    # couldn't get past a wall of blocks, try a different dir
+    redirect |= blocked
+    direction[redirect] = random_directions(redirect.sum())
+
+    pos = pos + shift
+    for i, m in enumerate(mobs):
+        m.pos = tuple(pos[i].tolist())
+        m.direction = direction[i]
+        m.loitering = int(loitering[i])
@@ -2,10 +2,12 @@
 Copyright (c) Facebook, Inc. and its affiliates.
 """
 
+import zlib
 from collections import namedtuple
 from unittest.mock import Mock
 
 import numpy as np
+from droidlet.base_util import Pos
 
 FLAT_GROUND_DEPTH = 8
 
@@ -61,6 +63,72 @@ def shift_coords(p, shift):
     return q
 
 
+def encode_array(a, compress=False):
+    """Return a dict with the shape, dtype and bytes of the numpy array a, that socketio
+    sends as a binary attachment.  The bytes are zlib compressed if compress"""
+    # tobytes copies non-contiguous arrays in C order (np.ascontiguousarray would make
+    # 0-d arrays 1-d)
+    a = np.asarray(a)
+    data = a.tobytes()
+    if compress:
+        data = zlib.compress(data, 1)
+    return {"shape": list(a.shape), "dtype": a.dtype.str, "compressed": compress, "data": data}
+
+
+def decode_array(d):
+    """Return the (read-only) numpy array encoded by encode_array, without copying the
+    bytes if they weren't compressed"""
+    data = zlib.decompress(d["data"]) if d["compressed"] else d["data"]
+    return np.frombuffer(data, dtype=d["dtype"]).reshape(d["shape"])
+
+
+def encode_blocks(blocks):
+    """encode a dict {(x, y, z): (id, meta)} as two arrays, see encode_array"""
+    locs = np.array(list(blocks.keys()), dtype="int32").reshape(-1, 3)
+    idms = np.array(list(blocks.values()), dtype="int32").reshape(-1, 2)
+    return {"locs": encode_array(locs), "idms": encode_array(idms)}
+
+
+def decode_blocks(d):
+    """Return the dict {(x, y, z): (id, meta)} encoded by encode_blocks"""
+    locs = decode_array(d["locs"]).tolist()
+    idms = decode_array(d["idms"]).tolist()
+    return {tuple(l): tuple(idm) for l, idm in zip(locs, idms)}
+
+
+def traverse_voxels(origin, direction, max_dist):
+    """
+    the unit voxels (centered on integer coordinates) a ray from origin in direction
+    passes through, in order, until it has gone max_dist (Amanatides and Woo's voxel
+    traversal, vectorized: the ray's crossings of the voxel faces are computed for each
+    axis, and merged)
+
+    Returns:
+        an (N, 3) int64 array of voxel coordinates, starting with the voxel of origin
+    """
+    direction = np.asarray(direction, dtype="float64")
+    direction = direction / np.linalg.norm(direction)
+    start = np.floor(origin + 0.5).astype("int64")
+    ts, axes = [], []
+    for axis in range(3):
+        d = direction[axis]
+        if abs(d) < 1e-9:
+            continue
+        # the first face crossed along this axis, and the ones after it
+        face = start[axis] + 0.5 * np.sign(d)
+        n = int(max_dist * abs(d)) + 1
+        t = (face + np.sign(d) * np.arange(n) - origin[axis]) / d
+        t = t[t <= max_dist]
+        ts.append(t)
+        axes.append(np.full(len(t), axis))
+    ts = np.concatenate(ts)
+    axes = np.concatenate(axes)
+    axes = axes[np.argsort(ts, kind="stable")]
+    steps = np.zeros((len(axes) + 1, 3), dtype="int64")
+    steps[np.arange(1, len(axes) + 1), axes] = np.sign(direction[axes]).astype("int64")
+    return start + np.cumsum(steps, axis=0)
+
+
 def build_coord_shifts(coord_shift):
     def to_npy_coords(p):
         dx = -coord_shift[0]
@@ -113,11 +181,13 @@ def build_ground(world):
         + p[5] * np.cos(g[1]) * np.sin(g[1])
     )
     ground_height = ground_height - ground_height.mean() + avg_ground_height
-    for i in range(world.sl):
-        for j in range(world.sl):
-            height = min(31, max(0, int(ground_height[i, j])))
-            for k in range(int(height)):
-                world.blocks[i, k, j] = DIRT
+    heights = np.clip(ground_height.astype("int32"), 0, 31)
+    h = heights.max()
+    # a slab of x at a time, so the masks stay small in big worlds
+    for i in range(0, world.sl, 16):
+        below = np.arange(h)[None, :, None] < heights[i : i + 16, None, :]
+        slab = world.blocks[i : i + 16, :h, :, :]
+        world.blocks[i : i + 16, :h, :, :] = np.where(below[:, :, :, None], DIRT, slab)
 
     # FIXME this is broken
     if hasattr(world.opts, "ground_block_probs"):
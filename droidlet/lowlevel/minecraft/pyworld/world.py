@@ -7,16 +7,46 @@ from droidlet.base_util import Pos, Look
 from droidlet.lowlevel.minecraft.mc_util import XYZ, IDM
 from droidlet.shared_data_struct.craftassist_shared_utils import Player, Item
 from droidlet.shared_data_struct.rotation import look_vec
-from droidlet.lowlevel.minecraft.pyworld.fake_mobs import make_mob_opts, MOB_META, SimpleMob
+from droidlet.lowlevel.minecraft.pyworld.chunked_blocks import ChunkedBlocks
+from droidlet.lowlevel.minecraft.pyworld.fake_mobs import (
+    make_mob_opts,
+    step_mobs,
+    MOB_META,
+    SimpleMob,
+)
 from droidlet.lowlevel.minecraft.pyworld.utils import (
     build_ground,
     make_pose,
     build_coord_shifts,
     shift_coords,
+    encode_array,
+    encode_blocks,
+    traverse_voxels,
 )
 from droidlet.lowlevel.minecraft.craftassist_cuberite_utils.block_data import PASSABLE_BLOCKS
 
 
+def step_worlds(worlds):
+    """
+    step several worlds at once.  if there are enough of them, the SimpleMobs of all the
+    worlds are moved together, see step_mobs
+    """
+    simple_mobs = [m for w in worlds for m in w.mobs if type(m).step is SimpleMob.step]
+    # the numpy ops cost about as much as stepping 8 mobs one by one, plus 2 per world
+    # for the block lookups; below that the python loop is faster
+    vectorize = len(simple_mobs) > 8 + 2 * len(worlds)
+    if vectorize:
+        step_mobs(simple_mobs)
+    for w in worlds:
+        for m in w.mobs:
+            if not vectorize or type(m).step is not SimpleMob.step:
+                m.step()
+        for eid, p in w.players.items():
+            if hasattr(p, "step"):
+                p.step()
+        w.count += 1
+
+
 class World:
     def __init__(self, opts, spec):
         self.opts = opts
@@ -30,7 +60,9 @@ class World:
         self.to_npy_coords = to_npy_coords
         self.from_npy_coords = from_npy_coords
 
-        self.blocks = np.zeros((opts.sl, opts.sl, opts.sl, 2), dtype="int32")
+        # indexed like a dense sl x sl x sl x 2 array, but only stores the chunks
+        # with something in them
+        self.blocks = ChunkedBlocks((opts.sl, opts.sl, opts.sl, 2), dtype="int32")
         if spec.get("ground_generator"):
             ground_args = spec.get("ground_args", None)
             if ground_args is None:
@@ -54,6 +86,9 @@ class World:
         self.agent_data = spec["agent"]
         self.chat_log = []
 
+        # sid (or other key of a connected agent) -> entityId
+        self.connected_sids = {}
+
         # keep a list of blocks changed since the last call of
         # get_changed_blocks of each agent
         # TODO more efficient?
@@ -77,12 +112,7 @@ class World:
         self.count = count
 
     def step(self):
-        for m in self.mobs:
-            m.step()
-        for eid, p in self.players.items():
-            if hasattr(p, "step"):
-                p.step()
-        self.count += 1
+        step_worlds([self])
 
     def place_block(self, block, force=False):
         loc, idm = block
@@ -115,20 +145,20 @@ class World:
         return self.place_block((loc, (0, 0)))
 
     def blocks_to_dict(self):
-        d = {}
-        nz = np.transpose(self.blocks[:, :, :, 0].nonzero())
-        for loc in nz:
-            l = tuple(loc.tolist())
-            d[self.from_npy_coords(l)] = tuple(self.blocks[l[0], l[1], l[2], :])
-        return d
+        locs, idms = self.blocks.nonzero_blocks()
+        locs = locs + np.array(self.coord_shift)
+        return dict(zip(map(tuple, locs.tolist()), map(tuple, idms.tolist())))
 
     def get_idm_at_locs(self, xyzs: Sequence[XYZ]) -> Dict[XYZ, IDM]:
         """Return the ground truth block state"""
-        d = {}
-        for (x, y, z) in xyzs:
-            B = self.get_blocks(x, x, y, y, z, z)
-            d[(x, y, z)] = tuple(B[0, 0, 0, :])
-        return d
+        xyzs = [tuple(l) for l in xyzs]
+        locs = np.array(xyzs, dtype="int64").reshape(-1, 3) - np.array(self.coord_shift)
+        # outside the world is bedrock, as in get_blocks
+        idms = np.zeros((len(locs), 2), dtype="int64")
+        idms[:, 0] = 7
+        inside = ((locs >= 0) & (locs < self.sl)).all(axis=1)
+        idms[inside] = self.blocks[locs[inside, 0], locs[inside, 1], locs[inside, 2]]
+        return dict(zip(xyzs, map(tuple, idms.tolist())))
 
     def get_mobs(self):
         return [m.get_info() for m in self.mobs]
@@ -195,23 +225,21 @@ class World:
             return pre_B
 
     def get_line_of_sight(self, pos, yaw, pitch):
-        # it is assumed lv is unit normalized
-        pos = tuple(self.to_npy_coords(pos))
+        """
+        the first block hit by a ray from pos in the direction yaw, pitch; or None if the
+        ray leaves the world (or goes 2 * sl) without hitting a block.  blocks are unit
+        cubes centered on their coordinates.
+        """
+        pos = np.array(self.to_npy_coords(pos), dtype="float64")
         lv = look_vec(yaw, pitch)
-        dt = 1.0
-        for n in range(2 * self.sl):
-            p = tuple(np.round(np.add(pos, n * dt * lv)).astype("int32"))
-            for i in range(-1, 2):
-                for j in range(-1, 2):
-                    for k in range(-1, 2):
-                        sp = tuple(np.add(p, (i, j, k)))
-                        if all([x >= 0 for x in sp]) and all([x < self.sl for x in sp]):
-                            if tuple(self.blocks[sp]) != (0, 0):
-                                # TODO: deal with close blocks artifacts,
-                                # etc
-                                pos = self.from_npy_coords(sp)
-                                return tuple(int(l) for l in pos)
-        return
+        voxels = traverse_voxels(pos, lv, 2 * self.sl)
+        inside = ((voxels >= 0) & (voxels < self.sl)).all(axis=1)
+        voxels = voxels[inside]
+        hit = self.blocks[voxels[:, 0], voxels[:, 1], voxels[:, 2]].any(axis=1)
+        if not hit.any():
+            return
+        pos = self.from_npy_coords(tuple(voxels[hit.argmax()].tolist()))
+        return tuple(int(l) for l in pos)
 
     def add_incoming_chat(self, chat: str, speaker_name: str):
         """Add a chat to memory as if it was just spoken by SPEAKER"""
@@ -237,13 +265,72 @@ class World:
             self.changed_blocks_store[sid] = {}
             self.incoming_chats_store[sid] = []
 
+    # warning: the player methods below assume the player stored in self.players is
+    # a Player struct, not some more complicated object
+
+    def set_player_look(self, eid, yaw, pitch):
+        self.players[eid] = self.players[eid]._replace(look=Look(yaw, pitch))
+
+    def move_player(self, eid, dx=0, dy=0, dz=0):
+        """move the player by dx, dy, dz if there is room for it there"""
+        x, y, z = self.get_player_info(eid).pos
+        x, y, z = x + dx, y + dy, z + dz
+        nx, ny, nz = self.to_npy_coords((x, y, z))
+        # agent is 2 blocks high
+        if nx >= 0 and ny >= 0 and nz >= 0 and nx < self.sl and ny < self.sl - 1 and nz < self.sl:
+            if (
+                self.blocks[nx, ny, nz, 0] in PASSABLE_BLOCKS
+                and self.blocks[nx, ny + 1, nz, 0] in PASSABLE_BLOCKS
+            ):
+                new_pos = Pos(x, y, z)
+                self.players[eid] = self.players[eid]._replace(pos=new_pos)
+
+    def step_player_forward(self, eid):
+        """move the player a block along the horizontal axis nearest its look direction"""
+        x, _, z = look_vec(*self.get_player_info(eid).look)
+        if abs(x) > abs(z):
+            self.move_player(eid, dx=1 if x > 0 else -1)
+        else:
+            self.move_player(eid, dz=1 if z > 0 else -1)
+
+    def set_player_mainhand(self, eid, idm):
+        self.players[eid] = self.players[eid]._replace(mainHand=Item(*idm))
+
+    def player_place_block(self, eid, loc):
+        """place the block in the player's mainhand at loc"""
+        idm = self.get_player_info(eid).mainHand
+        if idm is None:
+            return False
+        return self.place_block((loc, idm))
+
+    def player_line_of_sight(self, eid):
+        player_struct = self.get_player_info(eid)
+        return self.get_line_of_sight(player_struct.pos, *player_struct.look)
+
+    def send_chat(self, eid, chat_text):
+        """send the chat from the player to all the connected agents"""
+        chat_with_name = "<{}> {}".format(self.get_player_info(eid).name, chat_text)
+        for store in self.incoming_chats_store.values():
+            store.append(chat_with_name)
+
+    def get_changed_blocks(self, sid):
+        """the blocks changed since the connected agent with this sid last asked"""
+        blocks = self.changed_blocks_store[sid]
+        self.changed_blocks_store[sid] = {}
+        return blocks
+
+    def get_incoming_chats(self, sid):
+        """the chats sent since the connected agent with this sid last asked"""
+        chats = self.incoming_chats_store[sid]
+        self.incoming_chats_store[sid] = []
+        return chats
+
     def setup_server(self, port=25565):
         import socketio
         import eventlet
         import time
 
         server = socketio.Server(async_mode="eventlet")
-        self.connected_sids = {}
 
         self.start_time = time.time()
         self.get_time = lambda: time.time() - self.start_time
@@ -267,17 +354,11 @@ class World:
 
         @server.on("send_chat")
         def broadcast_chat(sid, chat_text):
-            eid = self.connected_sids.get(sid)
-            player_struct = self.get_player_info(eid)
-            chat_with_name = "<{}> {}".format(player_struct.name, chat_text)
-            for sid, store in self.incoming_chats_store.items():
-                store.append(chat_with_name)
+            self.send_chat(self.connected_sids.get(sid), chat_text)
 
         @server.on("get_incoming_chats")
         def get_chats(sid):
-            chats = {"chats": self.incoming_chats_store[sid]}
-            self.incoming_chats_store[sid] = []
-            return chats
+            return {"chats": self.get_incoming_chats(sid)}
 
         @server.on("line_of_sight")
         def los_event(sid, data):
@@ -292,65 +373,31 @@ class World:
                     raise Exception(
                         "player connected, asking for line of sight, but sid does not match any entityId"
                     )
-                player_struct = self.get_player_info(eid)
-                pos = self.get_line_of_sight(player_struct.pos, *player_struct.look)
+                pos = self.player_line_of_sight(eid)
             pos = pos or ""
             return {"pos": pos}
 
-        # warning: it is assumed that if a player is using the sio event to set look,
-        # the only thing stored here is a Player struct, not some more complicated object
-
         @server.on("set_look")
         def set_agent_look(sid, data):
-            eid = self.connected_sids.get(sid)
-            player_struct = self.get_player_info(eid)
-            new_look = Look(data["yaw"], data["pitch"])
-            self.players[eid] = self.players[eid]._replace(look=new_look)
+            self.set_player_look(self.connected_sids.get(sid), data["yaw"], data["pitch"])
 
         @server.on("rel_move")
         def move_agent_rel(sid, data):
             eid = self.connected_sids.get(sid)
-            player_struct = self.get_player_info(eid)
-            x, y, z = player_struct.pos
             if data.get("forward"):
-                pass  # FIXME!!!!
+                self.step_player_forward(eid)
             else:
-                x += data.get("x", 0)
-                y += data.get("y", 0)
-                z += data.get("z", 0)
-            nx, ny, nz = self.to_npy_coords((x, y, z))
-            # agent is 2 blocks high
-            if (
-                nx >= 0
-                and ny >= 0
-                and nz >= 0
-                and nx < self.sl
-                and ny < self.sl - 1
-                and nz < self.sl
-            ):
-                if (
-                    self.blocks[nx, ny, nz, 0] in PASSABLE_BLOCKS
-                    and self.blocks[nx, ny + 1, nz, 0] in PASSABLE_BLOCKS
-                ):
-                    new_pos = Pos(x, y, z)
-                    self.players[eid] = self.players[eid]._replace(pos=new_pos)
+                self.move_player(eid, data.get("x", 0), data.get("y", 0), data.get("z", 0))
 
         @server.on("set_held_item")
         def set_agent_mainhand(sid, data):
             if data.get("idm") is not None:
-                eid = self.connected_sids.get(sid)
-                player_struct = self.get_player_info(eid)
-                new_item = Item(*data["idm"])
-                self.players[eid] = self.players[eid]._replace(mainHand=new_item)
+                self.set_player_mainhand(self.connected_sids.get(sid), data["idm"])
 
         @server.on("place_block")
         def place_mainhand(sid, data):
-            eid = self.connected_sids.get(sid)
-            player_struct = self.get_player_info(eid)
-            idm = player_struct.mainHand
             if data.get("loc"):
-                placed = self.place_block((data["loc"], idm))
-                return placed
+                return self.player_place_block(self.connected_sids.get(sid), data["loc"])
 
         @server.on("dig")
         def agent_dig(sid, data):
@@ -363,24 +410,24 @@ class World:
             eid = self.connected_sids.get(sid)
             return {"player": self.get_player_info(eid)}
 
+        # blocks are sent as numpy buffers, see encode_array
         @server.on("get_changed_blocks")
         def changed_blocks(sid):
-            eid = self.connected_sids.get(sid)
-            blocks = self.changed_blocks_store[sid]
-            # can't send dicts with tuples for keys :(
-            blocks = {str(k): v for k, v in blocks.items()}
-            self.changed_blocks_store[sid] = {}
-            return blocks
+            return encode_blocks(self.get_changed_blocks(sid))
 
         @server.on("get_blocks")
-        def get_blocks_dict(sid, data):
+        def get_blocks_npy(sid, data):
             x, X, y, Y, z, Z = data["bounds"]
-            npy = self.get_blocks(x, X, y, Y, z, Z, transpose=False)
-            nz_locs = list(zip(*np.nonzero(npy[:, :, :, 0])))
-            nz_idms = [tuple(self.blocks[l].tolist()) for l in nz_locs]
-            nz_locs = [(int(x), int(y), int(z)) for x, y, z in nz_locs]
-            flattened_blocks = [nz_locs[i] + nz_idms[i] for i in range(len(nz_locs))]
-            return flattened_blocks
+            npy = self.get_blocks(x, X, y, Y, z, Z)
+            return encode_array(npy, compress=data.get("compress", False))
+
+        # several boxes and (optionally) the changed blocks in one round trip
+        @server.on("get_blocks_batch")
+        def get_blocks_batch(sid, data):
+            out = {"blocks": [get_blocks_npy(sid, {**data, "bounds": b}) for b in data["bounds"]]}
+            if data.get("changed_blocks"):
+                out["changed_blocks"] = changed_blocks(sid)
+            return out
 
         app = socketio.WSGIApp(server)
         eventlet.wsgi.server(eventlet.listen(("", port)), app)
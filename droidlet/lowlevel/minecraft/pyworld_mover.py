@@ -1,12 +1,15 @@
 """
 Copyright (c) Facebook, Inc. and its affiliates.
 """
-import numpy as np
 import time
-import socketio
 from droidlet.base_util import XYZ, Pos, Look
 from droidlet.shared_data_struct.craftassist_shared_utils import Player, Item, ItemStack, Mob
-from droidlet.lowlevel.minecraft.pyworld.utils import build_coord_shifts
+from droidlet.lowlevel.minecraft.pyworld.utils import (
+    build_coord_shifts,
+    decode_array,
+    decode_blocks,
+)
+from droidlet.lowlevel.minecraft.pyworld.world import step_worlds
 
 BEDROCK = (7, 0)
 
@@ -28,7 +31,15 @@ def wait_for_data(data_callback, step=0.001, max_steps=100):
 
 
 class PyWorldMover:
-    def __init__(self, port=25565, ip="localhost"):
+    """
+    Args:
+        compress_blocks (bool): have the world zlib compress the blocks it sends; worth it
+            when the world isn't on this machine
+    """
+
+    def __init__(self, port=25565, ip="localhost", compress_blocks=False):
+        import socketio
+
         sio = socketio.Client()
         try:
             sio.connect("http://{}:{}".format(ip, port))
@@ -40,6 +51,7 @@ class PyWorldMover:
         print("connected to server on port {} at ip {}".format(port, ip))
 
         self.sio = sio
+        self.compress_blocks = compress_blocks
         D = DataCallback()
         self.sio.emit("get_world_info", callback=D)
         info = wait_for_data(D)
@@ -129,13 +141,8 @@ class PyWorldMover:
         D = DataCallback()
         self.sio.emit("get_changed_blocks", callback=D)
         blocks = wait_for_data(D)
-
-        def decode_str_loc(x):
-            return tuple(int(z) for z in x.strip("(").strip(")").split(","))
-
         if blocks:
-            # can't send dicts with tuples for keys :(
-            blocks = {decode_str_loc(loc): idm for loc, idm in blocks.items()}
+            blocks = decode_blocks(blocks)
         return blocks
 
     def get_blocks(self, x, X, y, Y, z, Z):
@@ -148,13 +155,33 @@ class PyWorldMover:
 
         TODO we don't need yzx orientation anymore...
         """
+        return self.get_blocks_batch([(x, X, y, Y, z, Z)])[0][0]
+
+    def get_blocks_batch(self, bounds, changed_blocks=False):
+        """
+        get the blocks in several rectanguloids, and optionally the changed blocks, in one
+        request to the world.
+
+        Args:
+            bounds: a list of (x, X, y, Y, z, Z), as the input of get_blocks
+            changed_blocks (bool): also get the changed blocks
+
+        Returns:
+            a list with a numpy array for each of the bounds, as the output of get_blocks;
+            and the changed blocks as the output of get_changed_blocks, or None
+        """
         D = DataCallback()
-        self.sio.emit("get_blocks", {"bounds": (x, X, y, Y, z, Z)}, callback=D)
-        flattened_blocks = wait_for_data(D)
-        npy_blocks = np.zeros((Y - y + 1, Z - z + 1, X - x + 1, 2), dtype="int32")
-        for b in flattened_blocks:
-            npy_blocks[b[1], b[2], b[0]] = [b[3], b[4]]
-        return npy_blocks
+        data = {
+            "bounds": bounds,
+            "compress": self.compress_blocks,
+            "changed_blocks": changed_blocks,
+        }
+        self.sio.emit("get_blocks_batch", data, callback=D)
+        out = wait_for_data(D)
+        # the decoded arrays are read-only views of the received bytes
+        blocks = [decode_array(b).copy() for b in out["blocks"]]
+        changed = decode_blocks(out["changed_blocks"]) if changed_blocks else None
+        return blocks, changed
 
     def send_chat(self, chat_text):
         self.sio.emit("send_chat", chat_text)
@@ -170,6 +197,114 @@ class PyWorldMover:
         return chats
 
 
+class InProcessPyWorldMover:
+    """
+    the same interface as PyWorldMover, for an agent in a World in this process: the
+    actions call the World directly instead of going through a socket
+
+    Args:
+        world: the pyworld World
+        name (str): the name of the agent's player
+        loc: where the agent's player starts; random if None
+        pitchyaw: the look the agent's player starts with; random if None
+    """
+
+    def __init__(self, world, name="anonymous", loc=None, pitchyaw=None):
+        self.world = world
+        # the key of the agent's changed blocks and chats in the world
+        self.sid = "in_process_{}".format(id(self))
+        data = {"player_type": "agent", "name": name, "loc": loc, "pitchyaw": pitchyaw}
+        world.connect_player(self.sid, data)
+        self.eid = world.connected_sids[self.sid]
+        self.sl = world.sl
+        self.world_coord_shift = world.coord_shift
+        to_npy_coords, from_npy_coords = build_coord_shifts(self.world_coord_shift)
+        self.to_npy_coords = to_npy_coords
+        self.from_npy_coords = from_npy_coords
+
+    def set_look(self, yaw, pitch):
+        self.world.set_player_look(self.eid, yaw, pitch)
+
+    def step_pos_x(self):
+        self.world.move_player(self.eid, dx=1)
+
+    def step_neg_x(self):
+        self.world.move_player(self.eid, dx=-1)
+
+    def step_pos_y(self):
+        self.world.move_player(self.eid, dy=1)
+
+    def step_neg_y(self):
+        self.world.move_player(self.eid, dy=-1)
+
+    def step_pos_z(self):
+        self.world.move_player(self.eid, dz=1)
+
+    def step_neg_z(self):
+        self.world.move_player(self.eid, dz=-1)
+
+    def step_forward(self):
+        self.world.step_player_forward(self.eid)
+
+    def set_held_item(self, idm):
+        self.world.set_player_mainhand(self.eid, idm)
+
+    def dig(self, x, y, z):
+        return self.world.dig((x, y, z))
+
+    def place_block(self, x, y, z):
+        """place the block in mainhand.  does nothing if mainhand empty"""
+        return self.world.player_place_block(self.eid, (x, y, z))
+
+    def get_player(self):
+        return self.world.get_player_info(self.eid)
+
+    def get_line_of_sight(self):
+        return self.world.player_line_of_sight(self.eid)
+
+    def get_changed_blocks(self):
+        return self.world.get_changed_blocks(self.sid)
+
+    def get_blocks(self, x, X, y, Y, z, Z):
+        """see PyWorldMover.get_blocks"""
+        return self.world.get_blocks(x, X, y, Y, z, Z)
+
+    def get_blocks_batch(self, bounds, changed_blocks=False):
+        """see PyWorldMover.get_blocks_batch"""
+        blocks = [self.world.get_blocks(*b) for b in bounds]
+        changed = self.get_changed_blocks() if changed_blocks else None
+        return blocks, changed
+
+    def send_chat(self, chat_text):
+        self.world.send_chat(self.eid, chat_text)
+
+    def get_incoming_chats(self):
+        return self.world.get_incoming_chats(self.sid)
+
+
+class Lockstep:
+    """
+    steps agents (e.g. with InProcessPyWorldMovers) and the worlds they are in together:
+    each step, every agent steps once and then every world steps once.  the worlds'
+    mobs are moved together, see step_worlds
+
+    Args:
+        agents: a list of objects with a step() method
+        worlds: a list of pyworld Worlds
+    """
+
+    def __init__(self, agents, worlds):
+        self.agents = agents
+        self.worlds = worlds
+        self.count = 0
+
+    def step(self):
+        for agent in self.agents:
+            agent.step()
+        step_worlds(self.worlds)
+        self.count += 1
+
+
 ### NOT DONE:
 #    "drop_item_stack_in_hand",
 #    "drop_item_in_hand",
@@ -0,0 +1,162 @@
+"""
+Copyright (c) Facebook, Inc. and its affiliates.
+"""
+import copy
+import unittest
+import numpy as np
+from droidlet.lowlevel.minecraft.pyworld.chunked_blocks import ChunkedBlocks
+from droidlet.lowlevel.minecraft.pyworld.fake_mobs import SimpleMob, make_mob_opts, step_mobs
+from droidlet.lowlevel.minecraft.pyworld.utils import (
+    encode_array,
+    decode_array,
+    encode_blocks,
+    decode_blocks,
+)
+from droidlet.lowlevel.minecraft.pyworld.world import World
+from droidlet.lowlevel.minecraft.pyworld_mover import InProcessPyWorldMover
+from droidlet.shared_data_struct.rotation import yaw_pitch
+
+
+class Opt:
+    pass
+
+
+class ChunkedBlocksTest(unittest.TestCase):
+    def test_matches_dense(self):
+        shape = (20, 12, 17, 2)
+        dense = np.zeros(shape, dtype="int32")
+        blocks = ChunkedBlocks(shape, chunk_size=4)
+        e = np.array([], dtype=int)
+        writes = [
+            ((slice(None), slice(0, 5), slice(None), 0), 7),
+            ((slice(2, 9), 5, slice(None)), (3, 0)),
+            ((4, 5, 6), (35, 2)),
+            ((slice(None, None, 3), slice(4, 8), -1, 1), 5),
+            ((np.array([0, 19, 3]), np.array([11, 11, 2]), np.array([0, 16, 9])), (1, 0)),
+            ((e, e, e), (1, 0)),
+            ((slice(10, 20), slice(None), slice(None)), 0),
+        ]
+        for key, value in writes:
+            dense[key] = value
+            blocks[key] = value
+            self.assertTrue(np.array_equal(np.asarray(blocks), dense))
+        self.assertTrue(np.array_equal(blocks[3, :, 2:9:2, 0], dense[3, :, 2:9:2, 0]))
+        xs, ys, zs = np.array([4, 0, 19]), np.array([5, 11, 11]), np.array([6, 0, 16])
+        self.assertTrue(np.array_equal(blocks[xs, ys, zs], dense[xs, ys, zs]))
+        self.assertEqual(blocks[e, e, e].shape, (0, 2))
+
+        locs, idms = blocks.nonzero_blocks()
+        self.assertEqual(len(locs), (dense[:, :, :, 0] > 0).sum())
+        self.assertTrue(np.array_equal(dense[locs[:, 0], locs[:, 1], locs[:, 2]], idms))
+
+        # the filled chunks below y=5 are stored as a single block
+        self.assertFalse(blocks.chunks[(0, 0, 0)].flags.writeable)
+        blocks[:] = 0
+        self.assertEqual(len(blocks.chunks), 0)
+
+
+class WireFormatTest(unittest.TestCase):
+    def test_arrays(self):
+        rng = np.random.RandomState(0)
+        blocks = rng.randint(0, 256, size=(5, 6, 7, 2)).astype("int32")
+        arrays = [
+            blocks,
+            rng.rand(4, 3).astype("float32"),
+            np.zeros((0, 3), dtype="int64"),
+            np.array(7, dtype="uint8"),
+            # not contiguous
+            blocks[::2, :, 1:5],
+            blocks.transpose(2, 0, 1, 3),
+        ]
+        for a in arrays:
+            for compress in [False, True]:
+                d = encode_array(a, compress=compress)
+                self.assertIsInstance(d["data"], bytes)
+                b = decode_array(d)
+                self.assertEqual(b.dtype, a.dtype)
+                self.assertEqual(b.shape, a.shape)
+                self.assertTrue(np.array_equal(a, b))
+
+    def test_blocks(self):
+        blocks = {(1, 2, 3): (35, 4), (-5, 0, 70): (1, 0)}
+        self.assertEqual(decode_blocks(encode_blocks(blocks)), blocks)
+        self.assertEqual(decode_blocks(encode_blocks({})), {})
+
+
+class WorldTest(unittest.TestCase):
+    def setUp(self):
+        opts = Opt()
+        opts.sl = 32
+        spec = {"players": [], "mobs": [], "item_stacks": [], "agent": {}}
+        spec["coord_shift"] = (-16, 0, -16)
+        self.world = World(opts, spec)
+
+    def test_get_idm_at_locs(self):
+        self.world.place_block(((3, 10, 4), (35, 1)))
+        d = self.world.get_idm_at_locs([(3, 10, 4), (3, 11, 4), (100, 0, 0)])
+        self.assertEqual(d, {(3, 10, 4): (35, 1), (3, 11, 4): (0, 0), (100, 0, 0): (7, 0)})
+        self.assertEqual(self.world.blocks_to_dict()[(3, 10, 4)], (35, 1))
+
+    def test_line_of_sight(self):
+        target = (3, 20, 4)
+        self.world.place_block((target, (35, 1)))
+        eye = np.array((-5.0, 25.0, 9.0))
+        yaw, pitch = yaw_pitch(np.array(target) - eye)
+        self.assertEqual(self.world.get_line_of_sight(tuple(eye), yaw, pitch), target)
+
+        # a block in the way
+        self.world.place_block(((-1, 22, 7), (35, 2)))
+        self.assertEqual(self.world.get_line_of_sight(tuple(eye), yaw, pitch), (-1, 22, 7))
+
+        # looking up, into the sky
+        self.assertIsNone(self.world.get_line_of_sight(tuple(eye), 0.0, 1.5))
+
+    def test_in_process_mover(self):
+        mover = InProcessPyWorldMover(self.world, name="bot", loc=(0, 10, 0))
+        other = InProcessPyWorldMover(self.world, name="other", loc=(5, 10, 5))
+        self.world.blocks[:] = 0
+        mover.step_pos_x()
+        self.assertEqual(tuple(mover.get_player().pos), (1, 10, 0))
+
+        mover.set_held_item((35, 4))
+        self.assertTrue(mover.place_block(2, 10, 0))
+        self.assertTrue(mover.get_blocks(2, 2, 10, 10, 0, 0)[0, 0, 0].tolist() == [35, 4])
+        # there is no room for the player in the block
+        mover.step_pos_x()
+        self.assertEqual(tuple(mover.get_player().pos), (1, 10, 0))
+        self.assertTrue(mover.dig(2, 10, 0))
+        self.assertEqual(len(other.get_changed_blocks()), 1)
+        self.assertEqual(len(other.get_changed_blocks()), 0)
+
+        # yaw 0 looks along +z, yaw pi / 2 along -x
+        mover.set_look(0.0, 0.0)
+        mover.step_forward()
+        self.assertEqual(tuple(mover.get_player().pos), (1, 10, 1))
+        mover.set_look(np.pi / 2, 0.0)
+        mover.step_forward()
+        self.assertEqual(tuple(mover.get_player().pos), (0, 10, 1))
+
+        mover.send_chat("hello")
+        self.assertEqual(other.get_incoming_chats(), ["<bot> hello"])
+
+    def test_step_mobs(self):
+        for name in ["cow", "chicken", "rabbit", "pig", "sheep"]:
+            mob = SimpleMob(make_mob_opts(name))
+            # without the random choices, step_mobs moves the mobs as SimpleMob.step does
+            mob.loiter_prob = 0
+            mob.direction_change_prob = 0
+            mob.add_to_world(self.world)
+        mobs = self.world.mobs
+        copies = copy.deepcopy(mobs)
+        for _ in range(20):
+            for m in mobs:
+                m.step()
+            step_mobs(copies)
+            for m, c in zip(mobs, copies):
+                self.assertTrue(np.allclose(m.pos, c.pos))
+                # the new directions after hitting a wall are random
+                c.direction = m.direction.copy()
+
+
+if __name__ == "__main__":
+    unittest.main()
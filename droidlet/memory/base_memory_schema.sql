@@ -12,6 +12,7 @@ CREATE TABLE Memories (
     attended_time           INTEGER         NOT NULL DEFAULT 0,
     is_snapshot             BOOLEAN         NOT NULL DEFAULT FALSE
 );
+CREATE INDEX MemoriesNodeType ON Memories(node_type);
 
 CREATE TRIGGER MemoryRemoved AFTER DELETE ON Memories
     BEGIN INSERT INTO Updates(uuid, update_type) VALUES (OLD.uuid, 'delete');
@@ -26,6 +27,25 @@ CREATE TABLE Updates (
     update_type             TEXT
 );
 
+-- change log for readers that follow the memory incrementally (e.g. the dashboard).
+-- each memory has at most one row, with the version of its last change; the
+-- Updates log turns changes to other tables into updates of the Memories row.
+-- see AgentMemory.get_changes, old rows are removed with AgentMemory.prune_changes
+CREATE TABLE MemoryChanges (
+    version                 INTEGER         PRIMARY KEY AUTOINCREMENT,
+    uuid                    NCHAR(36)       NOT NULL UNIQUE ON CONFLICT REPLACE
+);
+
+CREATE TRIGGER MemoryChangesInsert AFTER INSERT ON Memories
+    BEGIN INSERT INTO MemoryChanges(uuid) VALUES (NEW.uuid);
+END;
+CREATE TRIGGER MemoryChangesUpdate AFTER UPDATE ON Memories
+    BEGIN INSERT INTO MemoryChanges(uuid) VALUES (NEW.uuid);
+END;
+CREATE TRIGGER MemoryChangesDelete AFTER DELETE ON Memories
+    BEGIN INSERT INTO MemoryChanges(uuid) VALUES (OLD.uuid);
+END;
+
 CREATE TABLE Chats (
     uuid    NCHAR(36)       PRIMARY KEY,
     speaker VARCHAR(255)    NOT NULL,
@@ -59,6 +79,44 @@ CREATE TRIGGER RefObjUpdate AFTER UPDATE ON ReferenceObjects
     BEGIN INSERT INTO Updates(uuid, update_type) VALUES (OLD.uuid, 'update');
 END;
 
+-- R-tree of the bounds of the ReferenceObjects with a position, for spatial searches
+-- (see MemorySearcher.search_box and search_nearest).  id is the rowid of the
+-- ReferenceObjects row.  the rtree stores the box_ coordinates as 32 bit floats
+-- rounded outwards, so it can only narrow a search down; the exact bounds are kept
+-- in the min_/max_ columns.  here the bounds are the point (x, y, z), the mc schema
+-- replaces these triggers to use the bounds of voxel objects
+CREATE VIRTUAL TABLE ReferenceObjectBounds USING rtree(
+    id,
+    box_min_x, box_max_x,
+    box_min_y, box_max_y,
+    box_min_z, box_max_z,
+    +uuid,
+    +min_x, +max_x,
+    +min_y, +max_y,
+    +min_z, +max_z
+);
+
+CREATE TRIGGER RefObjBoundsInsert AFTER INSERT ON ReferenceObjects
+    WHEN NEW.x IS NOT NULL AND NEW.y IS NOT NULL AND NEW.z IS NOT NULL
+    BEGIN
+    INSERT OR REPLACE INTO ReferenceObjectBounds VALUES (
+        NEW.rowid, NEW.x, NEW.x, NEW.y, NEW.y, NEW.z, NEW.z,
+        NEW.uuid, NEW.x, NEW.x, NEW.y, NEW.y, NEW.z, NEW.z
+    );
+END;
+CREATE TRIGGER RefObjBoundsUpdate AFTER UPDATE OF x, y, z ON ReferenceObjects
+    WHEN OLD.x IS NOT NEW.x OR OLD.y IS NOT NEW.y OR OLD.z IS NOT NEW.z
+    BEGIN
+    DELETE FROM ReferenceObjectBounds WHERE id=OLD.rowid;
+    INSERT INTO ReferenceObjectBounds SELECT
+        NEW.rowid, NEW.x, NEW.x, NEW.y, NEW.y, NEW.z, NEW.z,
+        NEW.uuid, NEW.x, NEW.x, NEW.y, NEW.y, NEW.z, NEW.z
+        WHERE NEW.x IS NOT NULL AND NEW.y IS NOT NULL AND NEW.z IS NOT NULL;
+END;
+CREATE TRIGGER RefObjBoundsDelete AFTER DELETE ON ReferenceObjects
+    BEGIN DELETE FROM ReferenceObjectBounds WHERE id=OLD.rowid;
+END;
+
 
 CREATE TABLE ArchivedReferenceObjects (
     uuid        NCHAR(36)       PRIMARY KEY,
@@ -157,6 +215,10 @@ CREATE INDEX TriplesPredTextObjText ON Triples(pred_text, obj_text);
 CREATE TRIGGER TriplesUpdate AFTER UPDATE ON Triples
     BEGIN INSERT INTO Updates(uuid, update_type) VALUES (OLD.uuid, 'update');
 END;
+-- a triple can be removed without removing its Memories row
+CREATE TRIGGER TriplesDelete AFTER DELETE ON Triples
+    BEGIN INSERT INTO MemoryChanges(uuid) VALUES (OLD.uuid);
+END;
 
 
 CREATE TABLE NamedAbstractions(
@@ -0,0 +1,45 @@
+"""
+Copyright (c) Facebook, Inc. and its affiliates.
+"""
+# flake8: noqa
+
+import argparse
+import time
+from droidlet.memory.craftassist.mc_memory import MCAgentMemory
+
+
+def replay_build(sx, sy, sz, dig):
+    """replays a build of a sx * sy * sz box of blocks, and then a dig of its last dig blocks,
+    through the perception update path"""
+    memory = MCAgentMemory(load_minecraft_specs=False, load_block_types=False)
+    build = [(x, y, z) for y in range(sy) for x in range(sx) for z in range(sz)]
+
+    t = time.perf_counter()
+    with memory.batch():
+        for xyz in build:
+            memory.maybe_add_block_to_memory(True, False, True, xyz, (1, 0))
+    place_time = time.perf_counter() - t
+
+    t = time.perf_counter()
+    with memory.batch():
+        for xyz in build[-dig:]:
+            memory.maybe_remove_block_from_memory(xyz, (0, 0), [])
+    dig_time = time.perf_counter() - t
+
+    print(
+        "{} block build: {:.3f} s, {} block dig: {:.3f} s".format(
+            len(build), place_time, dig, dig_time
+        )
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--size", type=int, nargs=3, default=[40, 10, 25], help="x y z")
+    parser.add_argument("--dig", type=int, default=1000, help="blocks dug after the build")
+    args = parser.parse_args()
+    replay_build(*args.size, args.dig)
+
+
+if __name__ == "__main__":
+    main()
@@ -45,16 +45,16 @@ class VoxelCounter(Attribute):
                 if self.block_data:
                     count = len([idm for idm in mems[i].blocks.values() if allowed_idm(idm)])
                 else:
-                    count = len(mems[i].blocks)
+                    count = mems[i].voxel_count
             elif mems[i].NODE_TYPE == "InstSeg":
                 if self.block_data:
                     # FIXME?:
                     triple_objs = [t[2] for t in self.memory.get_triples(subj=mems[i].memid)]
                     desired_objs = [t["obj_text"] for t in self.block_data]
                     if all([t in triple_objs for t in desired_objs]):
-                        count = len(mems[i].blocks)
+                        count = mems[i].voxel_count
                 else:
-                    count = len(mems[i].blocks)
+                    count = mems[i].voxel_count
             else:
                 count = 0
             counts.append(count)
@@ -4,10 +4,11 @@ Copyright (c) Facebook, Inc. and its affiliates.
 import copy
 import os
 import random
-from collections import namedtuple
+import uuid
+from collections import deque, namedtuple
 from typing import Optional, List
 from droidlet.memory.sql_memory import AgentMemory, DEFAULT_PIXELS_PER_UNIT
-from droidlet.base_util import diag_adjacent, IDM, XYZ, Block, npy_to_blocks_list
+from droidlet.base_util import IDM, XYZ, Block, npy_to_blocks_list
 from droidlet.memory.memory_nodes import (  # noqa
     TaskNode,
     PlayerNode,
@@ -31,6 +32,7 @@ from .mc_memory_nodes import (  # noqa
     SchematicNode,
     NODELIST,
 )
+from .voxel_index import VoxelIndex
 
 PERCEPTION_RANGE = 64
 
@@ -42,6 +44,9 @@ SCHEMAS = [
 
 SCHEMA = os.path.join(os.path.dirname(__file__), "memory_schema.sql")
 
+# how many of the blocks perception saw change are kept for get_block_changes
+BLOCK_CHANGES_KEPT = 4096
+
 THROTTLING_TICK_UPPER_LIMIT = 64
 THROTTLING_TICK_LOWER_LIMIT = 4
 
@@ -75,6 +80,8 @@ class MCAgentMemory(AgentMemory):
             coordinate_transforms=coordinate_transforms,
             place_field_pixels_per_unit=place_field_pixels_per_unit,
         )
+        self.voxel_index = VoxelIndex()
+        self.voxel_index.attach(self.db)
         self.low_level_block_data = agent_low_level_data.get("block_data", {})
         self.banned_default_behaviors = []  # FIXME: move into triple store?
         self._safe_pickle_saved_attrs = {}
@@ -82,8 +89,13 @@ class MCAgentMemory(AgentMemory):
         self.check_inside_perception = agent_low_level_data.get("check_inside", None)
         self.dances = {}
         self.perception_range = preception_range
+        # the last BLOCK_CHANGES_KEPT changed blocks, and how many there have been since init
+        self.block_changes = deque(maxlen=BLOCK_CHANGES_KEPT)
+        self.block_changes_count = 0
+        self.block_changes_epoch = uuid.uuid4().hex
         if copy_from_backup is not None:
             copy_from_backup.backup(self.db)
+            self.voxel_index.rebuild(self.db)
             self.make_self_mem()
         else:
             self._load_schematics(
@@ -128,184 +140,212 @@ class MCAgentMemory(AgentMemory):
         """
         if not perception_output:
             return areas_to_perceive
-        output = {}
-        updated_areas_to_perceive = areas_to_perceive
-        """Perform update the memory with input from low_level perception module"""
-        # 1. Handle all mobs in agent's perception range
-        if perception_output.mobs:
-            map_changes = []
-            for mob in perception_output.mobs:
-                mob_memid = self.set_mob_position(mob)
-                mp = (mob.pos.x, mob.pos.y, mob.pos.z)
-                map_changes.append(
-                    {"pos": mp, "is_obstacle": False, "memid": mob_memid, "is_move": True}
-                )
-            # FIXME track these semi-automatically...
-            self.place_field.update_map(map_changes)
-        # 2. Handle all items that the agent can pick up in-game
-        if perception_output.agent_pickable_items:
-            # FIXME PUT IN MEMORY PROPERLY
-            # 2.1 Items that are in perception range
-            if perception_output.agent_pickable_items["in_perception_items"]:
-                for pickable_items in perception_output.agent_pickable_items[
-                    "in_perception_items"
-                ]:
-                    self.set_item_stack_position(pickable_items)
-            # 2.2 Update previous pickable_item_stack based on perception
-            if perception_output.agent_pickable_items["all_items"]:
-                # Note: item stacks are not stored properly in memory right now @Yuxuan to fix this.
-                old_item_stacks = self.get_all_item_stacks()
-                if old_item_stacks:
-                    for old_item_stack in old_item_stacks:
-                        memid = old_item_stack[0]
-                        eid = old_item_stack[1]
-                        # NIT3: return untag set and tag set
-                        if eid not in perception_output.agent_pickable_items["all_items"]:
-                            self.untag(memid, "_on_ground")
-                        else:
-                            self.tag(memid, "_on_ground")
-
-        # 3. Update agent's current position and attributes in memory
-        if perception_output.agent_attributes:
-            agent_player = perception_output.agent_attributes
-            memid = self.get_player_by_eid(agent_player.entityId).memid
-            cmd = (
-                "UPDATE ReferenceObjects SET eid=?, name=?, x=?,  y=?, z=?, pitch=?, yaw=? WHERE "
-            )
-            cmd = cmd + "uuid=?"
-            self.db_write(
-                cmd,
-                agent_player.entityId,
-                agent_player.name,
-                agent_player.pos.x,
-                agent_player.pos.y,
-                agent_player.pos.z,
-                agent_player.look.pitch,
-                agent_player.look.yaw,
-                memid,
-            )
-            ap = (agent_player.pos.x, agent_player.pos.y, agent_player.pos.z)
-            self.place_field.update_map(
-                [{"pos": ap, "is_obstacle": True, "memid": memid, "is_move": True}]
-            )
-
-        # 4. Update other in-game players in agent's memory
-        if perception_output.other_player_list:
-            player_list = perception_output.other_player_list
-            for player, location in player_list:
-                mem = self.get_player_by_eid(player.entityId)
-                if mem is None:
-                    memid = PlayerNode.create(self, player)
-                else:
-                    memid = mem.memid
+        # apply the whole perception update as one transaction; the commit,
+        # updated_time bookkeeping and "memory" hooks are flushed once at the end
+        with self.batch():
+            output = {}
+            updated_areas_to_perceive = areas_to_perceive
+            """Perform update the memory with input from low_level perception module"""
+            # 1. Handle all mobs in agent's perception range
+            if perception_output.mobs:
+                map_changes = []
+                for mob in perception_output.mobs:
+                    mob_memid = self.set_mob_position(mob)
+                    mp = (mob.pos.x, mob.pos.y, mob.pos.z)
+                    map_changes.append(
+                        {"pos": mp, "is_obstacle": False, "memid": mob_memid, "is_move": True}
+                    )
+                # FIXME track these semi-automatically...
+                self.place_field.update_map(map_changes)
+            # 2. Handle all items that the agent can pick up in-game
+            if perception_output.agent_pickable_items:
+                # FIXME PUT IN MEMORY PROPERLY
+                # 2.1 Items that are in perception range
+                if perception_output.agent_pickable_items["in_perception_items"]:
+                    for pickable_items in perception_output.agent_pickable_items[
+                        "in_perception_items"
+                    ]:
+                        self.set_item_stack_position(pickable_items)
+                # 2.2 Update previous pickable_item_stack based on perception
+                if perception_output.agent_pickable_items["all_items"]:
+                    # Note: item stacks are not stored properly in memory right now @Yuxuan to fix this.
+                    old_item_stacks = self.get_all_item_stacks()
+                    if old_item_stacks:
+                        for old_item_stack in old_item_stacks:
+                            memid = old_item_stack[0]
+                            eid = old_item_stack[1]
+                            # NIT3: return untag set and tag set
+                            if eid not in perception_output.agent_pickable_items["all_items"]:
+                                self.untag(memid, "_on_ground")
+                            else:
+                                self.tag(memid, "_on_ground")
+
+            # 3. Update agent's current position and attributes in memory
+            if perception_output.agent_attributes:
+                agent_player = perception_output.agent_attributes
+                memid = self.get_player_by_eid(agent_player.entityId).memid
                 cmd = "UPDATE ReferenceObjects SET eid=?, name=?, x=?,  y=?, z=?, pitch=?, yaw=? WHERE "
                 cmd = cmd + "uuid=?"
                 self.db_write(
                     cmd,
-                    player.entityId,
-                    player.name,
-                    player.pos.x,
-                    player.pos.y,
-                    player.pos.z,
-                    player.look.pitch,
-                    player.look.yaw,
+                    agent_player.entityId,
+                    agent_player.name,
+                    agent_player.pos.x,
+                    agent_player.pos.y,
+                    agent_player.pos.z,
+                    agent_player.look.pitch,
+                    agent_player.look.yaw,
                     memid,
                 )
-                pp = (player.pos.x, player.pos.y, player.pos.z)
+                ap = (agent_player.pos.x, agent_player.pos.y, agent_player.pos.z)
                 self.place_field.update_map(
-                    [{"pos": pp, "is_obstacle": True, "memid": memid, "is_move": True}]
+                    [{"pos": ap, "is_obstacle": True, "memid": memid, "is_move": True}]
                 )
-                memids = self._db_read_one(
-                    'SELECT uuid FROM ReferenceObjects WHERE ref_type="attention" AND type_name=?',
-                    player.entityId,
-                )
-                if memids:
+
+            # 4. Update other in-game players in agent's memory
+            if perception_output.other_player_list:
+                player_list = perception_output.other_player_list
+                for player, location in player_list:
+                    mem = self.get_player_by_eid(player.entityId)
+                    if mem is None:
+                        memid = PlayerNode.create(self, player)
+                    else:
+                        memid = mem.memid
+                    cmd = "UPDATE ReferenceObjects SET eid=?, name=?, x=?,  y=?, z=?, pitch=?, yaw=? WHERE "
+                    cmd = cmd + "uuid=?"
                     self.db_write(
-                        "UPDATE ReferenceObjects SET x=?, y=?, z=? WHERE uuid=?",
-                        location[0],
-                        location[1],
-                        location[2],
-                        memids[0],
+                        cmd,
+                        player.entityId,
+                        player.name,
+                        player.pos.x,
+                        player.pos.y,
+                        player.pos.z,
+                        player.look.pitch,
+                        player.look.yaw,
+                        memid,
+                    )
+                    pp = (player.pos.x, player.pos.y, player.pos.z)
+                    self.place_field.update_map(
+                        [{"pos": pp, "is_obstacle": True, "memid": memid, "is_move": True}]
+                    )
+                    memids = self._db_read_one(
+                        'SELECT uuid FROM ReferenceObjects WHERE ref_type="attention" AND type_name=?',
+                        player.entityId,
+                    )
+                    if memids:
+                        self.db_write(
+                            "UPDATE ReferenceObjects SET x=?, y=?, z=? WHERE uuid=?",
+                            location[0],
+                            location[1],
+                            location[2],
+                            memids[0],
+                        )
+                    else:
+                        AttentionNode.create(self, location, attender=player.entityId)
+
+            # 5. Update the state of the world when a block is changed.
+            if perception_output.changed_block_attributes:
+                for (xyz, idm) in perception_output.changed_block_attributes:
+                    self.block_changes.append((xyz, idm))
+                    self.block_changes_count += 1
+                    # 5.1 Update old instance segmentation if needed
+                    self.maybe_remove_inst_seg(xyz)
+
+                    # 5.2 Update agent's memory with blocks that have been destroyed.
+                    updated_areas_to_perceive = self.maybe_remove_block_from_memory(
+                        xyz, idm, areas_to_perceive
+                    )
+
+                    # 5.3 Update blocks in memory when any change in the environment is caused either by agent or player
+                    (
+                        interesting,
+                        player_placed,
+                        agent_placed,
+                    ) = perception_output.changed_block_attributes[(xyz, idm)]
+                    self.maybe_add_block_to_memory(
+                        interesting, player_placed, agent_placed, xyz, idm
                     )
-                else:
-                    AttentionNode.create(self, location, attender=player.entityId)
-
-        # 5. Update the state of the world when a block is changed.
-        if perception_output.changed_block_attributes:
-            for (xyz, idm) in perception_output.changed_block_attributes:
-                # 5.1 Update old instance segmentation if needed
-                self.maybe_remove_inst_seg(xyz)
-
-                # 5.2 Update agent's memory with blocks that have been destroyed.
-                updated_areas_to_perceive = self.maybe_remove_block_from_memory(
-                    xyz, idm, areas_to_perceive
-                )
 
-                # 5.3 Update blocks in memory when any change in the environment is caused either by agent or player
-                (
-                    interesting,
-                    player_placed,
-                    agent_placed,
-                ) = perception_output.changed_block_attributes[(xyz, idm)]
-                self.maybe_add_block_to_memory(interesting, player_placed, agent_placed, xyz, idm)
-
-        """Now perform update the memory with input from heuristic perception module"""
-        # 1. Process everything in area to attend for perception
-        if perception_output.in_perceive_area:
-            # 1.1 Add colors of all block objects
-            if perception_output.in_perceive_area["block_object_attributes"]:
-                for block_object_attr in perception_output.in_perceive_area[
-                    "block_object_attributes"
-                ]:
-                    block_object, color_tags = block_object_attr
-                    memid = BlockObjectNode.create(self, block_object)
-                    for color_tag in list(set(color_tags)):
-                        self.add_triple(subj=memid, pred_text="has_colour", obj_text=color_tag)
-            # 1.2 Update all holes with their block type in memory
-            if perception_output.in_perceive_area["holes"]:
-                self.add_holes_to_mem(perception_output.in_perceive_area["holes"])
-            # 1.3 Update tags of air-touching blocks
-            if "airtouching_blocks" in perception_output.in_perceive_area:
-                for c, tags in perception_output.in_perceive_area["airtouching_blocks"]:
-                    InstSegNode.create(self, c, tags=tags)
-        # 2. Process everything near agent's current position
-        if perception_output.near_agent:
-            # 2.1 Add colors of all block objects
-            if perception_output.near_agent["block_object_attributes"]:
-                for block_object_attr in perception_output.near_agent["block_object_attributes"]:
-                    block_object, color_tags = block_object_attr
-                    memid = BlockObjectNode.create(self, block_object)
-                    for color_tag in list(set(color_tags)):
-                        self.add_triple(subj=memid, pred_text="has_colour", obj_text=color_tag)
-            # 2.2 Update all holes with their block type in memory
-            if perception_output.near_agent["holes"]:
-                self.add_holes_to_mem(perception_output.near_agent["holes"])
-            # 2.3 Update tags of air-touching blocks
-            if "airtouching_blocks" in perception_output.near_agent:
-                for c, tags in perception_output.near_agent["airtouching_blocks"]:
-                    InstSegNode.create(self, c, tags=tags)
-
-        """Update the memory with labeled blocks from SubComponent classifier"""
-        if perception_output.labeled_blocks:
-            for label, locations in perception_output.labeled_blocks.items():
-                InstSegNode.create(self, locations, [label])
-
-        """Update the memory with holes"""
-        if perception_output.holes:
-            hole_memories = self.add_holes_to_mem(perception_output.holes)
-            output["holes"] = hole_memories
-
-        output["areas_to_perceive"] = updated_areas_to_perceive
-        return output
+            """Now perform update the memory with input from heuristic perception module"""
+            # 1. Process everything in area to attend for perception
+            if perception_output.in_perceive_area:
+                # 1.1 Add colors of all block objects
+                if perception_output.in_perceive_area["block_object_attributes"]:
+                    for block_object_attr in perception_output.in_perceive_area[
+                        "block_object_attributes"
+                    ]:
+                        block_object, color_tags = block_object_attr
+                        memid = BlockObjectNode.create(self, block_object)
+                        for color_tag in list(set(color_tags)):
+                            self.add_triple(subj=memid, pred_text="has_colour", obj_text=color_tag)
+                # 1.2 Update all holes with their block type in memory
+                if perception_output.in_perceive_area["holes"]:
+                    self.add_holes_to_mem(perception_output.in_perceive_area["holes"])
+                # 1.3 Update tags of air-touching blocks
+                if "airtouching_blocks" in perception_output.in_perceive_area:
+                    for c, tags in perception_output.in_perceive_area["airtouching_blocks"]:
+                        InstSegNode.create(self, c, tags=tags)
+            # 2. Process everything near agent's current position
+            if perception_output.near_agent:
+                # 2.1 Add colors of all block objects
+                if perception_output.near_agent["block_object_attributes"]:
+                    for block_object_attr in perception_output.near_agent[
+                        "block_object_attributes"
+                    ]:
+                        block_object, color_tags = block_object_attr
+                        memid = BlockObjectNode.create(self, block_object)
+                        for color_tag in list(set(color_tags)):
+                            self.add_triple(subj=memid, pred_text="has_colour", obj_text=color_tag)
+                # 2.2 Update all holes with their block type in memory
+                if perception_output.near_agent["holes"]:
+                    self.add_holes_to_mem(perception_output.near_agent["holes"])
+                # 2.3 Update tags of air-touching blocks
+                if "airtouching_blocks" in perception_output.near_agent:
+                    for c, tags in perception_output.near_agent["airtouching_blocks"]:
+                        InstSegNode.create(self, c, tags=tags)
+
+            """Update the memory with labeled blocks from SubComponent classifier"""
+            if perception_output.labeled_blocks:
+                for label, locations in perception_output.labeled_blocks.items():
+                    InstSegNode.create(self, locations, [label])
+
+            """Update the memory with holes"""
+            if perception_output.holes:
+                hole_memories = self.add_holes_to_mem(perception_output.holes)
+                output["holes"] = hole_memories
+
+            output["areas_to_perceive"] = updated_areas_to_perceive
+            return output
+
+    def get_block_changes(self, since=None):
+        """
+        the blocks perception saw change since position since
+
+        Args:
+            since: a position returned by an earlier call, or None
+
+        Returns:
+            the current position, and a list of the (xyz, idm) of the changed blocks in the
+            order they changed; or None instead of the list if since is None or if some of
+            the changes since then are no longer kept
+
+        Examples::
+            >>> position, _ = memory.get_block_changes()
+            >>> position, changes = memory.get_block_changes(position)
+        """
+        position = (self.block_changes_epoch, self.block_changes_count)
+        if since is None or since[0] != self.block_changes_epoch:
+            return position, None
+        n = self.block_changes_count - since[1]
+        if n < 0 or n > len(self.block_changes):
+            return position, None
+        return position, list(self.block_changes)[len(self.block_changes) - n :]
 
     def maybe_add_block_to_memory(self, interesting, player_placed, agent_placed, xyz, idm):
         if not interesting:
             return
 
-        adjacent = [
-            self.get_object_info_by_xyz(a, "BlockObjects", just_memid=False)
-            for a in diag_adjacent(xyz)
-        ]
+        adjacent = self.voxel_index.get_neighbours(xyz, "BlockObjects")
         if idm[0] == 0:
             # block removed / air block added
             adjacent_memids = [a[0][0] for a in adjacent if len(a) > 0 and a[0][1] == 0]
@@ -380,13 +420,7 @@ class MCAgentMemory(AgentMemory):
                 self.remove_voxel(*xyz, table)
                 # check if the whole column is removed:
                 # FIXME, eventually want y slices
-                r = self._db_read(
-                    "SELECT uuid FROM VoxelObjects WHERE x=? AND z=? and ref_type=?",
-                    xyz[0],
-                    xyz[2],
-                    tables[0],
-                )
-                if len(r) == 0:
+                if self.voxel_index.column_count(xyz[0], xyz[2], tables[0]) == 0:
                     self.place_field.update_map([{"pos": xyz, "is_delete": True}])
                 local_areas_to_perceive.append((xyz, 3))
         return local_areas_to_perceive
@@ -423,9 +457,18 @@ class MCAgentMemory(AgentMemory):
     ### Voxels  ###
     ###############
 
-    # FIXME: move these to VoxelObjectNode
-    # count updates are done by hand to not need to count all voxels every time
-    # use these functions, don't add/delete/modify voxels with raw sql
+    def _rollback(self):
+        super()._rollback()
+        # the rolled back writes were already mirrored in the index
+        self.voxel_index.rebuild(self.db)
+
+    def restore(self, path: str):
+        super().restore(path)
+        self.voxel_index.rebuild(self.db)
+
+    # the voxel_count, mean location and bounds of a VoxelObject in ReferenceObjects
+    # are kept up to date by triggers on the VoxelObjects table (see mc_memory_schema.sql).
+    # _update_voxel_count and _update_voxel_mean are only needed to fix these by hand
     def _update_voxel_count(self, memid, dn):
         """Update voxel count of a reference object with an amount
         equal to : dn"""
@@ -448,38 +491,29 @@ class MCAgentMemory(AgentMemory):
         # TODO warn/error if no such memory?
         assert count != 0
         if old_loc:
-            b = 1 / count
-            if count > 0:
-                a = (count - 1) / count
-            else:
-                a = (1 - count) / (-count)
-            new_loc = (
-                old_loc[0] * a + loc[0] * b,
-                old_loc[1] * a + loc[1] * b,
-                old_loc[2] * a + loc[2] * b,
-            )
+            new_loc = self._voxel_mean(old_loc, count, loc)
             self.db_write(
                 "UPDATE ReferenceObjects SET x=?, y=?, z=? WHERE uuid=?", *new_loc, memid
             )
             return new_loc
 
-    def remove_voxel(self, x, y, z, ref_type):
-        """Remove a voxel at (x, y, z) and of a given ref_type,
-        and update the voxel count and mean as a result of the change"""
-        memids = self._db_read_one(
-            "SELECT uuid FROM VoxelObjects WHERE x=? and y=? and z=? and ref_type=?",
-            x,
-            y,
-            z,
-            ref_type,
+    def _voxel_mean(self, old_loc, count, loc):
+        b = 1 / count
+        if count > 0:
+            a = (count - 1) / count
+        else:
+            a = (1 - count) / (-count)
+        return (
+            old_loc[0] * a + loc[0] * b,
+            old_loc[1] * a + loc[1] * b,
+            old_loc[2] * a + loc[2] * b,
         )
-        if not memids:
+
+    def remove_voxel(self, x, y, z, ref_type):
+        """Remove a voxel at (x, y, z) and of a given ref_type"""
+        if not self.voxel_index.get_memids((x, y, z), ref_type):
             # TODO error/warning?
             return
-        memid = memids[0]
-        c = self._update_voxel_count(memid, -1)
-        if c > 0:
-            self._update_voxel_mean(memid, c, (x, y, z))
         self.db_write(
             "DELETE FROM VoxelObjects WHERE x=? AND y=? AND z=? and ref_type=?", x, y, z, ref_type
         )
@@ -499,24 +533,13 @@ class MCAgentMemory(AgentMemory):
         occupied by a different ref_type it will insert a new ref object even if update is True"""
 
         ((x, y, z), (b, m)) = block
-        old_memid = self._db_read_one(
-            "SELECT uuid FROM VoxelObjects WHERE x=? AND y=? AND z=? and ref_type=?",
-            x,
-            y,
-            z,
-            ref_type,
-        )
-        # add to voxel count
-        new_count = self._update_voxel_count(memid, 1)
-        assert new_count
-        self._update_voxel_mean(memid, new_count, (x, y, z))
-        if old_memid and update:
-            if old_memid != memid:
-                self.remove_voxel(x, y, z, ref_type)
-                cmd = "INSERT INTO VoxelObjects (uuid, bid, meta, updated, player_placed, agent_placed, ref_type, x, y, z) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)"
-            else:
-                cmd = "UPDATE VoxelObjects SET uuid=?, bid=?, meta=?, updated=?, player_placed=?, agent_placed=? WHERE ref_type=? AND x=? AND y=? AND z=?"
+        old_memids = self.voxel_index.get_memids((x, y, z), ref_type)
+        if old_memids and update and old_memids[0] == memid:
+            # the voxel is already counted in memid, just overwrite it
+            cmd = "UPDATE VoxelObjects SET uuid=?, bid=?, meta=?, updated=?, player_placed=?, agent_placed=? WHERE ref_type=? AND x=? AND y=? AND z=?"
         else:
+            if old_memids and update:
+                self.remove_voxel(x, y, z, ref_type)
             cmd = "INSERT INTO VoxelObjects (uuid, bid, meta, updated, player_placed, agent_placed, ref_type, x, y, z) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)"
         self.db_write(
             cmd, memid, b, m, self.get_time(), player_placed, agent_placed, ref_type, x, y, z
@@ -550,15 +573,10 @@ class MCAgentMemory(AgentMemory):
         Returns:
             Memory node(s) at a given location and of a given ref_type
         """
-        r = self._db_read(
-            "SELECT DISTINCT(uuid), bid, meta FROM VoxelObjects WHERE x=? AND y=? AND z=? and ref_type=?",
-            *xyz,
-            ref_type
-        )
         if just_memid:
-            return [memid for (memid, bid, meta) in r]
+            return self.voxel_index.get_memids(xyz, ref_type)
         else:
-            return r
+            return self.voxel_index.get(xyz, ref_type)
 
     # WARNING: these do not search archived/snapshotted block objects
     # TODO replace all these all through the codebase with generic counterparts
@@ -588,11 +606,7 @@ class MCAgentMemory(AgentMemory):
     def get_instseg_object_ids_by_xyz(self, xyz: XYZ) -> List[str]:
         """Get ids of memory nodes of ref_type: "inst_seg" using their
         location"""
-        r = self._db_read(
-            'SELECT DISTINCT(uuid) FROM VoxelObjects WHERE ref_type="inst_seg" AND x=? AND y=? AND z=?',
-            *xyz
-        )
-        return r
+        return [(memid,) for memid in self.voxel_index.get_memids(xyz, "inst_seg")]
 
     ####################
     ###  Schematics  ###
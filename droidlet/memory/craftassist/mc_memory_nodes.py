@@ -22,12 +22,19 @@ class VoxelObjectNode(ReferenceObjectNode):
     multiple voxels and uses VoxelObjects table to hold the
     location of the voxels; and ReferenceObjects to hold 'global' info
 
+    the position, bounds and voxel count come from the ReferenceObjects row,
+    which the VoxelObjects triggers keep up to date.  the voxels themselves are
+    only read the first time one of the voxel attributes is used.
+
     Args:
         agent_memory (AgentMemory): An AgentMemory object
         memid (string): Memory ID for this node
 
     Attributes:
-        locs (tuple): List of (x, y, z) tuples
+        voxel_count (int): number of voxels in the object
+        xyzs (np.ndarray): N x 3 int array with the (x, y, z) of each voxel
+        idms (np.ndarray): N x 2 array with the (blockid, meta) of each voxel
+        locs (list): List of (x, y, z) tuples
         blocks (dict): Dictionary of (x, y, z) -> (blockid, meta)
         update_times (dict): Dictionary of (x, y, z) -> time this was last updated
         player_placed (dict): Dictionary of (x, y, z) -> was this placed by player ?
@@ -50,59 +57,125 @@ class VoxelObjectNode(ReferenceObjectNode):
         if len(ref) == 0:
             raise Exception("no mention of this VoxelObject in ReferenceObjects Table")
         self.ref_info = ref[0]
-        voxels = self.agent_memory._db_read("SELECT * FROM VoxelObjects WHERE uuid=?", self.memid)
-        self.locs: List[tuple] = []
-        self.blocks: Dict[tuple, tuple] = {}
-        self.update_times: Dict[tuple, int] = {}
-        self.player_placed: Dict[tuple, bool] = {}
-        self.agent_placed: Dict[tuple, bool] = {}
-        for v in voxels:
-            loc = (v[1], v[2], v[3])
-            self.locs.append(loc)
-            if v[4]:
-                assert v[5] is not None
-                self.blocks[loc] = (v[4], v[5])
-            else:
-                self.blocks[loc] = (None, None)
-            self.agent_placed[loc] = v[6]
-            self.player_placed[loc] = v[7]
-            self.update_times[loc] = v[8]
-            # TODO assert these all the same?
-            self.memtype = v[9]
+        cols = self.agent_memory.get_table_columns("ReferenceObjects")
+        info = dict(zip(cols, self.ref_info))
+        self.voxel_count = info["voxel_count"] or 0
+        self._mean = (info["x"], info["y"], info["z"])
+        self._bounds = tuple(
+            info[c] for c in ["min_x", "max_x", "min_y", "max_y", "min_z", "max_z"]
+        )
+        self._voxels = None
+        self._voxel_dicts = None
+
+    def _load_voxels(self):
+        """read the voxels of this object into arrays, one row per voxel"""
+        if self._voxels is None:
+            r = self.agent_memory._db_read(
+                "SELECT x, y, z, bid, meta, agent_placed, player_placed, updated, ref_type FROM VoxelObjects WHERE uuid=?",
+                self.memid,
+            )
+            # bid/meta of voxels without a block are stored as NULL
+            v = np.array([row[:8] for row in r], dtype=object).reshape(-1, 8)
+            self._voxels = {
+                "xyzs": v[:, :3].astype(np.int64),
+                "idms": v[:, 3:5],
+                "agent_placed": v[:, 5],
+                "player_placed": v[:, 6],
+                "updated": v[:, 7],
+                # TODO assert these all the same?
+                "memtype": r[-1][8] if r else None,
+            }
+        return self._voxels
+
+    def _load_voxel_dicts(self):
+        """the voxel attributes as dicts keyed by (x, y, z), built from the arrays"""
+        if self._voxel_dicts is None:
+            v = self._load_voxels()
+            locs = [tuple(l) for l in v["xyzs"].tolist()]
+            blocks = {}
+            for loc, (b, m) in zip(locs, v["idms"].tolist()):
+                if b:
+                    assert m is not None
+                    blocks[loc] = (b, m)
+                else:
+                    blocks[loc] = (None, None)
+            self._voxel_dicts = {
+                "locs": locs,
+                "blocks": blocks,
+                "update_times": dict(zip(locs, v["updated"].tolist())),
+                "agent_placed": dict(zip(locs, v["agent_placed"].tolist())),
+                "player_placed": dict(zip(locs, v["player_placed"].tolist())),
+            }
+        return self._voxel_dicts
+
+    @property
+    def xyzs(self) -> np.ndarray:
+        return self._load_voxels()["xyzs"]
+
+    @property
+    def idms(self) -> np.ndarray:
+        return self._load_voxels()["idms"]
+
+    @property
+    def memtype(self):
+        return self._load_voxels()["memtype"]
+
+    @property
+    def locs(self) -> List[tuple]:
+        return self._load_voxel_dicts()["locs"]
+
+    @property
+    def blocks(self) -> Dict[tuple, tuple]:
+        return self._load_voxel_dicts()["blocks"]
+
+    @property
+    def update_times(self) -> Dict[tuple, int]:
+        return self._load_voxel_dicts()["update_times"]
+
+    @property
+    def player_placed(self) -> Dict[tuple, bool]:
+        return self._load_voxel_dicts()["player_placed"]
+
+    @property
+    def agent_placed(self) -> Dict[tuple, bool]:
+        return self._load_voxel_dicts()["agent_placed"]
 
     def get_pos(self) -> XYZ:
-        return cast(XYZ, tuple(int(x) for x in np.mean(self.locs, axis=0)))
+        if self._mean[0] is None:
+            return cast(XYZ, tuple(int(x) for x in np.mean(self.xyzs, axis=0)))
+        # the mean is updated incrementally, don't let rounding error move it
+        # across an integer before truncating
+        return cast(XYZ, tuple(int(x + np.sign(x) * 1e-6) for x in self._mean))
 
     def get_point_at_target(self) -> POINT_AT_TARGET:
-        point_min = [int(x) for x in np.min(self.locs, axis=0)]
-        point_max = [int(x) for x in np.max(self.locs, axis=0)]
-        return cast(POINT_AT_TARGET, point_min + point_max)
+        m0, M0, m1, M1, m2, M2 = self.get_bounds()
+        return cast(POINT_AT_TARGET, [int(m0), int(m1), int(m2), int(M0), int(M1), int(M2)])
 
     def get_bounds(self):
-        M = np.max(self.locs, axis=0)
-        m = np.min(self.locs, axis=0)
-        return m[0], M[0], m[1], M[1], m[2], M[2]
+        if self._bounds[0] is None:
+            M = np.max(self.xyzs, axis=0)
+            m = np.min(self.xyzs, axis=0)
+            return m[0], M[0], m[1], M[1], m[2], M[2]
+        return self._bounds
 
     def snapshot(self, agent_memory):
         archive_memid = self.new(agent_memory, snapshot=True)
-        for loc in self.locs:
-            cmd = "INSERT INTO ArchivedVoxelObjects (uuid, x, y, z, bid, meta, agent_placed, player_placed, updated, ref_type) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)"
-            values = (
-                archive_memid,
-                loc[0],
-                loc[1],
-                loc[2],
-                self.blocks[loc][0],
-                self.blocks[loc][1],
-                self.agent_placed[loc],
-                self.player_placed[loc],
-                self.update_times[loc],
-                self.memtype,
-            )
-            agent_memory.db_write(cmd, *values)
+        v = self._load_voxels()
+        cmd = "INSERT INTO ArchivedVoxelObjects (uuid, x, y, z, bid, meta, agent_placed, player_placed, updated, ref_type) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)"
+        for xyz, idm, ap, pp, u in zip(
+            v["xyzs"].tolist(),
+            v["idms"].tolist(),
+            v["agent_placed"].tolist(),
+            v["player_placed"].tolist(),
+            v["updated"].tolist(),
+        ):
+            agent_memory.db_write(cmd, archive_memid, *xyz, *idm, ap, pp, u, v["memtype"])
 
         archive_memid = self.new(agent_memory, snapshot=True)
-        cmd = "INSERT INTO ArchivedReferenceObjects (uuid, eid, x, y, z, yaw, pitch, name, type_name, ref_type, player_placed, agent_placed, created, updated, voxel_count) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)"
+        cols = agent_memory.get_table_columns("ReferenceObjects")
+        cmd = "INSERT INTO ArchivedReferenceObjects ({}) VALUES ({})".format(
+            ", ".join(cols), ", ".join(["?"] * len(cols))
+        )
         info = list(self.ref_info)
         info[0] = archive_memid
         agent_memory.db_write(cmd, *info)
@@ -164,8 +237,9 @@ class BlockObjectNode(VoxelObjectNode):
         cmd = "INSERT INTO ReferenceObjects (uuid, x, y, z, ref_type, voxel_count) VALUES ( ?, ?, ?, ?, ?, ?)"
         # TODO this is going to cause a bug, need better way to initialize and track mean loc
         memory.db_write(cmd, memid, 0, 0, 0, "BlockObjects", 0)
-        for block in blocks:
-            memory.upsert_block(block, memid, "BlockObjects")
+        with memory.batch():
+            for block in blocks:
+                memory.upsert_block(block, memid, "BlockObjects")
         memory.tag(memid, "_block_object")
         memory.tag(memid, "_VOXEL_OBJECT")
         memory.tag(memid, "_physical_object")
@@ -231,13 +305,8 @@ class InstSegNode(VoxelObjectNode):
         # check if instance segmentation object already exists in memory
         inst_memids = {}
         for xyz in locs:
-            m = memory._db_read(
-                'SELECT uuid from VoxelObjects WHERE ref_type="inst_seg" AND x=? AND y=? AND z=?',
-                *xyz
-            )
-            if len(m) > 0:
-                for memid in m:
-                    inst_memids[memid[0]] = True
+            for memid in memory.get_instseg_object_ids_by_xyz(xyz):
+                inst_memids[memid[0]] = True
         # FIXME just remember the locs in the first pass
         for m in inst_memids.keys():
             olocs = memory._db_read("SELECT x, y, z from VoxelObjects WHERE uuid=?", m)
@@ -250,9 +319,10 @@ class InstSegNode(VoxelObjectNode):
         # TODO check/assert this isn't there...
         cmd = "INSERT INTO ReferenceObjects (uuid, x, y, z, ref_type) VALUES ( ?, ?, ?, ?, ?)"
         memory.db_write(cmd, memid, loc[0], loc[1], loc[2], "inst_seg")
-        for loc in locs:
-            cmd = "INSERT INTO VoxelObjects (uuid, x, y, z, ref_type) VALUES ( ?, ?, ?, ?, ?)"
-            memory.db_write(cmd, memid, loc[0], loc[1], loc[2], "inst_seg")
+        cmd = "INSERT INTO VoxelObjects (uuid, x, y, z, ref_type) VALUES ( ?, ?, ?, ?, ?)"
+        with memory.batch():
+            for loc in locs:
+                memory.db_write(cmd, memid, loc[0], loc[1], loc[2], "inst_seg")
         memory.tag(memid, "_VOXEL_OBJECT")
         memory.tag(memid, "_inst_seg")
         memory.tag(memid, "_destructible")
@@ -268,15 +338,16 @@ class InstSegNode(VoxelObjectNode):
 
     def __init__(self, memory, memid: str):
         super().__init__(memory, memid)
-        r = memory._db_read("SELECT x, y, z FROM VoxelObjects WHERE uuid=?", self.memid)
-        self.locs = r
-        self.blocks = {l: (0, 0) for l in self.locs}
         tags = memory.get_triples(subj=self.memid, pred_text="has_tag")
         self.tags = []  # noqa: T484
         for tag in tags:
             if tag[2][0] != "_":
                 self.tags.append(tag[2])
 
+    @property
+    def blocks(self) -> Dict[tuple, tuple]:
+        return {l: (0, 0) for l in self.locs}
+
     def __repr__(self):
         return "<InstSeg Node @ {} with tags {} >".format(self.locs, self.tags)
 
@@ -398,6 +469,10 @@ class MobNode(ReferenceObjectNode):
         x, y, z = self.pos
         return x, x, y, y, z, z
 
+    @classmethod
+    def batch_pos(cls, xyz):
+        return xyz
+
 
 class ItemStackNode(ReferenceObjectNode):
     """A memory node for an item stack, which is something on the ground,
@@ -492,6 +567,10 @@ class ItemStackNode(ReferenceObjectNode):
         x, y, z = self.pos
         return x, x, y, y, z, z
 
+    @classmethod
+    def batch_pos(cls, xyz):
+        return xyz
+
 
 class SchematicNode(MemoryNode):
     """A memory node representing a plan for an object that could
@@ -522,15 +601,23 @@ class SchematicNode(MemoryNode):
 
     def __init__(self, agent_memory, memid: str):
         super().__init__(agent_memory, memid)
-        if memid in agent_memory.schematics.keys():
-            self.blocks = {
-                (x, y, z): (b, m) for ((x, y, z), (b, m)) in agent_memory.schematics[memid]
-            }
-        else:
-            r = self.agent_memory._db_read(
-                "SELECT x, y, z, bid, meta FROM Schematics WHERE uuid=?", self.memid
-            )
-            self.blocks = {(x, y, z): (b, m) for (x, y, z, b, m) in r}
+        self._blocks = None
+
+    @property
+    def blocks(self) -> Dict[tuple, tuple]:
+        # read the first time they are used
+        if self._blocks is None:
+            if self.memid in self.agent_memory.schematics.keys():
+                self._blocks = {
+                    (x, y, z): (b, m)
+                    for ((x, y, z), (b, m)) in self.agent_memory.schematics[self.memid]
+                }
+            else:
+                r = self.agent_memory._db_read(
+                    "SELECT x, y, z, bid, meta FROM Schematics WHERE uuid=?", self.memid
+                )
+                self._blocks = {(x, y, z): (b, m) for (x, y, z, b, m) in r}
+        return self._blocks
 
     @classmethod
     def create(cls, memory, blocks: Sequence[Block]) -> str:
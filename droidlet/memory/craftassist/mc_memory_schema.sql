@@ -12,6 +12,63 @@ ALTER TABLE ReferenceObjects
 ADD updated INTEGER;
 ALTER TABLE ReferenceObjects
 ADD voxel_count INTEGER;
+-- bounds of the voxels of a VoxelObject, NULL if it has none
+ALTER TABLE ReferenceObjects
+ADD min_x INTEGER;
+ALTER TABLE ReferenceObjects
+ADD max_x INTEGER;
+ALTER TABLE ReferenceObjects
+ADD min_y INTEGER;
+ALTER TABLE ReferenceObjects
+ADD max_y INTEGER;
+ALTER TABLE ReferenceObjects
+ADD min_z INTEGER;
+ALTER TABLE ReferenceObjects
+ADD max_z INTEGER;
+
+-- index the bounds of voxel objects in the ReferenceObjectBounds R-tree,
+-- and (x, y, z) for the other ReferenceObjects
+DROP TRIGGER RefObjBoundsInsert;
+DROP TRIGGER RefObjBoundsUpdate;
+CREATE TRIGGER RefObjBoundsInsert AFTER INSERT ON ReferenceObjects
+    WHEN COALESCE(NEW.min_x, NEW.x) IS NOT NULL
+        AND COALESCE(NEW.min_y, NEW.y) IS NOT NULL
+        AND COALESCE(NEW.min_z, NEW.z) IS NOT NULL
+    BEGIN
+    INSERT OR REPLACE INTO ReferenceObjectBounds VALUES (
+        NEW.rowid,
+        COALESCE(NEW.min_x, NEW.x), COALESCE(NEW.max_x, NEW.x),
+        COALESCE(NEW.min_y, NEW.y), COALESCE(NEW.max_y, NEW.y),
+        COALESCE(NEW.min_z, NEW.z), COALESCE(NEW.max_z, NEW.z),
+        NEW.uuid,
+        COALESCE(NEW.min_x, NEW.x), COALESCE(NEW.max_x, NEW.x),
+        COALESCE(NEW.min_y, NEW.y), COALESCE(NEW.max_y, NEW.y),
+        COALESCE(NEW.min_z, NEW.z), COALESCE(NEW.max_z, NEW.z)
+    );
+END;
+CREATE TRIGGER RefObjBoundsUpdate
+    AFTER UPDATE OF x, y, z, min_x, max_x, min_y, max_y, min_z, max_z ON ReferenceObjects
+    WHEN COALESCE(OLD.min_x, OLD.x) IS NOT COALESCE(NEW.min_x, NEW.x)
+        OR COALESCE(OLD.max_x, OLD.x) IS NOT COALESCE(NEW.max_x, NEW.x)
+        OR COALESCE(OLD.min_y, OLD.y) IS NOT COALESCE(NEW.min_y, NEW.y)
+        OR COALESCE(OLD.max_y, OLD.y) IS NOT COALESCE(NEW.max_y, NEW.y)
+        OR COALESCE(OLD.min_z, OLD.z) IS NOT COALESCE(NEW.min_z, NEW.z)
+        OR COALESCE(OLD.max_z, OLD.z) IS NOT COALESCE(NEW.max_z, NEW.z)
+    BEGIN
+    DELETE FROM ReferenceObjectBounds WHERE id=OLD.rowid;
+    INSERT INTO ReferenceObjectBounds SELECT
+        NEW.rowid,
+        COALESCE(NEW.min_x, NEW.x), COALESCE(NEW.max_x, NEW.x),
+        COALESCE(NEW.min_y, NEW.y), COALESCE(NEW.max_y, NEW.y),
+        COALESCE(NEW.min_z, NEW.z), COALESCE(NEW.max_z, NEW.z),
+        NEW.uuid,
+        COALESCE(NEW.min_x, NEW.x), COALESCE(NEW.max_x, NEW.x),
+        COALESCE(NEW.min_y, NEW.y), COALESCE(NEW.max_y, NEW.y),
+        COALESCE(NEW.min_z, NEW.z), COALESCE(NEW.max_z, NEW.z)
+        WHERE COALESCE(NEW.min_x, NEW.x) IS NOT NULL
+            AND COALESCE(NEW.min_y, NEW.y) IS NOT NULL
+            AND COALESCE(NEW.min_z, NEW.z) IS NOT NULL;
+END;
 
 
 
@@ -25,6 +82,18 @@ ALTER TABLE ArchivedReferenceObjects
 ADD updated INTEGER;
 ALTER TABLE ArchivedReferenceObjects
 ADD voxel_count INTEGER;
+ALTER TABLE ArchivedReferenceObjects
+ADD min_x INTEGER;
+ALTER TABLE ArchivedReferenceObjects
+ADD max_x INTEGER;
+ALTER TABLE ArchivedReferenceObjects
+ADD min_y INTEGER;
+ALTER TABLE ArchivedReferenceObjects
+ADD max_y INTEGER;
+ALTER TABLE ArchivedReferenceObjects
+ADD min_z INTEGER;
+ALTER TABLE ArchivedReferenceObjects
+ADD max_z INTEGER;
 
 
 
@@ -66,6 +135,7 @@ CREATE TABLE VoxelObjects (
     FOREIGN KEY(uuid) REFERENCES Memories(uuid) ON DELETE CASCADE
 );
 CREATE INDEX VoxelObjectsXYZ ON VoxelObjects(x, y, z);
+CREATE INDEX VoxelObjectsUuid ON VoxelObjects(uuid);
 CREATE TRIGGER VoxelObjectsDelete AFTER DELETE ON VoxelObjects
     WHEN ((SELECT COUNT(*) FROM VoxelObjects WHERE uuid=OLD.uuid LIMIT 1) == 0)
     BEGIN DELETE FROM Memories WHERE uuid=OLD.uuid;
@@ -82,6 +152,60 @@ END;
 CREATE TRIGGER VoxelObjectsBlockDelete AFTER DELETE ON VoxelObjects
     BEGIN INSERT INTO Updates(uuid, update_type) VALUES (OLD.uuid, 'update');
 END;
+-- keep the voxel_count, mean (x, y, z) and bounds of the ReferenceObjects row of a
+-- VoxelObject up to date; the bounds are only recomputed when a voxel on the boundary is removed
+CREATE TRIGGER VoxelObjectsRefObjInsert AFTER INSERT ON VoxelObjects
+    BEGIN
+    UPDATE ReferenceObjects SET
+        voxel_count = COALESCE(voxel_count, 0) + 1,
+        x = (COALESCE(x, 0) * COALESCE(voxel_count, 0) + NEW.x) / (COALESCE(voxel_count, 0) + 1.0),
+        y = (COALESCE(y, 0) * COALESCE(voxel_count, 0) + NEW.y) / (COALESCE(voxel_count, 0) + 1.0),
+        z = (COALESCE(z, 0) * COALESCE(voxel_count, 0) + NEW.z) / (COALESCE(voxel_count, 0) + 1.0),
+        min_x = MIN(COALESCE(min_x, NEW.x), NEW.x), max_x = MAX(COALESCE(max_x, NEW.x), NEW.x),
+        min_y = MIN(COALESCE(min_y, NEW.y), NEW.y), max_y = MAX(COALESCE(max_y, NEW.y), NEW.y),
+        min_z = MIN(COALESCE(min_z, NEW.z), NEW.z), max_z = MAX(COALESCE(max_z, NEW.z), NEW.z)
+        WHERE uuid=NEW.uuid;
+END;
+CREATE TRIGGER VoxelObjectsRefObjDelete AFTER DELETE ON VoxelObjects
+    BEGIN
+    UPDATE ReferenceObjects SET
+        voxel_count = voxel_count - 1,
+        x = CASE WHEN voxel_count > 1 THEN (x * voxel_count - OLD.x) / (voxel_count - 1.0) ELSE x END,
+        y = CASE WHEN voxel_count > 1 THEN (y * voxel_count - OLD.y) / (voxel_count - 1.0) ELSE y END,
+        z = CASE WHEN voxel_count > 1 THEN (z * voxel_count - OLD.z) / (voxel_count - 1.0) ELSE z END,
+        min_x = CASE WHEN OLD.x <= min_x THEN (SELECT MIN(x) FROM VoxelObjects WHERE uuid=OLD.uuid) ELSE min_x END,
+        max_x = CASE WHEN OLD.x >= max_x THEN (SELECT MAX(x) FROM VoxelObjects WHERE uuid=OLD.uuid) ELSE max_x END,
+        min_y = CASE WHEN OLD.y <= min_y THEN (SELECT MIN(y) FROM VoxelObjects WHERE uuid=OLD.uuid) ELSE min_y END,
+        max_y = CASE WHEN OLD.y >= max_y THEN (SELECT MAX(y) FROM VoxelObjects WHERE uuid=OLD.uuid) ELSE max_y END,
+        min_z = CASE WHEN OLD.z <= min_z THEN (SELECT MIN(z) FROM VoxelObjects WHERE uuid=OLD.uuid) ELSE min_z END,
+        max_z = CASE WHEN OLD.z >= max_z THEN (SELECT MAX(z) FROM VoxelObjects WHERE uuid=OLD.uuid) ELSE max_z END
+        WHERE uuid=OLD.uuid;
+END;
+CREATE TRIGGER VoxelObjectsRefObjUpdate AFTER UPDATE OF uuid, x, y, z ON VoxelObjects
+    WHEN (OLD.uuid IS NOT NEW.uuid OR OLD.x != NEW.x OR OLD.y != NEW.y OR OLD.z != NEW.z)
+    BEGIN
+    UPDATE ReferenceObjects SET
+        voxel_count = voxel_count - 1,
+        x = CASE WHEN voxel_count > 1 THEN (x * voxel_count - OLD.x) / (voxel_count - 1.0) ELSE x END,
+        y = CASE WHEN voxel_count > 1 THEN (y * voxel_count - OLD.y) / (voxel_count - 1.0) ELSE y END,
+        z = CASE WHEN voxel_count > 1 THEN (z * voxel_count - OLD.z) / (voxel_count - 1.0) ELSE z END,
+        min_x = CASE WHEN OLD.x <= min_x THEN (SELECT MIN(x) FROM VoxelObjects WHERE uuid=OLD.uuid) ELSE min_x END,
+        max_x = CASE WHEN OLD.x >= max_x THEN (SELECT MAX(x) FROM VoxelObjects WHERE uuid=OLD.uuid) ELSE max_x END,
+        min_y = CASE WHEN OLD.y <= min_y THEN (SELECT MIN(y) FROM VoxelObjects WHERE uuid=OLD.uuid) ELSE min_y END,
+        max_y = CASE WHEN OLD.y >= max_y THEN (SELECT MAX(y) FROM VoxelObjects WHERE uuid=OLD.uuid) ELSE max_y END,
+        min_z = CASE WHEN OLD.z <= min_z THEN (SELECT MIN(z) FROM VoxelObjects WHERE uuid=OLD.uuid) ELSE min_z END,
+        max_z = CASE WHEN OLD.z >= max_z THEN (SELECT MAX(z) FROM VoxelObjects WHERE uuid=OLD.uuid) ELSE max_z END
+        WHERE uuid=OLD.uuid;
+    UPDATE ReferenceObjects SET
+        voxel_count = COALESCE(voxel_count, 0) + 1,
+        x = (COALESCE(x, 0) * COALESCE(voxel_count, 0) + NEW.x) / (COALESCE(voxel_count, 0) + 1.0),
+        y = (COALESCE(y, 0) * COALESCE(voxel_count, 0) + NEW.y) / (COALESCE(voxel_count, 0) + 1.0),
+        z = (COALESCE(z, 0) * COALESCE(voxel_count, 0) + NEW.z) / (COALESCE(voxel_count, 0) + 1.0),
+        min_x = MIN(COALESCE(min_x, NEW.x), NEW.x), max_x = MAX(COALESCE(max_x, NEW.x), NEW.x),
+        min_y = MIN(COALESCE(min_y, NEW.y), NEW.y), max_y = MAX(COALESCE(max_y, NEW.y), NEW.y),
+        min_z = MIN(COALESCE(min_z, NEW.z), NEW.z), max_z = MAX(COALESCE(max_z, NEW.z), NEW.z)
+        WHERE uuid=NEW.uuid;
+END;
 
 
 CREATE TABLE ArchivedVoxelObjects (
@@ -6,7 +6,10 @@ from droidlet.base_util import XYZ, Block, npy_to_blocks_list
 from droidlet.task.task import *
 from droidlet.interpreter.craftassist.tasks import *
 import pickle
+import re
 import uuid
+from collections import OrderedDict
+from contextlib import contextmanager
 from droidlet.memory.craftassist.mc_memory_nodes import VoxelObjectNode
 
 NONPICKLE_ATTRS = [
@@ -22,6 +25,58 @@ NONPICKLE_ATTRS = [
 ]
 
 
+# rows in these tables are written once and never changed, so reads that only touch
+# them can be served from the worker's cache
+IMMUTABLE_TABLES = ["BlockTypes", "MobTypes", "Schematics"]
+# the number of reads kept in the worker's cache, least recently used first out
+READ_CACHE_SIZE = 1024
+# the tables of a FROM clause, up to the rest of the query or a subquery
+FROM_CLAUSE = re.compile(
+    r"\bFROM\b(.*?)(?=\bWHERE\b|\bGROUP\b|\bORDER\b|\bLIMIT\b|\bHAVING\b|\bSELECT\b|[();]|$)",
+    re.IGNORECASE | re.DOTALL,
+)
+# commands whose return values are not needed inside a batch();
+# these are sent without waiting for the master's reply
+PIPELINED_COMMANDS = [
+    "_db_write",
+    "db_write",
+    "tag",
+    "untag",
+    "upsert_block",
+    "set_memory_updated_time",
+    "set_memory_attended_time",
+]
+
+
+def immutable_read(query):
+    """True if query is a SELECT reading only from IMMUTABLE_TABLES, including the tables
+    joined (with JOIN or commas) and those of subqueries"""
+    q = query.strip()
+    if not q.upper().startswith("SELECT"):
+        return False
+    tables = []
+    for clause in FROM_CLAUSE.findall(q):
+        for source in re.split(r",|\bJOIN\b", clause, flags=re.IGNORECASE):
+            table = re.match(r"\s*(\w+)", source)
+            if table is None:
+                # selecting from a subquery
+                return False
+            tables.append(table.group(1))
+    return len(tables) > 0 and all(t in IMMUTABLE_TABLES for t in tables)
+
+
+class SwarmMemoryFuture:
+    """The reply to a command sent to the master's memory server.
+    result() blocks until the reply has arrived."""
+
+    def __init__(self, memory, query_id):
+        self.memory = memory
+        self.query_id = query_id
+
+    def result(self):
+        return self.memory._receive(self.query_id)
+
+
 class ForkedPdb(pdb.Pdb):
     """A Pdb subclass that may be used
     from a forked multiprocessing child
@@ -44,8 +99,13 @@ class SwarmWorkerMemory:
         self.receive_queue = memory_receive_queue
         self.memory_tag = memory_tag
         self.receive_dict = {}
+        self.read_cache = OrderedDict()
+        self._batch_depth = 0
+        self._batch_commands = []
+        self._batch_futures = []
         self.init_time_interface(agent_time)
         self._safe_pickle_saved_attrs = {}
+        self.live_tasks = {}
         mem_id_len = len(uuid.uuid4().hex)
         self.self_memid = (
             "0" * (mem_id_len // 2) + uuid.uuid4().hex[: mem_id_len - mem_id_len // 2]
@@ -109,21 +169,57 @@ class SwarmWorkerMemory:
         self.reinstate_attrs(obj)
         return p
 
-    def _db_command(self, command_name, *args):
+    def _send(self, command_name, *args) -> SwarmMemoryFuture:
         query_id = uuid.uuid4().hex
-        send_command = [query_id, command_name]
-        for a in args:
-            send_command.append(a)
-        self.send_queue.put(tuple(send_command))
+        self.send_queue.put((query_id, command_name) + args)
+        return SwarmMemoryFuture(self, query_id)
+
+    def _receive(self, query_id):
         while query_id not in self.receive_dict.keys():
             x = self.receive_queue.get()
             self.receive_dict[x[0]] = x[1]
-        to_return = self.receive_dict[query_id]
-        del self.receive_dict[query_id]
-        return to_return
+        return self.receive_dict.pop(query_id)
+
+    def _flush_batch_commands(self):
+        """send the writes queued in the current batch to the master as one message"""
+        if self._batch_commands:
+            self._batch_futures.append(self._send("_batch", *self._batch_commands))
+            self._batch_commands = []
+
+    def _db_command_async(self, command_name, *args) -> SwarmMemoryFuture:
+        """send a command to the master without waiting for the reply.  the master
+        handles the commands from a worker in the order they are sent, so later
+        commands see the effects of earlier ones."""
+        self._flush_batch_commands()
+        return self._send(command_name, *args)
+
+    def _db_command(self, command_name, *args):
+        if self._batch_depth > 0 and command_name in PIPELINED_COMMANDS:
+            self._batch_commands.append((command_name, args))
+            return None
+        return self._db_command_async(command_name, *args).result()
+
+    def _cached_read(self, command_name, query, *args):
+        if not immutable_read(query):
+            return self._db_command(command_name, query, *args)
+        key = (command_name, query, args)
+        r = self.read_cache.get(key)
+        if r is None:
+            r = self._db_command(command_name, query, *args)
+            # an empty result might be filled in later, don't cache it
+            if r:
+                self._cache_read(key, r)
+        else:
+            self.read_cache.move_to_end(key)
+        return r
+
+    def _cache_read(self, key, r):
+        self.read_cache[key] = r
+        if len(self.read_cache) > READ_CACHE_SIZE:
+            self.read_cache.popitem(last=False)
 
     def _db_read_one(self, query: str, *args):
-        return self._db_command("_db_read_one", query, *args)
+        return self._cached_read("_db_read_one", query, *args)
 
     def _db_write(self, query: str, *args) -> int:
         if (
@@ -138,8 +234,42 @@ class SwarmWorkerMemory:
     def db_write(self, query: str, *args) -> int:
         return self._db_command("db_write", query, *args)
 
+    def register_task(self, memid: str, task):
+        # the master reads the pickles of worker tasks, so write them through
+        self.live_tasks[memid] = task
+        self.db_write("UPDATE Tasks SET pickled=? WHERE uuid=?", self.safe_pickle(task), memid)
+
+    def snapshot_tasks(self):
+        pass
+
+    @contextmanager
+    def batch(self):
+        """Inside the with block the PIPELINED_COMMANDS return None instead of
+        waiting for the master; they are sent as a single message (before the next
+        command that needs a reply, or when the outermost batch exits), and the master
+        applies them in one transaction.  Exiting the outermost batch waits until
+        the master has handled everything sent in it."""
+        self._batch_depth += 1
+        try:
+            yield self
+        finally:
+            self._batch_depth -= 1
+            if self._batch_depth == 0:
+                self._flush_batch_commands()
+                futures = self._batch_futures
+                self._batch_futures = []
+                for f in futures:
+                    f.result()
+
     def _db_read(self, query: str, *args) -> List[Tuple]:
-        return self._db_command("_db_read", query, *args)
+        return self._cached_read("_db_read", query, *args)
+
+    def get_table_columns(self, table: str) -> List[str]:
+        cols = self.read_cache.get(("get_table_columns", table))
+        if cols is None:
+            cols = self._db_command("get_table_columns", table)
+            self._cache_read(("get_table_columns", table), cols)
+        return cols
 
     def tag(self, subj_memid: str, tag_text: str):
         return self._db_command("tag", subj_memid, tag_text)
@@ -185,6 +315,12 @@ class SwarmWorkerMemory:
     def basic_search(self, query):
         return self._db_command("basic_search", query)
 
+    def get_watch_version(self, memids=(), tables=()):
+        return self._db_command("get_watch_version", memids, tables)
+
+    def get_block_changes(self, since=None):
+        return self._db_command("get_block_changes", since)
+
     def get_block_object_by_xyz(self, xyz: XYZ) -> Optional["VoxelObjectNode"]:
         return self._db_command("get_block_object_by_xyz", xyz)
 
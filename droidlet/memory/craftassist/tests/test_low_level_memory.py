@@ -1,9 +1,12 @@
 """
 Copyright (c) Facebook, Inc. and its affiliates.
 """
+import os
+import tempfile
 import unittest
 from collections import namedtuple
-from droidlet.memory.craftassist.mc_memory import MCAgentMemory
+from droidlet.memory.craftassist.mc_memory import MCAgentMemory, BLOCK_CHANGES_KEPT
+from droidlet.memory.craftassist.swarm_worker_memory import immutable_read
 from droidlet.memory.craftassist.mc_memory_nodes import (
     BlockObjectNode,
     MobNode,
@@ -14,6 +17,7 @@ from droidlet.memory.craftassist.mc_memory_nodes import (
 )
 from droidlet.memory.memory_nodes import PlayerNode
 from droidlet.base_util import Pos, Look, Player
+from droidlet.shared_data_struct.craftassist_shared_utils import CraftAssistPerceptionData
 
 Mob = namedtuple("Mob", "entityId, mobType, pos, look")
 Item = namedtuple("item", "id, meta")
@@ -140,6 +144,166 @@ class BasicTest(unittest.TestCase):
         assert len(self.memory.get_triples(obj_text="generate_2")) == 1
         assert len(self.memory.get_triples(obj_text="dance_with_numbers")) == 1
 
+    def test_voxel_index(self):
+        self.memory = MCAgentMemory()
+
+        def check_index():
+            cmd = "SELECT uuid, x, y, z, bid, meta, ref_type FROM VoxelObjects"
+            rows = self.memory._db_read(cmd)
+            indexed = [
+                (r[0], *k[:3], r[1], r[2], k[3])
+                for k, v in self.memory.voxel_index.voxels.items()
+                for r in v
+            ]
+            assert sorted(rows, key=str) == sorted(indexed, key=str)
+
+        BlockObjectNode.create(self.memory, [((0, 0, 0), (1, 0)), ((0, 1, 0), (1, 0))])
+        BlockObjectNode.create(self.memory, [((0, 0, 2), (2, 0))])
+        InstSegNode.create(self.memory, [(0, 0, 0), (0, 0, 1)], ["shiny"])
+        check_index()
+        assert self.memory.voxel_index.column_count(0, 0, "BlockObjects") == 2
+        # placing a block touching both block objects merges them
+        self.memory.maybe_add_block_to_memory(True, False, True, (0, 0, 1), (3, 0))
+        check_index()
+        memids = {
+            self.memory.get_object_info_by_xyz((0, 0, z), "BlockObjects")[0] for z in range(3)
+        }
+        assert len(memids) == 1
+        merged = memids.pop()
+        # upserting an existing voxel of the same object doesn't change the count
+        cmd = "SELECT voxel_count FROM ReferenceObjects WHERE uuid=?"
+        count = self.memory._db_read_one(cmd, merged)[0]
+        self.memory.upsert_block(((0, 0, 1), (4, 0)), merged, "BlockObjects")
+        info = self.memory.get_object_info_by_xyz((0, 0, 1), "BlockObjects", just_memid=False)
+        assert info == [(merged, 4, 0)]
+        assert self.memory._db_read_one(cmd, merged)[0] == count
+        # removal through a delete cascade
+        self.memory.forget(merged)
+        check_index()
+        assert self.memory.get_object_info_by_xyz((0, 0, 0), "BlockObjects") == []
+        assert len(self.memory.get_instseg_object_ids_by_xyz((0, 0, 0))) == 1
+        # rolled back writes are dropped from the index
+        try:
+            with self.memory.batch():
+                BlockObjectNode.create(self.memory, [((5, 5, 5), (1, 0))])
+                raise ValueError
+        except ValueError:
+            pass
+        check_index()
+        assert self.memory.get_block_object_ids_by_xyz((5, 5, 5)) == []
+
+    def test_restore(self):
+        self.memory = MCAgentMemory(load_minecraft_specs=False, load_block_types=False)
+        a = BlockObjectNode.create(self.memory, [((0, 0, 0), (1, 0)), ((0, 1, 0), (1, 0))])
+        with tempfile.TemporaryDirectory() as d:
+            self.memory.snapshot(os.path.join(d, "memory.db"))
+            self.memory.forget(a)
+            self.memory.restore(os.path.join(d, "memory.db"))
+        assert self.memory.get_block_object_ids_by_xyz((0, 1, 0)) == [a]
+        # the voxel index is rebuilt, and still follows the restored tables
+        assert self.memory.voxel_index.column_count(0, 0, "BlockObjects") == 2
+        self.memory.remove_voxel(0, 1, 0, "BlockObjects")
+        assert self.memory.voxel_index.column_count(0, 0, "BlockObjects") == 1
+
+    def test_voxel_object_columns(self):
+        self.memory = MCAgentMemory(load_minecraft_specs=False, load_block_types=False)
+
+        def check(memid):
+            node = BlockObjectNode(self.memory, memid)
+            locs = self.memory._db_read("SELECT x, y, z FROM VoxelObjects WHERE uuid=?", memid)
+            assert node.voxel_count == len(locs)
+            assert node.get_bounds() == tuple(
+                f(l[i] for l in locs) for i in range(3) for f in (min, max)
+            )
+            mean = [sum(l[i] for l in locs) / len(locs) for i in range(3)]
+            assert all(abs(a - b) < 1e-6 for a, b in zip(node._mean, mean))
+            # the spatial index has the bounds of the voxels
+            cmd = "SELECT min_x, max_x, min_y, max_y, min_z, max_z FROM ReferenceObjectBounds WHERE uuid=?"
+            assert self.memory._db_read(cmd, memid) == [node.get_bounds()]
+            # voxels are only read when they are needed
+            assert node._voxels is None
+            assert sorted(node.locs) == sorted(locs)
+            return node
+
+        memid = BlockObjectNode.create(
+            self.memory, [((x, 0, z), (1, 0)) for x in range(3) for z in range(4)]
+        )
+        check(memid)
+        self.memory.remove_voxel(2, 0, 3, "BlockObjects")
+        self.memory.remove_voxel(0, 0, 0, "BlockObjects")
+        check(memid)
+        self.memory.upsert_block(((5, 1, 1), (2, 0)), memid, "BlockObjects")
+        node = check(memid)
+        assert node.get_pos() == (1, 0, 1)
+        assert node.get_point_at_target() == [0, 0, 0, 5, 1, 3]
+        assert self.memory.searcher.search_box(self.memory, (4, 6, 1, 1, 1, 1)) == [memid]
+        assert node.blocks[(5, 1, 1)] == (2, 0)
+        # merging moves the voxels of the merged objects
+        other = BlockObjectNode.create(self.memory, [((5, 1, 3), (1, 0))])
+        self.memory.maybe_add_block_to_memory(True, False, True, (5, 1, 2), (3, 0))
+        merged = self.memory.get_object_info_by_xyz((5, 1, 2), "BlockObjects")[0]
+        cmd = "SELECT * FROM Memories WHERE uuid IN (?, ?)"
+        assert len(self.memory._db_read(cmd, memid, other)) == 1
+        check(merged)
+
+    def test_inst_seg_columns(self):
+        self.memory = MCAgentMemory(load_minecraft_specs=False, load_block_types=False)
+        memid = InstSegNode.create(self.memory, [(0, 0, 0), (0, 0, 1), (4, 0, 1)], ["shiny"])
+        node = InstSegNode(self.memory, memid)
+        assert node.voxel_count == 3
+        assert node.get_bounds() == (0, 4, 0, 0, 0, 1)
+        assert sorted(node.blocks.keys()) == [(0, 0, 0), (0, 0, 1), (4, 0, 1)]
+
+    def test_block_changes(self):
+        self.memory = MCAgentMemory(load_minecraft_specs=False, load_block_types=False)
+        position, changes = self.memory.get_block_changes()
+        assert changes is None
+
+        def perceive(blocks):
+            attributes = {(xyz, idm): [None, None, None] for xyz, idm in blocks}
+            self.memory.update(CraftAssistPerceptionData(changed_block_attributes=attributes))
+
+        perceive([((0, 0, 0), (1, 0)), ((0, 1, 0), (2, 0))])
+        position, changes = self.memory.get_block_changes(position)
+        assert changes == [((0, 0, 0), (1, 0)), ((0, 1, 0), (2, 0))]
+        perceive([((0, 0, 0), (0, 0))])
+        assert self.memory.get_block_changes(position)[1] == [((0, 0, 0), (0, 0))]
+        # too many changes to keep, or a position from another memory
+        perceive([((x, 0, 0), (1, 0)) for x in range(BLOCK_CHANGES_KEPT + 1)])
+        assert self.memory.get_block_changes(position)[1] is None
+        other = MCAgentMemory(load_minecraft_specs=False, load_block_types=False)
+        assert other.get_block_changes(position)[1] is None
+
+    def test_immutable_read(self):
+        assert immutable_read("SELECT * FROM BlockTypes WHERE type_name=?")
+        assert immutable_read("SELECT a.id FROM BlockTypes a, MobTypes b WHERE a.id=b.id")
+        assert immutable_read("SELECT * FROM BlockTypes LEFT JOIN Schematics ON x=y")
+        assert not immutable_read("SELECT * FROM BlockTypes, Memories")
+        assert not immutable_read("SELECT * FROM BlockTypes JOIN Memories ON x=y")
+        assert not immutable_read("SELECT * FROM BlockTypes WHERE id IN (SELECT id FROM Memories)")
+        assert not immutable_read("SELECT * FROM (SELECT * FROM BlockTypes)")
+        assert not immutable_read("UPDATE BlockTypes SET type_name=?")
+
+
+class VoxelIndexReplayTest(unittest.TestCase):
+    def test_replay_build(self):
+        """replays a small build and a dig through the perception update path; see
+        benchmark_voxel_index.py for the timing of a large one"""
+        self.memory = MCAgentMemory(load_minecraft_specs=False, load_block_types=False)
+        build = [(x, y, z) for y in range(3) for x in range(4) for z in range(5)]
+        with self.memory.batch():
+            for xyz in build:
+                self.memory.maybe_add_block_to_memory(True, False, True, xyz, (1, 0))
+        with self.memory.batch():
+            for xyz in build[-20:]:
+                self.memory.maybe_remove_block_from_memory(xyz, (0, 0), [])
+
+        r = self.memory._db_read(
+            'SELECT voxel_count FROM ReferenceObjects WHERE ref_type="BlockObjects"'
+        )
+        assert r == [(40,)]
+        assert self.memory.voxel_index.column_count(0, 0, "BlockObjects") == 2
+
 
 if __name__ == "__main__":
     unittest.main()
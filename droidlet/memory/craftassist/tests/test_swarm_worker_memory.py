@@ -0,0 +1,95 @@
+"""
+Copyright (c) Facebook, Inc. and its affiliates.
+"""
+import queue
+import threading
+import unittest
+from droidlet.memory.craftassist.mc_memory import MCAgentMemory
+from droidlet.memory.craftassist.swarm_worker_memory import SwarmWorkerMemory
+
+
+class FakeMemoryServer:
+    """answers SwarmWorkerMemory commands from an MCAgentMemory in a thread,
+    as the swarm master does"""
+
+    def __init__(self):
+        self.memory = MCAgentMemory()
+        self.send_queue = queue.Queue()
+        self.receive_queue = queue.Queue()
+        self.received = []
+        self._shutdown = False
+        self.thread = threading.Thread(target=self.serve, daemon=True)
+        self.thread.start()
+
+    def handle(self, name, *args):
+        if name == "_batch":
+            with self.memory.batch():
+                return tuple(self.handle(n, *a) for n, a in args)
+        return getattr(self.memory, name)(*args)
+
+    def serve(self):
+        while not self._shutdown:
+            try:
+                query = self.send_queue.get(timeout=0.01)
+            except queue.Empty:
+                continue
+            self.received.append(query[1])
+            self.receive_queue.put((query[0], self.handle(*query[1:])))
+
+
+class SwarmWorkerMemoryTest(unittest.TestCase):
+    def setUp(self):
+        self.server = FakeMemoryServer()
+        self.memory = SwarmWorkerMemory(
+            self.server.send_queue, self.server.receive_queue, "swarm_worker_1"
+        )
+
+    def tearDown(self):
+        self.server._shutdown = True
+        self.server.thread.join()
+
+    def test_batch(self):
+        memid = self.memory.self_memid
+        self.server.received.clear()
+        with self.memory.batch():
+            for i in range(5):
+                assert self.memory.tag(memid, "tag_{}".format(i)) is None
+            # reads see the queued writes
+            assert len(self.memory.get_triples(subj=memid, obj_text="tag_4")) == 1
+            self.memory.untag(memid, "tag_0")
+        assert self.server.received == ["_batch", "get_triples", "_batch"]
+        assert len(self.memory.get_triples(subj=memid, obj_text="tag_0")) == 0
+        assert len(self.server.memory.get_triples(subj=memid, obj_text="tag_3")) == 1
+        assert len(self.memory.receive_dict) == 0
+
+    def test_pipelined_commands(self):
+        memid = self.memory.self_memid
+        futures = [
+            self.memory._db_command_async("tag", memid, "tag_{}".format(i)) for i in range(5)
+        ]
+        for f in reversed(futures):
+            f.result()
+        assert len(self.memory.get_triples(subj=memid, pred_text="has_tag")) >= 5
+
+    def test_read_cache(self):
+        query = "SELECT uuid FROM BlockTypes WHERE type_name=?"
+        self.server.received.clear()
+        assert self.memory._db_read(query, "stone") == []
+        self.server.memory._db_write(
+            "INSERT INTO BlockTypes (uuid, type_name, bid, meta) VALUES (?,?,?,?)",
+            self.memory.self_memid,
+            "stone",
+            1,
+            0,
+        )
+        for _ in range(3):
+            assert self.memory._db_read(query, "stone") == [(self.memory.self_memid,)]
+        # the empty result isn't cached, the first non-empty one is
+        assert self.server.received == ["_db_read", "_db_read"]
+        self.memory._db_read("SELECT uuid FROM Memories WHERE uuid=?", "abc")
+        self.memory._db_read("SELECT uuid FROM Memories WHERE uuid=?", "abc")
+        assert self.server.received.count("_db_read") == 4
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,105 @@
+"""
+Copyright (c) Facebook, Inc. and its affiliates.
+"""
+from collections import defaultdict
+from typing import List, Tuple
+from droidlet.base_util import XYZ, diag_adjacent
+
+# TEMP triggers live only on this connection: they are not part of the schema
+# written out by dump() and they fire for FOREIGN KEY cascade deletes too, so every
+# write to VoxelObjects (including forget() and merges) is mirrored in the index.
+VOXEL_INDEX_TRIGGERS = """
+CREATE TEMP TRIGGER IF NOT EXISTS VoxelIndexInsert AFTER INSERT ON main.VoxelObjects
+    BEGIN SELECT _voxel_index_add(NEW.uuid, NEW.x, NEW.y, NEW.z, NEW.bid, NEW.meta, NEW.ref_type);
+END;
+CREATE TEMP TRIGGER IF NOT EXISTS VoxelIndexDelete AFTER DELETE ON main.VoxelObjects
+    BEGIN SELECT _voxel_index_remove(OLD.uuid, OLD.x, OLD.y, OLD.z, OLD.bid, OLD.meta, OLD.ref_type);
+END;
+CREATE TEMP TRIGGER IF NOT EXISTS VoxelIndexUpdate AFTER UPDATE ON main.VoxelObjects
+    BEGIN
+    SELECT _voxel_index_remove(OLD.uuid, OLD.x, OLD.y, OLD.z, OLD.bid, OLD.meta, OLD.ref_type);
+    SELECT _voxel_index_add(NEW.uuid, NEW.x, NEW.y, NEW.z, NEW.bid, NEW.meta, NEW.ref_type);
+END;
+"""
+
+
+class VoxelIndex:
+    """
+    in-process mirror of the VoxelObjects table, used to answer point, neighbour
+    and column queries without going through sqlite.
+
+    .voxels is a dict with keys (x, y, z, ref_type) and values a list of
+    (memid, bid, meta) rows at that location (a location can hold voxels of
+    several InstSeg objects, for example).
+    .columns counts the voxels with a given (x, z, ref_type).
+
+    the index is kept up to date by TEMP triggers on the VoxelObjects table
+    that call back into python, see attach().  if the db is changed without
+    firing these (e.g. a rollback or a restore from backup), call rebuild().
+    """
+
+    def __init__(self):
+        self.voxels = defaultdict(list)
+        self.columns = defaultdict(int)
+
+    def attach(self, db):
+        """register the index callbacks on the connection db, create the
+        triggers that use them, and load the current contents of VoxelObjects"""
+        db.create_function("_voxel_index_add", 7, self.add, deterministic=False)
+        db.create_function("_voxel_index_remove", 7, self.remove, deterministic=False)
+        db.executescript(VOXEL_INDEX_TRIGGERS)
+        self.rebuild(db)
+
+    def rebuild(self, db):
+        """reload the index from the VoxelObjects table"""
+        self.voxels.clear()
+        self.columns.clear()
+        c = db.cursor()
+        c.execute("SELECT uuid, x, y, z, bid, meta, ref_type FROM VoxelObjects")
+        for row in c.fetchall():
+            self.add(*row)
+        c.close()
+
+    def add(self, memid, x, y, z, bid, meta, ref_type):
+        self.voxels[(x, y, z, ref_type)].append((memid, bid, meta))
+        self.columns[(x, z, ref_type)] += 1
+
+    def remove(self, memid, x, y, z, bid, meta, ref_type):
+        key = (x, y, z, ref_type)
+        rows = self.voxels.get(key)
+        if not rows:
+            return
+        try:
+            rows.remove((memid, bid, meta))
+        except ValueError:
+            return
+        if not rows:
+            del self.voxels[key]
+        ckey = (x, z, ref_type)
+        self.columns[ckey] -= 1
+        if self.columns[ckey] <= 0:
+            del self.columns[ckey]
+
+    def get(self, xyz: XYZ, ref_type: str) -> List[Tuple]:
+        """returns a list of the distinct (memid, bid, meta) at xyz with the given ref_type"""
+        rows = self.voxels.get((xyz[0], xyz[1], xyz[2], ref_type))
+        if not rows:
+            return []
+        if len(rows) == 1:
+            return list(rows)
+        return list(dict.fromkeys(rows))
+
+    def get_memids(self, xyz: XYZ, ref_type: str) -> List[str]:
+        """returns a list of the distinct memids at xyz with the given ref_type"""
+        rows = self.voxels.get((xyz[0], xyz[1], xyz[2], ref_type))
+        if not rows:
+            return []
+        return list(dict.fromkeys(r[0] for r in rows))
+
+    def get_neighbours(self, xyz: XYZ, ref_type: str) -> List[List[Tuple]]:
+        """returns get(a, ref_type) for each a in diag_adjacent(xyz)"""
+        return [self.get(a, ref_type) for a in diag_adjacent(xyz)]
+
+    def column_count(self, x, z, ref_type: str) -> int:
+        """returns the number of voxels of ref_type with the given x and z"""
+        return self.columns.get((x, z, ref_type), 0)
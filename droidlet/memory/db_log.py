@@ -0,0 +1,163 @@
+"""
+Copyright (c) Facebook, Inc. and its affiliates.
+"""
+import atexit
+import functools
+import gzip
+import logging
+import queue
+import threading
+import time
+import weakref
+from itertools import zip_longest
+
+DEFAULT_CHUNK_SIZE = 1000
+DEFAULT_CHUNK_TIME = 0.1
+DEFAULT_MAX_QUEUED = 100
+
+
+def format_db_log_entry(s: str, *args, no_format=False):
+    """The line of the db log for the query s run with args
+
+    Args:
+        s (string): query
+        no_format (bool): no formatting needed
+    """
+    # sub args in for ?
+    split = s.split("?")
+    parts = []
+    for sub, arg in zip_longest(split, args, fillvalue=""):
+        parts.append(str(sub))
+        if isinstance(arg, str) and arg != "":
+            # put quotes around string args
+            parts.append('"{}"'.format(arg))
+        else:
+            parts.append(str(arg))
+    final = "".join(parts).encode("utf-8")
+
+    # remove newlines, add semicolon
+    if not no_format:
+        final = final.strip().replace(b"\n", b" ") + b";\n"
+    return final
+
+
+class DbLogWriter:
+    """Writes the db log of an AgentMemory to a gzip file from a background thread,
+    so that writing the log doesn't hold up the agent.  Entries are handed to the
+    thread in chunks, every chunk_size entries, and on flush() and close(); the thread
+    also takes the entries that have waited chunk_time seconds, so they reach the file
+    even if nothing is written after them.  The thread formats and compresses the
+    chunks that have queued up in one go, and flushes the file after each.  The writer
+    is closed at exit if it wasn't before.
+
+    Args:
+        path (string): the gzip file to write
+        chunk_size (int): the number of entries handed to the thread at once
+        chunk_time (float): seconds after which the thread takes a partial chunk
+        max_queued (int): write() blocks while this many chunks are waiting for the thread
+    """
+
+    def __init__(
+        self,
+        path,
+        chunk_size=DEFAULT_CHUNK_SIZE,
+        chunk_time=DEFAULT_CHUNK_TIME,
+        max_queued=DEFAULT_MAX_QUEUED,
+    ):
+        self.file = gzip.open(path, "w")
+        self.chunk_size = chunk_size
+        self.chunk_time = chunk_time
+        self.chunk = []
+        self.chunk_start = time.monotonic()
+        # guards chunk and chunk_start, which the thread takes when they get old
+        self.lock = threading.Lock()
+        self.queue = queue.Queue(maxsize=max_queued)
+        self.thread = threading.Thread(target=self._run, daemon=True)
+        self.thread.start()
+        # a weak reference, so that the registered handler doesn't keep the writer alive
+        self._close_at_exit = functools.partial(_close_at_exit, weakref.ref(self))
+        atexit.register(self._close_at_exit)
+
+    def write(self, s: str, *args, no_format=False):
+        """add the log entry for the query s run with args"""
+        with self.lock:
+            self.chunk.append((s, args, no_format))
+            if len(self.chunk) >= self.chunk_size:
+                self._hand_off()
+
+    def _hand_off(self):
+        # called with the lock held, so the thread can't take newer entries meanwhile
+        if self.chunk:
+            self.queue.put(self.chunk)
+            self.chunk = []
+        self.chunk_start = time.monotonic()
+
+    def flush(self):
+        """wait until everything written so far is in the file"""
+        with self.lock:
+            self._hand_off()
+        self.queue.join()
+
+    def close(self):
+        """write everything to the file and close it"""
+        if self.file.closed:
+            return
+        atexit.unregister(self._close_at_exit)
+        if self.thread.is_alive():
+            with self.lock:
+                self._hand_off()
+            self.queue.put(None)
+            self.thread.join()
+        self.file.close()
+
+    def _get_queued(self, chunks):
+        while True:
+            try:
+                chunks.append(self.queue.get_nowait())
+            except queue.Empty:
+                return
+
+    def _run(self):
+        done = False
+        while not done:
+            try:
+                chunks = [self.queue.get(timeout=self.chunk_time)]
+            except queue.Empty:
+                chunks = []
+            self._get_queued(chunks)
+            # take the entries that have waited too long for a full chunk.  if write() holds
+            # the lock (maybe waiting for room in the queue), they are taken next time
+            stale = time.monotonic() - self.chunk_start > self.chunk_time
+            if stale and self.lock.acquire(blocking=False):
+                try:
+                    # nothing is queued while the lock is held, so the entries stay in order
+                    self._get_queued(chunks)
+                    queued = len(chunks)
+                    chunks.append(self.chunk)
+                    self.chunk = []
+                    self.chunk_start = time.monotonic()
+                finally:
+                    self.lock.release()
+            else:
+                queued = len(chunks)
+            lines = []
+            for chunk in chunks:
+                if chunk is None:
+                    done = True
+                    continue
+                for s, args, no_format in chunk:
+                    lines.append(format_db_log_entry(s, *args, no_format=no_format))
+            if lines:
+                try:
+                    self.file.write(b"".join(lines))
+                    self.file.flush()
+                except Exception:
+                    logging.exception("failed to write the db log")
+            for _ in range(queued):
+                self.queue.task_done()
+
+
+def _close_at_exit(writer_ref):
+    writer = writer_ref()
+    if writer is not None:
+        writer.close()
@@ -4,6 +4,41 @@ Copyright (c) Facebook, Inc. and its affiliates.
 import numpy as np
 from .memory_filters import get_property_value, Attribute
 
+# keep the number of sql variables in a query below sqlite's limit
+MAX_QUERY_MEMIDS = 900
+
+
+def batch_get_pos(memory, mems):
+    """
+    returns an N x 3 array with mem.get_pos() for each of the N mems.  for node types
+    that read their position from the ReferenceObjects table (see
+    ReferenceObjectNode.batch_pos), the rows of all of them are read in one query
+    """
+    out = np.full((len(mems), 3), np.nan)
+    by_class = {}
+    for i, mem in enumerate(mems):
+        if getattr(mem, "memid", None) is not None and hasattr(type(mem), "batch_pos"):
+            by_class.setdefault(type(mem), []).append(i)
+    if by_class:
+        memids = list(set(mems[i].memid for idxs in by_class.values() for i in idxs))
+        rows = []
+        for i in range(0, len(memids), MAX_QUERY_MEMIDS):
+            chunk = memids[i : i + MAX_QUERY_MEMIDS]
+            cmd = "SELECT uuid, x, y, z FROM ReferenceObjects WHERE uuid IN ({})".format(
+                ", ".join(["?"] * len(chunk))
+            )
+            rows.extend(memory._db_read(cmd, *chunk))
+        index = {r[0]: i for i, r in enumerate(rows)}
+        # the last row is for memids without a row, they use get_pos()
+        xyz = np.array([r[1:] for r in rows] + [[None] * 3], dtype=np.float64)
+        for cls, idxs in by_class.items():
+            v = cls.batch_pos(xyz[[index.get(mems[i].memid, -1) for i in idxs]])
+            if v is not None:
+                out[idxs] = v
+    for i in np.nonzero(np.isnan(out).any(axis=1))[0]:
+        out[i] = mems[i].get_pos()
+    return out
+
 
 class TableColumn(Attribute):
     """
@@ -50,26 +85,39 @@ class TripleWalk(Attribute):
         self.path = path
 
     def __call__(self, mems):
-        step = mems
-        for p in self.path:
-            next_step = []
-            for mem in step:
-                n = None
-                if mem is not None:
-                    if p[1] == "subj_variable":
-                        n = self.memory.get_triples(pred_text=p[0], obj=mem.memid)
-                        if len(n) > 0:
-                            # TODO don't just pick the first?
-                            next_step.append(self.memory.get_mem_by_id(n[0][0]))
-                    else:
-                        n = self.memory.get_triples(
-                            pred_text=p[0], subj=mem.memid, return_obj_text="never"
-                        )
-                        if len(n) > 0:
-                            next_step.append(self.memory.get_mem_by_id(n[0][2]))
-                if len(n) == 0:
-                    next_step.append(None)
-        return next_step
+        if len(self.path) == 0:
+            return mems
+        # one recursive query for all the walks: the path is a table of steps, and each
+        # step follows the first triple (in insertion order) from the current node
+        path = " UNION ALL ".join(["SELECT ?, ?, ?"] * len(self.path))
+        path_args = [a for i, p in enumerate(self.path) for a in (i, p[0], p[1])]
+        cmd = (
+            "WITH RECURSIVE path(step, pred_text, direction) AS ("
+            + path
+            + "), walk(start, node, step) AS ("
+            + "SELECT uuid, uuid, 0 FROM Memories WHERE uuid IN ({})"
+            + " UNION ALL SELECT walk.start, ("
+            + "SELECT CASE WHEN path.direction='subj_variable' THEN T.subj ELSE T.obj END "
+            + "FROM Triples AS T INNER JOIN Memories AS M ON T.subj=M.uuid "
+            + "WHERE M.is_snapshot=0 AND T.pred_text=path.pred_text AND "
+            + "((path.direction='subj_variable' AND T.obj=walk.node) OR "
+            + "(path.direction!='subj_variable' AND T.subj=walk.node)) "
+            + "ORDER BY T.rowid LIMIT 1), walk.step + 1 "
+            + "FROM walk INNER JOIN path ON path.step=walk.step WHERE walk.node IS NOT NULL"
+            + ") SELECT start, node FROM walk WHERE step=?"
+        )
+        ends = {}
+        memids = list(set(mem.memid for mem in mems if mem is not None))
+        for i in range(0, len(memids), MAX_QUERY_MEMIDS):
+            chunk = memids[i : i + MAX_QUERY_MEMIDS]
+            q = cmd.format(", ".join(["?"] * len(chunk)))
+            for start, node in self.memory._db_read(q, *path_args, *chunk, len(self.path)):
+                ends[start] = node
+        nodes = {}
+        for memid in set(ends.values()):
+            if memid is not None:
+                nodes[memid] = self.memory.get_mem_by_id(memid)
+        return [nodes.get(ends.get(mem.memid)) if mem is not None else None for mem in mems]
 
     def __repr__(self):
         return "triple path: " + str(self.path)
@@ -240,6 +288,33 @@ class LinearExtentAttribute(Attribute):
         else:  # AWAY
             return np.linalg.norm(diff)
 
+    def extents(self, sources, destinations):
+        """extent() for N pairs of points, given as N x 3 arrays"""
+        diffs = np.subtract(destinations, sources)
+        if self.location_data["relative_direction"] in ["INSIDE", "OUTSIDE"]:
+            raise Exception("inside and outside not yet implemented in linear extent")
+        if self.location_data["relative_direction"] in [
+            "LEFT",
+            "RIGHT",
+            "UP",
+            "DOWN",
+            "FRONT",
+            "BACK",
+        ]:
+            reldir_vec = self.coordinate_transforms.DIRECTIONS[
+                self.location_data["relative_direction"]
+            ]
+            # this should be an inverse transform so we set inverted=True
+            dir_vec = self.coordinate_transforms.transform(
+                reldir_vec, self.yaw, self.pitch, inverted=True
+            )
+            if self.normalized:
+                return diffs @ dir_vec
+            else:
+                return diffs @ dir_vec / np.linalg.norm(diffs, axis=1)
+        else:  # AWAY
+            return np.linalg.norm(diffs, axis=1)
+
     def __call__(self, mems):
         if not self.mem:
             fixed_mem, _ = self.searcher()
@@ -248,12 +323,27 @@ class LinearExtentAttribute(Attribute):
             # FIXME!!! handle mem not found, more than one, etc.
         else:
             fixed_mem = self.mem
-        fixed_pos = fixed_mem.get_pos()
+        fixed_pos = np.array(fixed_mem.get_pos(), dtype=np.float64)
+        positions = batch_get_pos(self.memory, mems)
         # FIXME TODO store and use an arxiv if we don't want position to track!
         if self.fixed_role == "source":
-            return [self.extent(fixed_pos, mem.get_pos()) for mem in mems]
+            return self.extents(fixed_pos, positions).tolist()
+        else:
+            return self.extents(positions, fixed_pos).tolist()
+
+    def bounding_box(self, value, comparison_symbol):
+        # a distance from a fixed mem below a maximum puts the positions in a box around it.
+        # (don't run a searcher for the fixed mem here, it would be run again in __call__)
+        if not self.mem or self.location_data["relative_direction"] != "AWAY":
+            return None
+        if comparison_symbol in ["<", "<="]:
+            r = value[0]
+        elif comparison_symbol == "<>":
+            r = value[1]
         else:
-            return [self.extent(mem.get_pos(), fixed_pos) for mem in mems]
+            return None
+        x, y, z = self.mem.get_pos()
+        return (x - r, x + r, y - r, y + r, z - r, z + r)
 
     def __repr__(self):
         return "Attribute: " + str(self.location_data)
@@ -281,7 +371,7 @@ class LookRayDistance(Attribute):
         # TODO: currently stores look vecs/orientations at creation,
         try:
             x, y, z, yaw, pitch = memory._db_read(
-                "SELECT x, y, z yaw, pitch FROM ReferenceObjects WHERE eid=?", eid
+                "SELECT x, y, z, yaw, pitch FROM ReferenceObjects WHERE eid=?", eid
             )[0]
         except:
             # TODO handle this better
@@ -296,23 +386,19 @@ class LookRayDistance(Attribute):
 
     def __call__(self, mems):
         try:
-            positions = [mem.get_pos() for mem in mems]
+            positions = batch_get_pos(self.memory, mems)
         except:
             raise Exception("a memory input to LookRayDistance does not .get_pos() properly")
 
-        rotated_coords = [
-            self.coordinate_transforms.transform(np.array(p) - self.pos, self.yaw, self.pitch)
-            for p in positions
-        ]
+        # the transform is linear, apply its matrix to all the positions at once
+        T = self.coordinate_transforms.transform(np.eye(3), self.yaw, self.pitch)
+        rotated_coords = (positions - self.pos) @ T.T
         LEFT = self.coordinate_transforms.DIRECTIONS["LEFT"]
         UP = self.coordinate_transforms.DIRECTIONS["UP"]
-        if self.mode == "raw":
-            return [((c @ LEFT) ** 2 + (c @ UP) ** 2) ** 0.5 for c in rotated_coords]
-        else:
-            return [
-                (((c @ LEFT) ** 2 + (c @ UP) ** 2) ** 0.5) / np.linalg.norm(c)
-                for c in rotated_coords
-            ]
+        dists = ((rotated_coords @ LEFT) ** 2 + (rotated_coords @ UP) ** 2) ** 0.5
+        if self.mode != "raw":
+            dists = dists / np.linalg.norm(rotated_coords, axis=1)
+        return dists.tolist()
 
     def __repr__(self):
         return "LookRayDistance"
@@ -1,10 +1,14 @@
 """
 Copyright (c) Facebook, Inc. and its affiliates.
 """
+import math
 from typing import List
 import torch
 from droidlet.memory.filters_conversions import get_inequality_symbol, sqly_to_new_filters
 
+# the half-width of the first box search_nearest searches around the point
+NEAREST_SEARCH_RADIUS = 8.0
+
 ####################################################################################
 ### This file is split between the basic memory searcher, and memory filters objects
 ### these now duplicate a lot of logic as the "internal" and "external" (FILTERs DSL)
@@ -20,6 +24,16 @@ class Attribute:
     def __call__(self, mems):
         raise NotImplementedError("Implemented by subclass")
 
+    def bounding_box(self, value, comparison_symbol):
+        """
+        a box (min_x, max_x, min_y, max_y, min_z, max_z) that contains the positions of
+        all the memories whose attribute value passes the comparison with value (in the
+        form search_by_attribute takes them), or None if the attribute doesn't bound
+        the positions.  search_by_attribute only evaluates the attribute on the
+        memories in the box (and on those without a position)
+        """
+        return None
+
 
 def check_well_formed_triple(clause):
     # TODO search by pred?
@@ -50,7 +64,7 @@ def check_value_comparison_match(value, comparison_symbol):
 
 def get_all_memids_of_node_type(agent_memory, memtype, allow_archives=False):
     # FIXME memtype might be a union of node types
-    memtypes = agent_memory.node_children[memtype]
+    memtypes = list(agent_memory.node_children[memtype])
     node_type_clause = "(" + (" OR node_type=? " * len(memtypes))[3:-1] + ")"
     cmd = "SELECT uuid FROM Memories WHERE " + node_type_clause
     # FIXME deal with this better with node types:
@@ -95,15 +109,13 @@ def get_property_value(agent_memory, mem, prop, get_all=False):
         mem = agent_memory.get_mem_by_id(mem)
 
     # is it in the main memory table?
-    cols = [c[1] for c in agent_memory._db_read("PRAGMA table_info(Memories)")]
-    if prop in cols:
+    if prop in agent_memory.get_table_columns("Memories"):
         cmd = "SELECT " + prop + " FROM Memories WHERE uuid=?"
         r = agent_memory._db_read(cmd, mem.memid)
         return r[0][0]
     # is it in the mem.TABLE?
     T = mem.TABLE
-    cols = [c[1] for c in agent_memory._db_read("PRAGMA table_info({})".format(T))]
-    if prop in cols:
+    if prop in agent_memory.get_table_columns(T):
         cmd = "SELECT " + prop + " FROM " + T + " WHERE uuid=?"
         r = agent_memory._db_read(cmd, mem.memid)
         return r[0][0]
@@ -118,53 +130,48 @@ def get_property_value(agent_memory, mem, prop, get_all=False):
     return None
 
 
-def search_by_property(agent_memory, prop, value, comparison_symbol, memtype):
+def triples_sql(select, **triple):
     """
-    Tries to find memories with a property value
-
-    Args:
-        agent_memory: an AgentMemory object
-        prop: a string with the name of the property
-        value: the value to match.  if comparison_symbol is <>,
-            should be a tuple of (low, high); and if comparison symbol is
-            "%", should be a tuple of (modulus, remainder)
-            otherwise value should be a singleton tuple
-        comparison_symbol: one of "=", "<", "<=", ">", ">=", "%", "<>"
-        memtype: a MemoryNode type
+    sql selecting one column (named uuid) of the Triples matching the parts of triple
+    that are not None, as in AgentMemory.get_triples, and its arguments
+    """
+    parts = [(k, v) for k, v in triple.items() if v is not None]
+    where = " AND ".join(k + "=?" for k, _ in parts)
+    sql = (
+        "SELECT "
+        + select
+        + " AS uuid FROM Triples INNER JOIN Memories AS M ON Triples.subj=M.uuid "
+        + "WHERE M.is_snapshot=0 AND "
+        + where
+    )
+    return sql, [v for _, v in parts]
 
-    returns a list of memids
 
-    looks with the following order of precedence:
-    1: main memory table
-    2: table corresponding to the nodes .TABLE
-    3: triple with the nodes memid as subject and prop as predicate
+def property_sql(agent_memory, prop, value, comparison_symbol, memtype):
+    """
+    sql selecting the uuids of memories with a property value (not filtered by memtype),
+    and its arguments.  see search_by_property
     """
     check_value_comparison_match(value, comparison_symbol)
 
     if comparison_symbol == "%":
         where = "WHERE " + prop + " % " + str(value[0]) + " =?"
-        v = value[1]
+        v = [value[1]]
     elif comparison_symbol == "<>":
         where = "WHERE " + prop + ">? AND " + prop + "<?"
-        v = value
+        v = list(value)
     else:
         where = "WHERE " + prop + comparison_symbol + "?"
-        v = value
+        v = list(value)
 
     # is it in the main memory table?
-    cols = [c[1] for c in agent_memory._db_read("PRAGMA table_info(Memories)")]
-    if prop in cols:
-        cmd = "SELECT uuid FROM Memories " + where
-        memids = [m[0] for m in agent_memory._db_read(cmd, *v)]
-        return filter_memids_by_nodetype(agent_memory, memids, memtype)
+    if prop in agent_memory.get_table_columns("Memories"):
+        return "SELECT uuid FROM Memories " + where, v
 
     # is it in the node table?
     T = agent_memory.nodes[memtype].TABLE
-    cols = [c[1] for c in agent_memory._db_read("PRAGMA table_info({})".format(T))]
-    if prop in cols:
-        cmd = "SELECT uuid FROM " + T + " " + where
-        memids = [m[0] for m in agent_memory._db_read(cmd, *v)]
-        return filter_memids_by_nodetype(agent_memory, memids, memtype)
+    if prop in agent_memory.get_table_columns(T):
+        return "SELECT uuid FROM " + T + " " + where, v
 
     # is it a triple?
     # n.b. if the query is about an actual triple (e.g. SELECT subj FROM Triples ...), it would have been
@@ -177,13 +184,156 @@ def search_by_property(agent_memory, prop, value, comparison_symbol, memtype):
     if comparison_symbol != "=" and comparison_symbol != "=#=":
         raise Exception("Triple values need to have '=' or '=#=' as comparison symbol for now")
     if comparison_symbol == "=":
-        triples = agent_memory.get_triples(pred_text=prop, obj_text=value[0])
+        return triples_sql("subj", pred_text=prop, obj_text=value[0])
     else:
-        triples = agent_memory.get_triples(pred_text=prop, obj=value[0])
-    if len(triples) > 0:
-        return filter_memids_by_nodetype(agent_memory, [t[0] for t in triples], memtype)
+        return triples_sql("subj", pred_text=prop, obj=value[0])
+
+
+def search_by_property(agent_memory, prop, value, comparison_symbol, memtype):
+    """
+    Tries to find memories with a property value
+
+    Args:
+        agent_memory: an AgentMemory object
+        prop: a string with the name of the property
+        value: the value to match.  if comparison_symbol is <>,
+            should be a tuple of (low, high); and if comparison symbol is
+            "%", should be a tuple of (modulus, remainder)
+            otherwise value should be a singleton tuple
+        comparison_symbol: one of "=", "<", "<=", ">", ">=", "%", "<>"
+        memtype: a MemoryNode type
+
+    returns a list of memids
+
+    looks with the following order of precedence:
+    1: main memory table
+    2: table corresponding to the nodes .TABLE
+    3: triple with the nodes memid as subject and prop as predicate
+    """
+    cmd, v = property_sql(agent_memory, prop, value, comparison_symbol, memtype)
+    memids = [m[0] for m in agent_memory._db_read(cmd, *v)]
+    return filter_memids_by_nodetype(agent_memory, memids, memtype)
+
+
+def bounds_sql(box):
+    """
+    sql condition that the bounds in the ReferenceObjectBounds row B intersect
+    box = (min_x, max_x, min_y, max_y, min_z, max_z), and its arguments
+    """
+    where = []
+    args = []
+    for i, axis in enumerate("xyz"):
+        low, high = box[2 * i], box[2 * i + 1]
+        # the box_ columns are searched with the R-tree, the exact bounds
+        # remove the matches that are only due to its rounding
+        where.append(
+            "B.box_max_{0}>=? AND B.box_min_{0}<=? AND B.max_{0}>=? AND B.min_{0}<=?".format(axis)
+        )
+        args.extend([low, high, low, high])
+    return " AND ".join(where), args
+
+
+def bounded_memids_sql(agent_memory, memtype):
+    """
+    sql joining the ReferenceObjectBounds row B of each memory M of type memtype that
+    has one, and its arguments.  the R-tree is the outer loop of the join
+    """
+    node_types = list(agent_memory.node_children[memtype])
+    sql = (
+        "FROM ReferenceObjectBounds AS B CROSS JOIN Memories AS M ON B.uuid=M.uuid "
+        + "WHERE M.node_type IN ("
+        + ",".join(["?"] * len(node_types))
+        + ") AND M.is_snapshot=0"
+    )
+    return sql, node_types
+
 
-    return []
+def search_by_box(agent_memory, box, memtype, include_unbounded=False):
+    """
+    Finds the memories whose bounds intersect a box, using the ReferenceObjectBounds R-tree
+
+    Args:
+        agent_memory: an AgentMemory object
+        box: a tuple (min_x, max_x, min_y, max_y, min_z, max_z)
+        memtype: a MemoryNode type
+        include_unbounded: also return the memories of type memtype that have no
+            bounds (e.g. a ReferenceObject without a position, or a memory that
+            isn't a ReferenceObject)
+
+    returns a list of memids
+    """
+    from_sql, args = bounded_memids_sql(agent_memory, memtype)
+    where, box_args = bounds_sql(box)
+    cmd = "SELECT M.uuid " + from_sql + " AND " + where
+    args = args + box_args
+    if include_unbounded:
+        node_types = list(agent_memory.node_children[memtype])
+        cmd += (
+            " UNION ALL SELECT uuid FROM Memories AS M WHERE node_type IN ("
+            + ",".join(["?"] * len(node_types))
+            + ") AND is_snapshot=0 AND NOT EXISTS (SELECT 1 FROM ReferenceObjects AS R "
+            + "INNER JOIN ReferenceObjectBounds AS B ON B.id=R.rowid WHERE R.uuid=M.uuid)"
+        )
+        args = args + node_types
+    return [m[0] for m in agent_memory._db_read(cmd, *args)]
+
+
+def search_nearest(agent_memory, xyz, memtype, k=1, max_distance=None):
+    """
+    Finds the k memories whose bounds are nearest to a point, using the
+    ReferenceObjectBounds R-tree: boxes around the point are searched, growing them
+    until they are sure to hold the k nearest memories
+
+    Args:
+        agent_memory: an AgentMemory object
+        xyz: the point
+        memtype: a MemoryNode type
+        k: the number of memories to return, fewer are returned if there aren't
+            k memories of type memtype with bounds (within max_distance)
+        max_distance: if not None, memories further than this are not returned
+
+    returns a list of memids, nearest first, and the list of their distances
+    (0 if the point is in the bounds)
+    """
+    if k <= 0:
+        return [], []
+    x, y, z = xyz
+    from_sql, from_args = bounded_memids_sql(agent_memory, memtype)
+
+    def nearest_in_box(r):
+        # the distance from the point to the bounds along each axis
+        where, box_args = bounds_sql((x - r, x + r, y - r, y + r, z - r, z + r))
+        cmd = (
+            "SELECT uuid, dx * dx + dy * dy + dz * dz AS d2 FROM ("
+            + "SELECT M.uuid AS uuid, MAX(B.min_x - ?, ? - B.max_x, 0) AS dx, "
+            + "MAX(B.min_y - ?, ? - B.max_y, 0) AS dy, MAX(B.min_z - ?, ? - B.max_z, 0) AS dz "
+            + from_sql
+            + " AND "
+            + where
+            + ") ORDER BY d2 LIMIT ?"
+        )
+        return agent_memory._db_read(cmd, x, x, y, y, z, z, *from_args, *box_args, k)
+
+    r = NEAREST_SEARCH_RADIUS if max_distance is None else max_distance
+    num_bounded = None
+    while True:
+        rows = nearest_in_box(r)
+        if max_distance is not None:
+            rows = [row for row in rows if row[1] <= max_distance ** 2]
+            break
+        if len(rows) == k:
+            if rows[-1][1] > r * r:
+                # the k memories found are not necessarily the nearest, but the
+                # k nearest are at most as far as the furthest of them
+                d = math.sqrt(rows[-1][1])
+                rows = nearest_in_box(d + 1e-6 * max(d, 1.0))
+            break
+        if num_bounded is None:
+            num_bounded = agent_memory._db_read_one("SELECT COUNT(*) " + from_sql, *from_args)[0]
+        if len(rows) == num_bounded:
+            break
+        r = r * 4
+    return [row[0] for row in rows], [math.sqrt(row[1]) for row in rows]
 
 
 def search_by_attribute(agent_memory, attribute, value, comparison_symbol, memtype):
@@ -204,7 +354,11 @@ def search_by_attribute(agent_memory, attribute, value, comparison_symbol, memty
     returns a list of memids
     """
     check_value_comparison_match(value, comparison_symbol)
-    memids = get_all_memids_of_node_type(agent_memory, memtype)
+    box = attribute.bounding_box(value, comparison_symbol)
+    if box is None:
+        memids = get_all_memids_of_node_type(agent_memory, memtype)
+    else:
+        memids = search_by_box(agent_memory, box, memtype, include_unbounded=True)
     values = attribute([agent_memory.get_mem_by_id(m) for m in memids])
     pairs = zip(memids, values)
 
@@ -305,15 +459,30 @@ class MemorySearcher:
         self.query = query
         self.ignore_self = ignore_self
 
+    def search_box(self, agent_memory, box, memtype="ReferenceObject"):
+        """
+        returns the memids of the memories of type memtype whose bounds intersect
+        box = (min_x, max_x, min_y, max_y, min_z, max_z); see search_by_box
+        """
+        return search_by_box(agent_memory, box, memtype)
+
+    def search_nearest(self, agent_memory, xyz, k=1, memtype="ReferenceObject", max_distance=None):
+        """
+        returns the memids of the k memories of type memtype whose bounds are nearest
+        to xyz, nearest first, and their distances; see search_nearest
+        """
+        return search_nearest(agent_memory, xyz, memtype, k=k, max_distance=max_distance)
+
     def maybe_convert_query(self, query):
         if type(query) is str:
             return sqly_to_new_filters(query)
         else:
             return query
 
-    def handle_comparator_where_leaf(self, agent_memory, where_clause, memtype):
+    def parse_comparator_where_leaf(self, where_clause):
         """
-        find all records matching a single comparator
+        returns the input_left, value and comparison symbol of a comparator, with value and
+        comparison symbol in the form search_by_property expects
         """
         # TODO: if input_left or input_right are subqueries...
         v = where_clause["input_left"]
@@ -340,6 +509,13 @@ class MemorySearcher:
             value = (ctype["modulus"], input_right)
         else:
             value = (input_right,)
+        return input_left, value, comparison_symbol
+
+    def handle_comparator_where_leaf(self, agent_memory, where_clause, memtype):
+        """
+        find all records matching a single comparator
+        """
+        input_left, value, comparison_symbol = self.parse_comparator_where_leaf(where_clause)
         if type(input_left) is str:
             return search_by_property(agent_memory, input_left, value, comparison_symbol, memtype)
         elif isinstance(input_left, Attribute):
@@ -347,8 +523,11 @@ class MemorySearcher:
         else:
             raise Exception("malformed input_left in comparator {}".format(where_clause))
 
-    def handle_triple_where_leaf(self, agent_memory, where_clause, memtype):
-        # run any subqueries:
+    def run_triple_subqueries(self, where_clause):
+        """
+        replaces the subqueries in a triple where clause with their first value.
+        returns False if some subquery found nothing, so that the triple can't match anything
+        """
         for k, v in where_clause.items():
             if callable(v):
                 # this should be a searcher, run it
@@ -357,12 +536,18 @@ class MemorySearcher:
                     # FIXME, throw an error? the subquery could not
                     # get a value, so the whole query returns nothing:
                     if len(vals) == 0:
-                        return []
+                        return False
                     # FIXME?  handle this better (don't choose the first?)
                     # should we force subqueries to have proper selectors?
                     where_clause[k] = vals[0]
                 except:
                     raise Exception("error in subquery {}".format(where_clause))
+        return True
+
+    def handle_triple_where_leaf(self, agent_memory, where_clause, memtype):
+        # run any subqueries:
+        if not self.run_triple_subqueries(where_clause):
+            return []
 
         triples = agent_memory.get_triples(**where_clause)
         if where_clause.get("subj"):
@@ -408,6 +593,65 @@ class MemorySearcher:
         except:
             raise Exception("poorly formed triple dict{}".format(where_clause))
 
+    def compile_where(self, agent_memory, where_clause, memtype):
+        """
+        compiles the where clause into a single sql statement selecting the uuids of the
+        memories satisfying it, before filtering by memtype (NOT clauses are taken
+        relative to the memories of type memtype).  returns the sql and its arguments,
+        or None if the clause has a leaf that can't be written in sql (an Attribute
+        comparator), in which case use handle_where
+        """
+        for conjunction, op in [("AND", " INTERSECT "), ("OR", " UNION ")]:
+            if where_clause.get(conjunction):
+                sqls = []
+                args = []
+                for c in where_clause[conjunction]:
+                    compiled = self.compile_where(agent_memory, c, memtype)
+                    if compiled is None:
+                        return None
+                    sqls.append("SELECT uuid FROM (" + compiled[0] + ")")
+                    args.extend(compiled[1])
+                return op.join(sqls), args
+        if where_clause.get("NOT"):
+            compiled = self.compile_where(agent_memory, where_clause["NOT"][0], memtype)
+            if compiled is None:
+                return None
+            node_types = agent_memory.node_children[memtype]
+            sql = (
+                "SELECT uuid FROM Memories WHERE node_type IN ("
+                + ",".join(["?"] * len(node_types))
+                + ") AND is_snapshot=0 EXCEPT SELECT uuid FROM ("
+                + compiled[0]
+                + ")"
+            )
+            return sql, list(node_types) + compiled[1]
+
+        if where_clause.get("input_left"):
+            input_left, value, comparison_symbol = self.parse_comparator_where_leaf(where_clause)
+            if type(input_left) is str:
+                return property_sql(agent_memory, input_left, value, comparison_symbol, memtype)
+            elif isinstance(input_left, Attribute):
+                return None
+            else:
+                raise Exception("malformed input_left in comparator {}".format(where_clause))
+
+        # if we made it here, this is a triple
+        try:
+            check_well_formed_triple(where_clause)
+            assert all(
+                k in ["subj", "subj_text", "pred_text", "obj", "obj_text"] for k in where_clause
+            )
+            if not self.run_triple_subqueries(where_clause):
+                return "SELECT uuid FROM Memories WHERE 0", []
+            if where_clause.get("subj"):
+                # the memid of the obj, or its text if it has one, as in get_triples
+                select = "CASE WHEN obj_text IS NULL OR obj_text='' THEN obj ELSE obj_text END"
+            else:
+                select = "subj"
+            return triples_sql(select, **where_clause)
+        except:
+            raise Exception("poorly formed triple dict{}".format(where_clause))
+
     def handle_selector(self, agent_memory, query, memids):
         if query.get("selector"):
             selector_d = query["selector"]
@@ -496,15 +740,25 @@ class MemorySearcher:
         query = self.maybe_convert_query(query)
         # TODO/FIXME memtype ALL
         memtype = query.get("memory_type", default_memtype)
+        node_types = agent_memory.node_children.get(memtype, [])
+        node_type_clause = "node_type IN (" + ",".join(["?"] * len(node_types)) + ")"
         if query.get("where_clause"):
-            memids = self.handle_where(agent_memory, query["where_clause"], memtype)
+            compiled = self.compile_where(agent_memory, query["where_clause"], memtype)
+            if compiled is None:
+                memids = self.handle_where(agent_memory, query["where_clause"], memtype)
+            else:
+                where_sql, args = compiled
+                cmd = (
+                    "SELECT uuid FROM Memories WHERE "
+                    + node_type_clause
+                    + " AND uuid IN ("
+                    + where_sql
+                    + ")"
+                )
+                memids = [m[0] for m in agent_memory._db_read(cmd, *node_types, *args)]
         else:
-            node_types = agent_memory.node_children.get(memtype, [])
-            memids = [
-                m[0]
-                for nt in node_types
-                for m in agent_memory._db_read("SELECT uuid FROM Memories WHERE node_type=?", nt)
-            ]
+            cmd = "SELECT uuid FROM Memories WHERE " + node_type_clause
+            memids = [m[0] for m in agent_memory._db_read(cmd, *node_types)]
         memids = self.handle_selector(agent_memory, query, memids)
         if self.ignore_self:
             try:
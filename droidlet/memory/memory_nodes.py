@@ -450,6 +450,16 @@ class ReferenceObjectNode(MemoryNode):
     def get_bounds(self):
         raise NotImplementedError("must be implemented in subclass")
 
+    @classmethod
+    def batch_pos(cls, xyz):
+        """
+        computes get_pos() of many nodes of this type at once (see memory_attributes),
+        for node types that read it from the ReferenceObjects table on every call.
+        xyz is an N x 3 array with the x, y, z columns of the nodes' ReferenceObjects rows;
+        returns an N x 3 array, or None if get_pos() isn't computed from these columns
+        """
+        return None
+
 
 class PlayerNode(ReferenceObjectNode):
     """This class represents humans and other agents that can affect
@@ -564,6 +574,10 @@ class PlayerNode(ReferenceObjectNode):
         x, y, z = self.pos
         return x, x, y, y, z, z
 
+    @classmethod
+    def batch_pos(cls, xyz):
+        return xyz
+
     def get_struct(self):
         return to_player_struct(self.pos, self.yaw, self.pitch, self.eid, self.name)
 
@@ -872,10 +886,18 @@ class TaskNode(MemoryNode):
     def __init__(self, agent_memory, memid: str):
         super().__init__(agent_memory, memid)
         self.update_node()
-        pickled, created, action_name = self.agent_memory._db_read_one(
-            "SELECT pickled, created, action_name FROM Tasks WHERE uuid=?", memid
+        created, action_name = self.agent_memory._db_read_one(
+            "SELECT created, action_name FROM Tasks WHERE uuid=?", memid
         )
-        self.task = self.agent_memory.safe_unpickle(pickled)
+        # the Task object is shared by all TaskNodes with this memid, and is only
+        # unpickled from the db the first time one of them is built
+        self.task = self.agent_memory.live_tasks.get(memid)
+        if self.task is None:
+            (pickled,) = self.agent_memory._db_read_one(
+                "SELECT pickled FROM Tasks WHERE uuid=?", memid
+            )
+            self.task = self.agent_memory.safe_unpickle(pickled)
+            self.agent_memory.live_tasks[memid] = self.task
         self.created = created
         # TODO changeme to just "name"
         self.action_name = action_name
@@ -937,6 +959,7 @@ class TaskNode(MemoryNode):
             run_count,
             memory.get_time(),
         )
+        memory.live_tasks[memid] = task
         return memid
 
     def step(self, agent):
@@ -944,13 +967,15 @@ class TaskNode(MemoryNode):
         self.update_task()
 
     def update_task(self, task=None):
+        """write the run_count of the task to the db, and make task the live
+        Task object for this memid.  the task is not pickled here; its pickle
+        is rewritten the next time memory.snapshot_tasks() is called.
+        """
         task = task or self.task
-        self.memory.db_write(
-            "UPDATE Tasks SET run_count=?, pickled=? WHERE uuid=?",
-            task.run_count,
-            self.memory.safe_pickle(task),
-            self.memid,
-        )
+        self.task = task
+        self.memory.db_write("UPDATE Tasks SET run_count=? WHERE uuid=?", task.run_count, self.memid)
+        self.memory.register_task(self.memid, task)
+        return self
 
     def update_condition(self, conditions):
         """
@@ -989,27 +1014,29 @@ class TaskNode(MemoryNode):
         and whatever is in the dict will be put on the task.
         """
         status_out = {}
-        for k in ["finished", "prio", "running", "paused"]:
-            # update the task itself, hopefully don't need to do this when task objects are re-written as MemoryNode s
-            if force_task_update:
-                s = status.get(k)
-                if s:
-                    setattr(self.task, k, s)
-            if k == "finished":
-                if self.task.finished:
-                    status_out[k] = self.agent_memory.get_time()
-                    # warning: using the order of the iterator!
-                    status["running"] = 0
-                    status["prio"] = self.FINISHED_PRIO
+        # the (up to four) column writes are committed together
+        with self.agent_memory.batch():
+            for k in ["finished", "prio", "running", "paused"]:
+                # update the task itself, hopefully don't need to do this when task objects are re-written as MemoryNode s
+                if force_task_update:
+                    s = status.get(k)
+                    if s:
+                        setattr(self.task, k, s)
+                if k == "finished":
+                    if self.task.finished:
+                        status_out[k] = self.agent_memory.get_time()
+                        # warning: using the order of the iterator!
+                        status["running"] = 0
+                        status["prio"] = self.FINISHED_PRIO
+                    else:
+                        status_out[k] = -1
                 else:
-                    status_out[k] = -1
-            else:
-                status_out[k] = (
-                    status.get(k) if status.get(k) is not None else getattr(self.task, k, None)
-                )
-            if (status.get(k) is not None) or (force_db_update and status_out[k]):
-                cmd = "UPDATE Tasks SET " + k + "=? WHERE uuid=?"
-                self.agent_memory.db_write(cmd, status_out[k], self.memid)
+                    status_out[k] = (
+                        status.get(k) if status.get(k) is not None else getattr(self.task, k, None)
+                    )
+                if (status.get(k) is not None) or (force_db_update and status_out[k]):
+                    cmd = "UPDATE Tasks SET " + k + "=? WHERE uuid=?"
+                    self.agent_memory.db_write(cmd, status_out[k], self.memid)
         return status_out
 
     # FIXME! or torch me
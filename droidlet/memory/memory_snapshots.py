@@ -0,0 +1,110 @@
+"""
+Copyright (c) Facebook, Inc. and its affiliates.
+"""
+import gzip
+import os
+import pickle
+import sqlite3
+import tempfile
+
+# A full snapshot is a sqlite database file, written with the sqlite backup API; it can
+# be opened with sqlite3 directly.  An incremental snapshot is a gzipped pickle of a dict
+# with the pages of the database that differ from those of a base snapshot:
+#     {"base": path of the base snapshot, relative to the directory of this one,
+#      "page_size": int, "num_pages": int, "pages": {page index: bytes}}
+# the base can itself be incremental.
+
+# the first bytes of every sqlite database file
+SQLITE_HEADER = b"SQLite format 3\x00"
+
+
+def copy_db(db):
+    """copy the main database of the connection db into a new in-memory connection"""
+    copy = sqlite3.connect(":memory:", check_same_thread=False)
+    db.backup(copy)
+    return copy
+
+
+def db_image(db):
+    """the bytes of the database file of the connection db"""
+    fd, tmp_path = tempfile.mkstemp(suffix=".db")
+    os.close(fd)
+    try:
+        dst = sqlite3.connect(tmp_path)
+        db.backup(dst)
+        dst.close()
+        with open(tmp_path, "rb") as f:
+            return f.read()
+    finally:
+        os.remove(tmp_path)
+
+
+def read_snapshot(path):
+    """the bytes of the database file saved in the snapshot at path, following
+    the bases of incremental snapshots"""
+    with open(path, "rb") as f:
+        data = f.read()
+    if data.startswith(SQLITE_HEADER):
+        return data
+    diff = pickle.loads(gzip.decompress(data))
+    image = bytearray(read_snapshot(os.path.join(os.path.dirname(path), diff["base"])))
+    page_size = diff["page_size"]
+    # the database could have shrunk or grown since the base
+    image = image[: diff["num_pages"] * page_size]
+    image.extend(b"\x00" * (diff["num_pages"] * page_size - len(image)))
+    for i, page in diff["pages"].items():
+        image[i * page_size : (i + 1) * page_size] = page
+    return bytes(image)
+
+
+def _replace_file(path, data):
+    """write data to path, so that path is either the old file or the new one"""
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "wb") as f:
+        f.write(data)
+    os.replace(tmp_path, path)
+
+
+def write_snapshot(db, path, base=None):
+    """
+    save the main database of the connection db to path.  if base is the path of an
+    earlier snapshot, only the pages that changed since then are saved
+    """
+    image = db_image(db)
+    if base is None:
+        _replace_file(path, image)
+        return
+    page_size = db.execute("PRAGMA page_size").fetchone()[0]
+    base_image = read_snapshot(base)
+    pages = {}
+    for i in range(len(image) // page_size):
+        page = image[i * page_size : (i + 1) * page_size]
+        if page != base_image[i * page_size : (i + 1) * page_size]:
+            pages[i] = page
+    diff = {
+        "base": os.path.relpath(base, os.path.dirname(os.path.abspath(path))),
+        "page_size": page_size,
+        "num_pages": len(image) // page_size,
+        "pages": pages,
+    }
+    _replace_file(path, gzip.compress(pickle.dumps(diff), compresslevel=1))
+
+
+def load_snapshot(path, db):
+    """replace the main database of the connection db with the one saved at path"""
+    with open(path, "rb") as f:
+        full = f.read(len(SQLITE_HEADER)) == SQLITE_HEADER
+    if full:
+        src = sqlite3.connect(path)
+        src.backup(db)
+        src.close()
+        return
+    fd, tmp_path = tempfile.mkstemp(suffix=".db")
+    try:
+        with os.fdopen(fd, "wb") as f:
+            f.write(read_snapshot(path))
+        src = sqlite3.connect(tmp_path)
+        src.backup(db)
+        src.close()
+    finally:
+        os.remove(tmp_path)
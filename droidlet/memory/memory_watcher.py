@@ -0,0 +1,73 @@
+"""
+Copyright (c) Facebook, Inc. and its affiliates.
+"""
+import uuid
+from typing import Sequence, Tuple
+
+# as for the VoxelIndex, TEMP triggers fire for FOREIGN KEY cascade deletes too, so
+# removing a memory counts as a write to its rows in the watched tables
+WATCH_TRIGGERS = """
+CREATE TEMP TRIGGER IF NOT EXISTS {table}WatchInsert AFTER INSERT ON main.{table}
+    BEGIN SELECT _memory_watcher_changed(NEW.uuid, '{table}');
+END;
+CREATE TEMP TRIGGER IF NOT EXISTS {table}WatchDelete AFTER DELETE ON main.{table}
+    BEGIN SELECT _memory_watcher_changed(OLD.uuid, '{table}');
+END;
+CREATE TEMP TRIGGER IF NOT EXISTS {table}WatchUpdate AFTER UPDATE ON main.{table}
+    BEGIN
+    SELECT _memory_watcher_changed(OLD.uuid, '{table}');
+    SELECT _memory_watcher_changed(NEW.uuid, '{table}');
+END;
+"""
+
+
+class MemoryWatcher:
+    """
+    counts the writes to the rows of some tables, by memid and by table, so that
+    something computed from those rows (e.g. a task Condition) can tell whether
+    it needs to be recomputed without reading the db.
+
+    the counts are kept up to date by TEMP triggers on the watched tables that
+    call back into python, see attach().  the epoch changes when the counts can't
+    be trusted any more (e.g. after a rollback or a restore from backup), so a
+    version from before a reset() never equals one from after it.
+
+    Args:
+        tables (list[string]): the tables to watch; they need a uuid column
+    """
+
+    def __init__(self, tables: Sequence[str]):
+        self.tables = list(tables)
+        self.memid_counts = {}
+        self.table_counts = {}
+        self.reset()
+
+    def attach(self, db):
+        """register the watcher callback on the connection db and create the
+        triggers that use it"""
+        db.create_function("_memory_watcher_changed", 2, self.changed, deterministic=False)
+        db.executescript("".join(WATCH_TRIGGERS.format(table=t) for t in self.tables))
+
+    def changed(self, memid, table):
+        self.memid_counts[memid] = self.memid_counts.get(memid, 0) + 1
+        self.table_counts[table] = self.table_counts.get(table, 0) + 1
+
+    def reset(self):
+        """start a new epoch, e.g. when the db was changed without firing the triggers"""
+        self.epoch = uuid.uuid4().hex
+        self.memid_counts.clear()
+        self.table_counts.clear()
+
+    def get_version(self, memids: Sequence[str] = (), tables: Sequence[str] = ()) -> Tuple:
+        """
+        a value that changes whenever a row of one of the memids in a watched table,
+        or a row of one of the tables, is written
+        """
+        for table in tables:
+            if table not in self.tables:
+                raise Exception("table {} is not watched".format(table))
+        return (
+            self.epoch,
+            tuple(self.memid_counts.get(m, 0) for m in memids),
+            tuple(self.table_counts.get(t, 0) for t in tables),
+        )
@@ -162,6 +162,10 @@ class DetectedObjectNode(ReferenceObjectNode):
         self.pos = (x, y, z)
         return self.pos
 
+    @classmethod
+    def batch_pos(cls, xyz):
+        return xyz
+
     def get_bounds(self):
         minx, miny, minz, maxx, maxy, maxz = self.agent_memory._db_read_one(
             "SELECT minx, miny, minz, maxx, maxy, maxz FROM DetectedObjectFeatures WHERE uuid=?",
@@ -252,6 +256,10 @@ class HumanPoseNode(ReferenceObjectNode):
         self.pos = (x, y, z)
         return self.pos
 
+    @classmethod
+    def batch_pos(cls, xyz):
+        return xyz
+
     # TODO: use a smarter way to get point_at_target
     def get_point_at_target(self):
         x, y, z = self.agent_memory._db_read_one(
@@ -3,22 +3,25 @@ Copyright (c) Facebook, Inc. and its affiliates.
 """
 
 ###TODO put dances back
-import gzip
 import logging
 import numpy as np
 import os
 import pickle
 import sqlite3
+import threading
 import uuid
 import datetime
-from itertools import zip_longest
-from typing import cast, Optional, List, Tuple, Sequence, Union
+from contextlib import contextmanager
+from typing import cast, Optional, List, Tuple, Sequence, Union, TYPE_CHECKING
 from droidlet.base_util import XYZ
 from droidlet.shared_data_structs import Time
 from droidlet.memory.memory_filters import MemorySearcher
 from droidlet.event import dispatch
 from droidlet.memory.memory_util import parse_sql, format_query
 from droidlet.memory.place_field import PlaceField, EmptyPlaceField
+from droidlet.memory.db_log import DbLogWriter
+from droidlet.memory.memory_snapshots import copy_db, write_snapshot, load_snapshot
+from droidlet.memory.memory_watcher import MemoryWatcher
 
 from droidlet.memory.memory_nodes import (  # noqa
     TaskNode,
@@ -35,6 +38,9 @@ from droidlet.memory.memory_nodes import (  # noqa
     NODELIST,
 )
 
+if TYPE_CHECKING:
+    from droidlet.task.task import Task
+
 # FIXME set these in the Task classes
 NONPICKLE_ATTRS = [
     "agent",
@@ -48,6 +54,8 @@ NONPICKLE_ATTRS = [
 
 DEFAULT_PIXELS_PER_UNIT = 100
 SCHEMAS = [os.path.join(os.path.dirname(__file__), "base_memory_schema.sql")]
+# writes to these tables are counted by the MemoryWatcher, see get_watch_version
+WATCHED_TABLES = ["Tasks"]
 
 # TODO when a memory is removed, its last state should be snapshotted to prevent tag weirdness
 
@@ -66,7 +74,7 @@ class AgentMemory:
         on_delete_callback (callable): callable to be run when a memory is deleted from Memories table
 
     Attributes:
-        _db_log_file (FileHandler): File handler for writing database logs
+        _db_log_file (DbLogWriter): Writes the database log in a background thread
         _db_log_idx (int): Database log index
         db (object): connection object to the database file
         _safe_pickle_saved_attrs (dict): Dictionary for pickled attributes
@@ -74,6 +82,7 @@ class AgentMemory:
         nodes (dict): Mapping of node name to table name
         self_memid (str): MemoryID for the AgentMemory
         searcher (MemorySearcher): A class to process searches through memory
+        watcher (MemoryWatcher): Counts the writes to the WATCHED_TABLES
         time (int): The time of the agent
     """
 
@@ -89,13 +98,26 @@ class AgentMemory:
         place_field_pixels_per_unit=DEFAULT_PIXELS_PER_UNIT,
     ):
         if db_log_path:
-            self._db_log_file = gzip.open(db_log_path + ".gz", "w")
+            self._db_log_file = DbLogWriter(db_log_path + ".gz")
             self._db_log_idx = 0
         if os.path.isfile(db_file):
             os.remove(db_file)
-        self.db = sqlite3.connect(db_file, check_same_thread=False)
+        # memory searches compile to a few statement shapes, keep their prepared
+        # statements around
+        self.db = sqlite3.connect(db_file, check_same_thread=False, cached_statements=512)
         self.task_db = {}
         self._safe_pickle_saved_attrs = {}
+        # the Task objects of TaskNodes, by memid.  Tasks.pickled is only brought
+        # up to date for the memids in _dirty_tasks by snapshot_tasks()
+        self.live_tasks = {}
+        self._dirty_tasks = set()
+        self._batch_depth = 0
+        self._batch_hooks = []
+        # changes at or before this version have been dropped from MemoryChanges
+        self._changes_pruned_version = 0
+        # the last snapshot taken, and the thread writing it (see snapshot())
+        self._last_snapshot_path = None
+        self._snapshot_thread = None
 
         self.on_delete_callback = on_delete_callback
 
@@ -107,10 +129,14 @@ class AgentMemory:
         for schema_path in schema_paths:
             with open(schema_path, "r") as f:
                 self._db_script(f.read())
+        self.watcher = MemoryWatcher(WATCHED_TABLES)
+        self.watcher.attach(self.db)
 
         self.all_tables = [
             c[0] for c in self._db_read("SELECT name FROM sqlite_master WHERE type='table';")
         ]
+        # table name -> column names, the schema doesn't change after this
+        self._table_columns = {}
         self.nodes = {}
         for node in nodelist:
             self.nodes[node.NODE_TYPE] = node
@@ -133,7 +159,7 @@ class AgentMemory:
             self.place_field = EmptyPlaceField()
 
     def __del__(self):
-        """Close the database file"""
+        """Close the database log file"""
         if getattr(self, "_db_log_file", None):
             self._db_log_file.close()
 
@@ -263,6 +289,22 @@ class AgentMemory:
     ### General ###
     ###############
 
+    def get_table_columns(self, table: str) -> List[str]:
+        """Return the column names of a table, read from the schema on first use
+
+        Args:
+            table (string): table name
+
+        Examples::
+            >>> get_table_columns("Memories")
+            ['uuid', 'node_type', 'create_time', 'updated_time', 'attended_time', 'is_snapshot']
+        """
+        cols = self._table_columns.get(table)
+        if cols is None:
+            cols = [c[1] for c in self._db_read("PRAGMA table_info({})".format(table))]
+            self._table_columns[table] = cols
+        return cols
+
     def get_node_from_memid(self, memid: str) -> str:
         """Given the memid, return the node type
 
@@ -810,7 +852,7 @@ class AgentMemory:
             >>> memid = '10517cc584844659907ccfa6161e9d32'
             >>> task_stack_update_task(task, memid)
         """
-        self.db_write("UPDATE Tasks SET pickled=? WHERE uuid=?", self.safe_pickle(task), memid)
+        self.register_task(memid, task)
 
     # TORCH this
     def task_stack_peek(self) -> Optional["TaskNode"]:
@@ -954,6 +996,26 @@ class AgentMemory:
         else:
             return None
 
+    def get_tasks_by_prio(self, prio: int) -> List[Tuple[str, "Task"]]:
+        """Return the memid and Task object of each task with the given prio, without
+        building their TaskNodes (e.g. to check the conditions of the waiting tasks)
+
+        Args:
+            prio (int): the prio of the tasks
+
+        Examples ::
+            >>> for memid, task in get_tasks_by_prio(TaskNode.CHECK_PRIO):
+            >>>     if task.init_condition.check(): ...
+        """
+        memids = [r[0] for r in self._db_read("SELECT uuid FROM Tasks WHERE prio=?", prio)]
+        tasks = []
+        for memid in memids:
+            task = self.live_tasks.get(memid)
+            if task is None:
+                task = TaskNode(self, memid).task
+            tasks.append((memid, task))
+        return tasks
+
     #########################
     ###  Database Access  ###
     #########################
@@ -1014,7 +1076,9 @@ class AgentMemory:
         """Return the number of rows affected.  As a side effect,
            sets the updated_time entry for each affected memory,
            and applies self.on_delete_callback to the list of deleted memids
-           if there are any and on_delete_callback is not None
+           if there are any and on_delete_callback is not None.
+           Inside a batch() these side effects (and the commit) are deferred
+           until the batch is flushed.
 
         Args:
             query (string): The query to be run against the database
@@ -1029,17 +1093,8 @@ class AgentMemory:
         """
         start_time = datetime.datetime.now()
         r = self._db_write(query, *args)
-        # some of this can be implemented with TRIGGERS and a python sqlite fn
-        # but its a bit of a pain bc we want the agent's time in the update
-        # not system time
-        updated_memids = self._db_read("SELECT * FROM Updates")
-        updated = [mem[0] for mem in updated_memids if mem[1] == "update"]
-        deleted = [mem[0] for mem in updated_memids if mem[1] == "delete"]
-        for u in set(updated):
-            self.set_memory_updated_time(u)
-        if self.on_delete_callback is not None and deleted:
-            self.on_delete_callback(deleted)
-        self._db_write("DELETE FROM Updates")
+        if self._batch_depth == 0:
+            self._process_updates()
         # format the data to send to dashboard timeline
         query_table, query_operation = parse_sql(query[: query.find("(") - 1])
         query_dict = format_query(query, *args)
@@ -1056,15 +1111,85 @@ class AgentMemory:
             "arguments": query_dict,
             "result": r,
         }
-        dispatch.send("memory", data=hook_data)
+        if self._batch_depth > 0:
+            self._batch_hooks.append(hook_data)
+        else:
+            dispatch.send("memory", data=hook_data)
         return r
 
+    def _process_updates(self):
+        """Read the Updates trigger log, set the updated_time of each
+        updated memory, run on_delete_callback on deleted memories,
+        and clear the log.
+        """
+        # some of this can be implemented with TRIGGERS and a python sqlite fn
+        # but its a bit of a pain bc we want the agent's time in the update
+        # not system time
+        updated_memids = self._db_read("SELECT * FROM Updates")
+        if not updated_memids:
+            return
+        updated = [mem[0] for mem in updated_memids if mem[1] == "update"]
+        deleted = [mem[0] for mem in updated_memids if mem[1] == "delete"]
+        for u in set(updated):
+            self.set_memory_updated_time(u)
+        for memid in deleted:
+            self.live_tasks.pop(memid, None)
+            self._dirty_tasks.discard(memid)
+        if self.on_delete_callback is not None and deleted:
+            self.on_delete_callback(deleted)
+        self._db_write("DELETE FROM Updates")
+
+    @contextmanager
+    def batch(self):
+        """Group writes into a single transaction.  Inside the with block,
+        writes are not committed, the Updates log is not processed and
+        "memory" hooks are not dispatched; all of this happens once when the
+        outermost batch exits.  Reads on this connection see the uncommitted
+        writes, but updated_time of changed memories is only set on flush.
+        If the block raises, the transaction is rolled back.
+        Batches can be nested; only the outermost one flushes.
+
+        Examples ::
+            >>> with memory.batch():
+            >>>     for xyz, idm in changed_blocks:
+            >>>         memory.upsert_block((xyz, idm), memid, "BlockObjects")
+        """
+        self._batch_depth += 1
+        try:
+            yield self
+        except:
+            self._batch_depth -= 1
+            if self._batch_depth == 0:
+                self._rollback()
+            raise
+        self._batch_depth -= 1
+        if self._batch_depth == 0:
+            self._flush_batch()
+
+    def _rollback(self):
+        """Roll back the open transaction and drop the hooks accumulated
+        during the batch.  Subclasses that mirror db state in python should
+        resync it here."""
+        self.db.rollback()
+        self._batch_hooks = []
+        self.watcher.reset()
+
+    def _flush_batch(self):
+        """Process the Updates log, commit, and send the "memory" hooks
+        accumulated during a batch"""
+        self._process_updates()
+        self.db.commit()
+        hooks, self._batch_hooks = self._batch_hooks, []
+        for hook_data in hooks:
+            dispatch.send("memory", data=hook_data)
+
     def _db_write(self, query: str, *args) -> int:
         args = tuple(a.item() if isinstance(a, np.number) else a for a in args)
         try:
             c = self.db.cursor()
             c.execute(query, args)
-            self.db.commit()
+            if self._batch_depth == 0:
+                self.db.commit()
             c.close()
             self._write_to_db_log(query, *args)
             return c.rowcount
@@ -1084,6 +1209,86 @@ class AgentMemory:
         c.close()
         self._write_to_db_log(script, no_format=True)
 
+    #################
+    ###  Changes  ###
+    #################
+
+    def get_changes_version(self) -> int:
+        """Return the version of the MemoryChanges log, i.e. the number of changes logged"""
+        r = self._db_read_one("SELECT seq FROM sqlite_sequence WHERE name='MemoryChanges'")
+        return r[0] if r else 0
+
+    def get_changes(self, tables: List[str], since_version: int = None):
+        """Read the rows of tables that changed after since_version.  The tables must have
+        a uuid column referencing Memories.  If since_version is None, or the changes
+        after it have been pruned, reads all the rows (a snapshot).
+
+        Args:
+            tables (list[string]): names of the tables to read
+            since_version (int): a version returned by an earlier call
+
+        Returns:
+            (int, list[string], dict): the current version; the memids that changed after
+                since_version (None for a snapshot); and, for each table, the current rows
+                of those memids.  a changed memid without rows in a table had its rows
+                removed from it
+
+        Examples::
+            >>> version, _, rows = memory.get_changes(["ReferenceObjects"])
+            >>> # ... memory is changed ...
+            >>> version, memids, rows = memory.get_changes(["ReferenceObjects"], version)
+        """
+        if self._batch_depth == 0:
+            # updates of rows in other tables show up as updates of the Memories row
+            self._process_updates()
+        version = self.get_changes_version()
+        rows = {}
+        if since_version is None or since_version < self._changes_pruned_version:
+            for table in tables:
+                rows[table] = self._db_read("SELECT * FROM {}".format(table))
+            return version, None, rows
+        changed = self._db_read("SELECT uuid FROM MemoryChanges WHERE version>?", since_version)
+        memids = [r[0] for r in changed]
+        for table in tables:
+            if memids:
+                rows[table] = self._db_read(
+                    "SELECT T.* FROM {} AS T INNER JOIN MemoryChanges AS C ON T.uuid=C.uuid "
+                    "WHERE C.version>?".format(table),
+                    since_version,
+                )
+            else:
+                rows[table] = []
+        return version, memids, rows
+
+    def prune_changes(self, version: int):
+        """Drop the changes at or before version from the MemoryChanges log; get_changes
+        with an older since_version returns a snapshot afterwards.  Readers should
+        prune up to the oldest version any of them still reads changes from.
+
+        Args:
+            version (int): a version returned by get_changes
+        """
+        if version > self._changes_pruned_version:
+            self._db_write("DELETE FROM MemoryChanges WHERE version<=?", version)
+            self._changes_pruned_version = version
+
+    def get_watch_version(self, memids: Sequence[str] = (), tables: Sequence[str] = ()):
+        """Return a value that changes whenever the rows of memids in the WATCHED_TABLES,
+        or the rows of tables (which must be WATCHED_TABLES), are written.  Unlike
+        get_changes, this doesn't read the db, it is cheap enough to call every tick.
+
+        Args:
+            memids (list[string]): memory ids
+            tables (list[string]): names of watched tables
+
+        Examples::
+            >>> version = memory.get_watch_version(memids=[task_memid])
+            >>> # ... the task's row in Tasks is updated ...
+            >>> memory.get_watch_version(memids=[task_memid]) != version
+            True
+        """
+        return self.watcher.get_version(memids=memids, tables=tables)
+
     ####################
     ###  DB LOGGING  ###
     ####################
@@ -1104,38 +1309,89 @@ class AgentMemory:
         """
         if not getattr(self, "_db_log_file", None):
             return
-
-        # sub args in for ?
-        split = s.split("?")
-        final = b""
-        for sub, arg in zip_longest(split, args, fillvalue=""):
-            final += str(sub).encode("utf-8")
-            if type(arg) == str and arg != "":
-                # put quotes around string args
-                final += '"{}"'.format(arg).encode("utf-8")
-            else:
-                final += str(arg).encode("utf-8")
-
-        # remove newlines, add semicolon
-        if not no_format:
-            final = final.strip().replace(b"\n", b" ") + b";\n"
-
-        # write to file
-        self._db_log_file.write(final)
-        self._db_log_file.flush()
+        # formatted and written to the file in the writer's thread
+        self._db_log_file.write(s, *args, no_format=no_format)
         self._db_log_idx += 1
 
     ######################
     ###  MISC HELPERS  ###
     ######################
 
+    def snapshot(self, path: str, incremental: bool = False, background: bool = False):
+        """Save the database to path with the sqlite backup API, see restore().
+        The database is first copied page by page into an in-memory copy; that is
+        all the work done on the calling thread if background is True.
+        Must not be called inside a batch().
+
+        Args:
+            path (string): File to write the snapshot to
+            incremental (bool): only save the pages that changed since the last
+                snapshot taken by this memory (restore() needs that one too)
+            background (bool): write the copy to path in a thread
+
+        Returns:
+            the thread writing the snapshot if background is True, else None
+
+        Examples::
+            >>> memory.snapshot("memory.0.db")
+            >>> memory.snapshot("memory.1.db", incremental=True, background=True)
+        """
+        if self.db.in_transaction:
+            raise Exception("cannot snapshot memory with uncommitted writes, e.g. in a batch()")
+        self.snapshot_tasks()
+        copy = copy_db(self.db)
+        if self._snapshot_thread is not None:
+            # an incremental snapshot is based on the previous one
+            self._snapshot_thread.join()
+            self._snapshot_thread = None
+        base = self._last_snapshot_path if incremental else None
+        self._last_snapshot_path = path
+
+        def write():
+            write_snapshot(copy, path, base=base)
+            copy.close()
+
+        if not background:
+            write()
+            return None
+        self._snapshot_thread = threading.Thread(target=write)
+        self._snapshot_thread.start()
+        return self._snapshot_thread
+
+    def restore(self, path: str):
+        """Replace the contents of the database with a snapshot saved by snapshot().
+        Live Task objects are dropped, they are loaded again from their pickles.
+        Must not be called inside a batch().
+
+        Args:
+            path (string): File the snapshot was written to
+        """
+        if self.db.in_transaction:
+            raise Exception("cannot restore memory with uncommitted writes, e.g. in a batch()")
+        if self._snapshot_thread is not None:
+            self._snapshot_thread.join()
+            self._snapshot_thread = None
+        version = self.get_changes_version()
+        load_snapshot(path, self.db)
+        self.live_tasks = {}
+        self._dirty_tasks = set()
+        self.watcher.reset()
+        # keep the change versions increasing, and make readers of the changes
+        # start over from a snapshot
+        version = max(version, self.get_changes_version())
+        self._db_write("UPDATE sqlite_sequence SET seq=? WHERE name='MemoryChanges'", version)
+        self._db_write("DELETE FROM MemoryChanges")
+        self._changes_pruned_version = version
+        self._write_to_db_log("-- restored from {}\n".format(path), no_format=True)
+
     def dump(self, sql_file, dict_memory_file=None):
-        """Dump the database
+        """Dump the database as SQL text; snapshot() is much faster
 
         Args:
             sql_file (string): File to write database dump to
             dict_memory_file (string): File to dump task database to
         """
+        self.snapshot_tasks()
         sql_file.write("\n".join(self.db.iterdump()))
         if dict_memory_file is not None:
             import io
@@ -1144,6 +1400,29 @@ class AgentMemory:
             dict_memory = {"task_db": self.task_db}
             pickle.dump(dict_memory, dict_memory_file)
 
+    def register_task(self, memid: str, task):
+        """Make task the live Task object of the TaskNode with the given memid,
+        and mark its pickle in the Tasks table as out of date
+
+        Args:
+            memid (string): Memory ID of the TaskNode
+            task (Task): The task object
+        """
+        self.live_tasks[memid] = task
+        self._dirty_tasks.add(memid)
+
+    def snapshot_tasks(self):
+        """Write the pickles of the live Task objects that have changed since the
+        last snapshot into the Tasks table"""
+        with self.batch():
+            for memid in self._dirty_tasks:
+                task = self.live_tasks.get(memid)
+                if task is not None:
+                    self.db_write(
+                        "UPDATE Tasks SET pickled=? WHERE uuid=?", self.safe_pickle(task), memid
+                    )
+        self._dirty_tasks.clear()
+
     def reinstate_attrs(self, obj):
         """
         replace non-picklable attrs on blob data, using their values
@@ -1,7 +1,12 @@
 """
 Copyright (c) Facebook, Inc. and its affiliates.
 """
+import gzip
+import os
+import tempfile
+import time
 import unittest
+import zlib
 import numpy as np
 from droidlet.memory.memory_nodes import (
     SelfNode,
@@ -10,10 +15,15 @@ from droidlet.memory.memory_nodes import (
     ChatNode,
     NamedAbstractionNode,
     TripleNode,
+    TaskNode,
 )
 from droidlet.memory.sql_memory import AgentMemory
+from droidlet.memory.db_log import DbLogWriter
 from droidlet.base_util import Pos, Look, Player
 from droidlet.memory.memory_filters import MemorySearcher
+from droidlet.memory.memory_attributes import LinearExtentAttribute, TripleWalk, batch_get_pos
+from droidlet.task.task import Task
+from droidlet.task.condition_classes import TaskRunCountCondition, TaskStatusCondition
 
 
 class IncrementTime:
@@ -232,6 +242,225 @@ class BasicTest(unittest.TestCase):
         assert triple_memid in memids
         assert robert_memid not in memids
 
+    def test_compile_where(self):
+        self.memory = AgentMemory()
+        SelfNode.create(
+            self.memory, Player(1, "robot", Pos(0, 0, 0), Look(0, 0)), memid=self.memory.self_memid
+        )
+        joe_memid = PlayerNode.create(self.memory, Player(10, "joe", Pos(1, 0, 1), Look(0, 0)))
+        jane_memid = PlayerNode.create(self.memory, Player(11, "jane", Pos(-1, 0, 1), Look(0, 0)))
+        ann_memid = PlayerNode.create(self.memory, Player(12, "ann", Pos(3, 0, 1), Look(0, 0)))
+        self.memory.tag(joe_memid, "tall")
+        self.memory.tag(jane_memid, "tall")
+        self.memory.add_triple(subj=ann_memid, pred_text="friend_of", obj=joe_memid)
+
+        m = MemorySearcher()
+        where_clauses = [
+            {
+                "AND": [
+                    {"pred_text": "has_tag", "obj_text": "tall"},
+                    {"NOT": [{"input_left": {"attribute": "name"}, "input_right": "jane"}]},
+                ]
+            },
+            {
+                "OR": [
+                    {
+                        "AND": [
+                            {"pred_text": "has_tag", "obj_text": "tall"},
+                            {
+                                "input_left": {"attribute": "x"},
+                                "input_right": "0",
+                                "comparison_type": "GREATER_THAN",
+                            },
+                        ]
+                    },
+                    {"NOT": [{"pred_text": "has_tag", "obj_text": "tall"}]},
+                ]
+            },
+            {"subj": ann_memid, "pred_text": "friend_of"},
+            {"pred_text": "friend_of", "obj": joe_memid},
+        ]
+        for where_clause in where_clauses:
+            query = {"output": "MEMORY", "memory_type": "Player", "where_clause": where_clause}
+            assert m.compile_where(self.memory, where_clause, "Player") is not None
+            memids, _ = m.search(self.memory, query=query)
+            expected = m.handle_where(self.memory, where_clause, "Player")
+            assert len(memids) == len(set(memids))
+            assert set(memids) == set(expected)
+        memids, _ = m.search(
+            self.memory,
+            query={"output": "MEMORY", "memory_type": "Player", "where_clause": where_clauses[1]},
+        )
+        assert set(memids) == set([joe_memid, ann_memid, self.memory.self_memid])
+
+    def test_batch_attributes(self):
+        self.memory = AgentMemory()
+        joe_memid = PlayerNode.create(self.memory, Player(10, "joe", Pos(1, 0, 1), Look(0, 0)))
+        ann_memid = PlayerNode.create(self.memory, Player(12, "ann", Pos(3, 0, 1), Look(0, 0)))
+        loc_memid = LocationNode.create(self.memory, (5, 6, 7))
+        self.memory.add_triple(subj=ann_memid, pred_text="friend_of", obj=joe_memid)
+        self.memory.add_triple(subj=joe_memid, pred_text="lives_at", obj=loc_memid)
+        mems = [self.memory.get_mem_by_id(m) for m in [joe_memid, ann_memid, loc_memid]]
+
+        # the players' positions come from one query, the location from the node
+        self.memory.db_write("UPDATE ReferenceObjects SET x=2 WHERE uuid=?", joe_memid)
+        positions = batch_get_pos(self.memory, mems)
+        assert positions.tolist() == [list(m.get_pos()) for m in mems]
+        assert positions[0].tolist() == [2, 0, 1]
+
+        walk = TripleWalk(
+            self.memory, [("friend_of", "obj_variable"), ("lives_at", "obj_variable")]
+        )
+        assert [m.memid if m else None for m in walk(mems)] == [None, loc_memid, None]
+        walk = TripleWalk(self.memory, [("friend_of", "subj_variable")])
+        assert [m.memid if m else None for m in walk(mems)] == [ann_memid, None, None]
+
+    def test_spatial_search(self):
+        self.memory = AgentMemory()
+        searcher = MemorySearcher()
+        locs = {LocationNode.create(self.memory, (x, 0, 2 * x)): x for x in range(-20, 21)}
+        joe_memid = PlayerNode.create(self.memory, Player(10, "joe", Pos(1, 0, 1), Look(0, 0)))
+
+        memids = searcher.search_box(self.memory, (-2.5, 3, -1, 1, -10, 10), memtype="Location")
+        assert sorted(locs[m] for m in memids) == [-2, -1, 0, 1, 2, 3]
+        memids = searcher.search_box(self.memory, (0, 1, 0, 0, 0, 1))
+        assert set(memids) == {joe_memid, self.memory.get_location_by_id(memids[0]).memid}
+        assert sorted(m for m in memids if m != joe_memid) == [m for m in locs if locs[m] == 0]
+
+        memids, dists = searcher.search_nearest(
+            self.memory, (10.2, 0, 20.4), k=3, memtype="Location"
+        )
+        assert [locs[m] for m in memids] == [10, 11, 9]
+        assert np.allclose(dists, [0.2 * 5 ** 0.5, 0.8 * 5 ** 0.5, 1.2 * 5 ** 0.5])
+        # the boxes searched grow until there are k memories in them
+        memids, _ = searcher.search_nearest(self.memory, (1000, 0, 0), k=2, memtype="Location")
+        assert [locs[m] for m in memids] == [20, 19]
+        memids, dists = searcher.search_nearest(self.memory, (0, 0, 0), k=100, max_distance=5)
+        assert [abs(locs[m]) for m in memids if m != joe_memid] == [0, 1, 1, 2, 2]
+        assert dists == sorted(dists) and dists[-1] <= 5
+
+        # the index follows the changes to ReferenceObjects
+        self.memory.db_write("UPDATE ReferenceObjects SET x=100, z=0 WHERE uuid=?", joe_memid)
+        memids, dists = searcher.search_nearest(self.memory, (99, 0, 0), k=1)
+        assert memids == [joe_memid] and dists == [1]
+        self.memory.forget(joe_memid)
+        memids, _ = searcher.search_nearest(self.memory, (99, 0, 0), k=1)
+        assert [locs[m] for m in memids] == [20]
+
+        # distance comparisons only evaluate the attribute on memories near the fixed mem
+        SelfNode.create(
+            self.memory, Player(1, "robot", Pos(0, 0, 0), Look(0, 0)), memid=self.memory.self_memid
+        )
+        fixed = self.memory.get_location_by_id(LocationNode.create(self.memory, (0, 0, 0)))
+        L = LinearExtentAttribute(self.memory, {"relative_direction": "AWAY"}, mem=fixed)
+        assert L.bounding_box((5,), "<") == (-5, 5, -5, 5, -5, 5)
+        query = {
+            "memory_type": "Location",
+            "where_clause": {
+                "input_left": {"attribute": L},
+                "comparison_type": "LESS_THAN",
+                "input_right": 5,
+            },
+        }
+        memids, _ = searcher.search(self.memory, query=query)
+        assert sorted(locs[m] for m in memids if m in locs) == [-2, -1, 1, 2]
+
+    def test_changes(self):
+        self.memory = AgentMemory()
+        tables = ["Memories", "Triples", "ReferenceObjects"]
+        version, memids, rows = self.memory.get_changes(tables)
+        assert memids is None
+        assert len(rows["Memories"]) == len(self.memory._db_read("SELECT * FROM Memories"))
+
+        joe_memid = PlayerNode.create(self.memory, Player(10, "joe", Pos(1, 0, 1), Look(0, 0)))
+        version, memids, rows = self.memory.get_changes(tables, version)
+        assert joe_memid in memids
+        assert [r[0] for r in rows["ReferenceObjects"]] == [joe_memid]
+
+        # an update of a row in another table is a change of the memory
+        self.memory.db_write("UPDATE ReferenceObjects SET x=5 WHERE uuid=?", joe_memid)
+        version, memids, rows = self.memory.get_changes(tables, version)
+        assert memids == [joe_memid]
+        assert rows["ReferenceObjects"][0][2] == 5
+
+        tag_memid = self.memory.tag(joe_memid, "tall")
+        version, memids, rows = self.memory.get_changes(tables, version)
+        assert tag_memid in [r[0] for r in rows["Triples"]]
+        self.memory.untag(joe_memid, "tall")
+        version, memids, rows = self.memory.get_changes(tables, version)
+        assert tag_memid in memids
+        assert rows["Triples"] == []
+
+        self.memory.forget(joe_memid)
+        new_version, memids, rows = self.memory.get_changes(tables, version)
+        assert joe_memid in memids
+        assert rows["ReferenceObjects"] == []
+        assert self.memory.get_changes(tables, new_version)[1] == []
+
+        # the changes after version are gone, so a snapshot is returned
+        self.memory.prune_changes(new_version)
+        assert self.memory.get_changes(tables, version)[1] is None
+        assert self.memory.get_changes(tables, new_version)[1] == []
+
+    def test_snapshot(self):
+        self.memory = AgentMemory()
+        joe_memid = PlayerNode.create(self.memory, Player(10, "joe", Pos(1, 0, 1), Look(0, 0)))
+        with tempfile.TemporaryDirectory() as d:
+            paths = [os.path.join(d, "memory.{}.db".format(i)) for i in range(3)]
+            self.memory.snapshot(paths[0])
+            self.memory.db_write("UPDATE ReferenceObjects SET x=5 WHERE uuid=?", joe_memid)
+            self.memory.snapshot(paths[1], incremental=True, background=True).join()
+            assert os.path.getsize(paths[1]) < os.path.getsize(paths[0])
+            ann_memid = PlayerNode.create(self.memory, Player(11, "ann", Pos(3, 0, 1), Look(0, 0)))
+            self.memory.snapshot(paths[2], incremental=True)
+            version = self.memory.get_changes_version()
+
+            self.memory.forget(joe_memid)
+            self.memory.restore(paths[1])
+            assert self.memory.get_player_by_eid(10).pos == (5, 0, 1)
+            assert self.memory.get_player_by_eid(11) is None
+            self.memory.restore(paths[2])
+            assert self.memory.get_player_by_id(ann_memid).name == "ann"
+            # readers of the changes get a snapshot after a restore
+            assert self.memory.get_changes(["Memories"], version)[1] is None
+
+            with self.assertRaises(Exception):
+                with self.memory.batch():
+                    self.memory.tag(ann_memid, "girl")
+                    self.memory.snapshot(paths[0])
+
+    def test_db_log(self):
+        with tempfile.TemporaryDirectory() as d:
+            self.memory = AgentMemory(db_log_path=os.path.join(d, "memory.log"))
+            PlayerNode.create(self.memory, Player(10, "joe", Pos(1, 0, 1), Look(0, 0)))
+            num_entries = self.memory.get_db_log_idx()
+            self.memory._db_log_file.close()
+            with gzip.open(os.path.join(d, "memory.log.gz")) as f:
+                lines = f.read().decode("utf-8").split(";\n")
+            # the schema script is one entry spanning many lines
+            assert len(lines) > num_entries
+            assert any('"joe"' in line for line in lines)
+
+    def test_db_log_writer(self):
+        with tempfile.TemporaryDirectory() as d:
+            path = os.path.join(d, "memory.log.gz")
+            writer = DbLogWriter(path, chunk_size=1000, chunk_time=0.05)
+            for i in range(10):
+                writer.write("INSERT INTO Memories VALUES (?)", i)
+            # a partial chunk reaches the file without waiting for another write
+            time.sleep(0.5)
+            with open(path, "rb") as f:
+                data = zlib.decompressobj(16 + zlib.MAX_WBITS).decompress(f.read())
+            self.assertEqual(data.count(b";\n"), 10)
+
+            for i in range(10, 25):
+                writer.write("INSERT INTO Memories VALUES (?)", i)
+            writer.close()
+            with gzip.open(path) as f:
+                lines = f.read().decode("utf-8").split(";\n")[:-1]
+            expected = ["INSERT INTO Memories VALUES ({})".format(i) for i in range(25)]
+            self.assertEqual(lines, expected)
+
     def test_chat_apis_memory(self):
         self.memory = AgentMemory()
         # Test add_chat
@@ -316,6 +545,125 @@ class BasicTest(unittest.TestCase):
         triples = self.memory.get_triples(subj=jane_memid, pred_text="sister_of")
         assert len(triples) == 0
 
+    def test_batch(self):
+        deleted = []
+        self.memory = AgentMemory(agent_time=self.time, on_delete_callback=deleted.extend)
+        joe_memid = PlayerNode.create(self.memory, Player(10, "joe", Pos(1, 0, 1), Look(0, 0)))
+        jane_memid = PlayerNode.create(self.memory, Player(11, "jane", Pos(-1, 0, 1), Look(0, 0)))
+        cmd = "SELECT updated_time FROM Memories WHERE uuid=?"
+
+        self.time.add_tick()
+        with self.memory.batch():
+            for x in range(5):
+                self.memory.db_write("UPDATE ReferenceObjects SET x=? WHERE uuid=?", x, joe_memid)
+            with self.memory.batch():
+                self.memory.forget(jane_memid)
+            # writes are visible, bookkeeping is deferred until the outer batch exits
+            x = self.memory._db_read_one("SELECT x FROM ReferenceObjects WHERE uuid=?", joe_memid)
+            assert x[0] == 4
+            assert self.memory._db_read(cmd, joe_memid)[0][0] == 0
+            assert len(deleted) == 0
+            assert self.memory.db.in_transaction
+        assert not self.memory.db.in_transaction
+        assert self.memory._db_read(cmd, joe_memid)[0][0] == 1
+        assert deleted == [jane_memid]
+        assert len(self.memory._db_read("SELECT * FROM Updates")) == 0
+
+        # an exception inside the batch rolls back all of its writes
+        try:
+            with self.memory.batch():
+                self.memory.db_write("UPDATE ReferenceObjects SET x=? WHERE uuid=?", 7, joe_memid)
+                raise ValueError
+        except ValueError:
+            pass
+        x = self.memory._db_read_one("SELECT x FROM ReferenceObjects WHERE uuid=?", joe_memid)
+        assert x[0] == 4
+        assert len(self.memory._db_read("SELECT * FROM Updates")) == 0
+
+    def test_task_registry(self):
+        class FakeAgent:
+            pass
+
+        agent = FakeAgent()
+        agent.memory = AgentMemory(agent_time=self.time)
+        task = Task(agent)
+        memid = task.memid
+        mem = TaskNode(agent.memory, memid)
+        assert mem.task is task
+        pickled = "SELECT pickled FROM Tasks WHERE uuid=?"
+        old_pickle = agent.memory._db_read_one(pickled, memid)[0]
+
+        # steps only write the scalar columns
+        task.run_count = 3
+        task.undone = True
+        mem.update_task()
+        assert agent.memory._db_read_one("SELECT run_count FROM Tasks WHERE uuid=?", memid)[0] == 3
+        assert agent.memory._db_read_one(pickled, memid)[0] == old_pickle
+        assert TaskNode(agent.memory, memid).task is task
+
+        # until the live tasks are snapshotted
+        agent.memory.snapshot_tasks()
+        new_pickle = agent.memory._db_read_one(pickled, memid)[0]
+        assert new_pickle != old_pickle
+        assert agent.memory.safe_unpickle(new_pickle).undone
+
+        # a fresh memory (or a cold registry) unpickles the task from the db
+        del agent.memory.live_tasks[memid]
+        mem = TaskNode(agent.memory, memid)
+        assert mem.task is not task
+        assert mem.task.run_count == 3
+        assert agent.memory.live_tasks[memid] is mem.task
+
+        agent.memory.forget(memid)
+        assert memid not in agent.memory.live_tasks
+
+    def test_watched_conditions(self):
+        class FakeAgent:
+            pass
+
+        agent = FakeAgent()
+        agent.memory = AgentMemory(agent_time=self.time)
+        task = Task(agent)
+        finished = TaskStatusCondition(agent.memory, task.memid)
+        run_twice = TaskRunCountCondition(agent.memory, task.memid, N=2)
+        assert not finished.check() and not run_twice.check()
+
+        # without writes to the task's row the conditions don't read the db
+        reads = []
+        evaluate = finished.evaluate
+        finished.evaluate = lambda: reads.append(1) or evaluate()
+        other = Task(agent)
+        TaskNode(agent.memory, other.memid).get_update_status({"prio": 1})
+        assert not finished.check() and reads == []
+
+        task.run_count = 2
+        TaskNode(agent.memory, task.memid).update_task()
+        assert run_twice.check() and not finished.check() and reads == [1]
+        TaskNode(agent.memory, task.memid).get_update_status({"finished": True})
+        assert finished.check()
+
+        # a rolled back write could have been seen, start over
+        version = agent.memory.get_watch_version(memids=[task.memid])
+        try:
+            with agent.memory.batch():
+                agent.memory.db_write("UPDATE Tasks SET finished=-1 WHERE uuid=?", task.memid)
+                assert not finished.check()
+                raise ValueError
+        except ValueError:
+            pass
+        assert agent.memory.get_watch_version(memids=[task.memid]) != version
+        assert finished.check()
+
+        # a removed task is finished
+        waiting = Task(agent)
+        waiting.init_condition = TaskStatusCondition(agent.memory, other.memid)
+        assert [m for m, _ in agent.memory.get_tasks_by_prio(TaskNode.CHECK_PRIO)] == [
+            waiting.memid
+        ]
+        assert not waiting.init_condition.check()
+        agent.memory.forget(other.memid)
+        assert waiting.init_condition.check()
+
 
 class PlaceFieldTest(unittest.TestCase):
     def test_place_field(self):
@@ -1,5 +1,10 @@
+import io
+import time
+import pickle
 import traceback
 import queue
+from multiprocessing import shared_memory
+from multiprocessing.reduction import ForkingPickler
 from typing import Callable, List
 import cloudpickle
 
@@ -39,6 +44,205 @@ class Process(multiprocessing.Process):
         return self._exception
 
 
+# buffers smaller than this are left in the pickle instead of going in shared memory
+MIN_SHARED_BYTES = 1 << 16
+SLOT_ALIGNMENT = 64
+# fields of SharedMemoryQueue.counters
+SENT, RECEIVED, DROPPED, TOTAL_LATENCY, MAX_LATENCY = range(5)
+
+
+class SharedMemoryQueue:
+    """
+    a multiprocessing Queue for items with large numpy arrays in them (e.g. an RGBDepth
+    frame), with a limit on the items waiting in it.
+
+    with shared_memory, the items are pickled with their large buffers out of band, the
+    buffers are written in a slot of a ring of shared memory, and only the pickle and a
+    handle to the slot go through the queue.  the reader copies the slot out once and
+    hands the slot back.  the ring is made by the writer on the first put, with slots of
+    slot_bytes (by default, a quarter more than the buffers of that first item); items
+    whose buffers don't fit in a slot, or that find no free slot, are sent through the
+    queue as usual.
+
+    Args:
+        maxsize (int): items that can wait in the queue; 0 for no limit
+        drop_oldest (bool): if the queue is full, put drops the oldest waiting item
+            instead of blocking, so the reader gets the latest items
+        shared_memory (bool): send large buffers through shared memory
+        slot_bytes (int): size of the shared memory slots
+        num_slots (int): slots in the ring; by default, enough for a full queue
+
+    Attributes:
+        counters: a shared array with the items sent, received and dropped, and the total
+            and max seconds items waited in the queue (see stats)
+    """
+
+    def __init__(
+        self, maxsize=0, drop_oldest=False, shared_memory=False, slot_bytes=None, num_slots=None
+    ):
+        self.maxsize = maxsize
+        self.drop_oldest = drop_oldest
+        self.shared_memory = shared_memory
+        self.slot_bytes = slot_bytes
+        self.num_slots = num_slots or (maxsize + 2 if maxsize > 0 else 4)
+        self._queue = multiprocessing.Queue(maxsize)
+        # the slots the reader is done with, back to the writer
+        self._released = multiprocessing.Queue()
+        self.counters = multiprocessing.Array("d", 5)
+        self._init_local()
+
+    def _init_local(self):
+        # the writer's ring and free slots, and the reader's attached rings, aren't shared
+        self._ring = None
+        self._free = []
+        self._attached = {}
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        for k in ["_ring", "_free", "_attached"]:
+            state.pop(k)
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._init_local()
+
+    def put(self, item, block=True, timeout=None):
+        message = self._pack(item)
+        while True:
+            try:
+                self._queue.put(message, block=block and not self.drop_oldest, timeout=timeout)
+                break
+            except queue.Full:
+                if not self.drop_oldest:
+                    self._free_slot(message)
+                    raise
+            # make room, dropping the oldest item.  the reader may have taken it already
+            try:
+                dropped = self._queue.get(timeout=0.01)
+            except queue.Empty:
+                continue
+            self._free_slot(dropped)
+            self._count(DROPPED)
+        self._count(SENT)
+
+    def get(self, block=True, timeout=None):
+        message = self._queue.get(block, timeout)
+        if message is None:
+            # woken up by wake()
+            raise queue.Empty
+        return self._unpack(message)
+
+    def get_nowait(self):
+        return self.get(block=False)
+
+    def empty(self):
+        return self._queue.empty()
+
+    def wake(self):
+        """make a reader blocked in get raise queue.Empty"""
+        try:
+            self._queue.put_nowait(None)
+        except queue.Full:
+            # the reader has items to get, it isn't blocked
+            pass
+
+    def stats(self):
+        """the items sent, received and dropped, and the mean and max seconds they waited"""
+        with self.counters.get_lock():
+            sent, received, dropped, total, max_latency = self.counters[:]
+        return {
+            "sent": int(sent),
+            "received": int(received),
+            "dropped": int(dropped),
+            "mean_latency": total / received if received else 0.0,
+            "max_latency": max_latency,
+        }
+
+    def close(self):
+        """free the shared memory of this process's side of the queue"""
+        for shm in self._attached.values():
+            shm.close()
+        self._attached = {}
+        if self._ring is not None:
+            self._ring.close()
+            self._ring.unlink()
+            self._ring = None
+
+    def _count(self, field):
+        with self.counters.get_lock():
+            self.counters[field] += 1
+
+    def _pack(self, item):
+        buffers = []
+
+        def out_of_band(buf):
+            if not self.shared_memory or buf.raw().nbytes < MIN_SHARED_BYTES:
+                return True
+            buffers.append(buf)
+            return False
+
+        f = io.BytesIO()
+        pickler = pickle.Pickler(f, protocol=5, buffer_callback=out_of_band)
+        # the reductions of a multiprocessing Queue (e.g. sharing torch tensors)
+        pickler.dispatch_table = ForkingPickler(f, 5).dispatch_table
+        pickler.dump(item)
+        if not buffers:
+            return time.time(), f.getvalue(), None
+
+        raws = [b.raw() for b in buffers]
+        sizes = [-(-r.nbytes // SLOT_ALIGNMENT) * SLOT_ALIGNMENT for r in raws]
+        slot = self._take_slot(sum(sizes))
+        if slot is None:
+            # pickle the buffers in band instead
+            return time.time(), bytes(ForkingPickler.dumps(item, protocol=5)), None
+        start = slot * self.slot_bytes
+        for r, n in zip(raws, sizes):
+            self._ring.buf[start : start + r.nbytes] = r
+            start += n
+        return time.time(), f.getvalue(), (self._ring.name, slot, self.slot_bytes, sizes)
+
+    def _unpack(self, message):
+        sent_time, data, handle = message
+        buffers = None
+        if handle is not None:
+            name, slot, slot_bytes, sizes = handle
+            if name not in self._attached:
+                self._attached[name] = shared_memory.SharedMemory(name=name)
+            start = slot * slot_bytes
+            copy = memoryview(bytearray(self._attached[name].buf[start : start + sum(sizes)]))
+            self._released.put(slot)
+            offsets = [sum(sizes[:i]) for i in range(len(sizes))]
+            buffers = [copy[o : o + n] for o, n in zip(offsets, sizes)]
+        latency = time.time() - sent_time
+        with self.counters.get_lock():
+            self.counters[RECEIVED] += 1
+            self.counters[TOTAL_LATENCY] += latency
+            self.counters[MAX_LATENCY] = max(self.counters[MAX_LATENCY], latency)
+        return pickle.loads(data, buffers=buffers)
+
+    def _take_slot(self, nbytes):
+        if self._ring is None:
+            if self.slot_bytes is None:
+                self.slot_bytes = -(-nbytes * 5 // 4 // SLOT_ALIGNMENT) * SLOT_ALIGNMENT
+            size = self.slot_bytes * self.num_slots
+            self._ring = shared_memory.SharedMemory(create=True, size=size)
+            self._free = list(range(self.num_slots))
+        if nbytes > self.slot_bytes:
+            return None
+        while True:
+            try:
+                self._free.append(self._released.get_nowait())
+            except queue.Empty:
+                break
+        return self._free.pop() if self._free else None
+
+    def _free_slot(self, message):
+        """give back the slot of a message the reader won't get"""
+        if message is not None and message[2] is not None:
+            self._free.append(message[2][1])
+
+
 def _runner(
     _init_fn, init_args, _process_fn, shutdown_event, input_queue, output_queue, exec_empty
 ):
@@ -47,9 +251,12 @@ def _runner(
         process_fn = cloudpickle.loads(_process_fn)
         initial_state = init_fn(*init_args)
 
+        # without exec_empty, wait for the next input (or for stop to wake the runner up)
+        # instead of polling
+        timeout = 0.033 if exec_empty else None
         while not shutdown_event.is_set():
             try:
-                process_args = input_queue.get(block=True, timeout=0.033)
+                process_args = input_queue.get(block=True, timeout=timeout)
                 process_args_aug = (initial_state, *process_args)
                 process_return = process_fn(*process_args_aug)
                 output_queue.put(process_return)
@@ -67,15 +274,43 @@ def _runner(
         while not output_queue.empty():
             output_queue.get()
         raise
+    finally:
+        input_queue.close()
+        output_queue.close()
 
 
 class BackgroundTask:
-    def __init__(self, init_fn: Callable, init_args: List, process_fn: Callable):
+    """
+    runs process_fn(init_fn(*init_args), *args) in a child process for each args put in
+    the task, and returns the results from get.
+
+    Args:
+        queue_depth (int): inputs that can wait for the child; 0 for no limit
+        drop_oldest (bool): if queue_depth inputs are waiting, put drops the oldest instead
+            of blocking (latest-frame-wins)
+        shared_memory (bool): send the large numpy arrays of the inputs and results through
+            shared memory instead of pickling them through the queues; see
+            SharedMemoryQueue
+        slot_bytes (int): size of the shared memory slots for the inputs
+    """
+
+    def __init__(
+        self,
+        init_fn: Callable,
+        init_args: List,
+        process_fn: Callable,
+        queue_depth: int = 0,
+        drop_oldest: bool = False,
+        shared_memory: bool = False,
+        slot_bytes: int = None,
+    ):
         self._init_fn = init_fn
         self._init_args = init_args
         self._process_fn = process_fn
-        self._send_queue = multiprocessing.Queue()
-        self._recv_queue = multiprocessing.Queue()
+        self._send_queue = SharedMemoryQueue(
+            queue_depth, drop_oldest, shared_memory=shared_memory, slot_bytes=slot_bytes
+        )
+        self._recv_queue = SharedMemoryQueue(shared_memory=shared_memory)
         self._shutdown_event = multiprocessing.Event()
 
     def start(self, exec_empty=False):
@@ -109,6 +344,9 @@ class BackgroundTask:
     def stop(self):
         self._raise()
         self._shutdown_event.set()
+        self._send_queue.wake()
+        self._send_queue.close()
+        self._recv_queue.close()
 
     def put(self, *args):
         self._raise()
@@ -122,6 +360,13 @@ class BackgroundTask:
         self._raise()
         return self._recv_queue.get_nowait()
 
+    def stats(self):
+        """
+        the inputs sent to the child, received by it and dropped before it got them, and the
+        mean and max seconds they waited for it
+        """
+        return self._send_queue.stats()
+
 
 # https://stackoverflow.com/a/31614591
 # CC BY-SA 4.0
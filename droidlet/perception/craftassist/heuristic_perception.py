@@ -5,15 +5,18 @@ Copyright (c) Facebook, Inc. and its affiliates.
 import heapq
 import math
 import numpy as np
-from scipy.ndimage.filters import median_filter
+from scipy.ndimage import generate_binary_structure, label, median_filter
 from scipy.optimize import linprog
 from copy import deepcopy
 import logging
-from droidlet.base_util import depth_first_search, to_block_pos, manhat_dist, euclid_dist
+from droidlet.base_util import to_block_pos, manhat_dist, euclid_dist
 from droidlet.shared_data_struct.craftassist_shared_utils import CraftAssistPerceptionData
 
 GROUND_BLOCKS = [1, 2, 3, 7, 8, 9, 12, 79, 80]
 MAX_RADIUS = 20
+# structuring elements for scipy.ndimage.label; faces only, and faces + edges + corners
+ADJACENT = generate_binary_structure(3, 1)
+DIAG_ADJACENT = generate_binary_structure(3, 3)
 
 
 # Taken from : stackoverflow.com/questions/16750618/
@@ -84,16 +87,11 @@ def accessible_interesting_blocks(blocks, pos, boring_blocks, passable_blocks):
     passable = np.isin(blocks, passable_blocks)
     interesting = np.isin(blocks, boring_blocks, invert=True)
     passable_or_interesting = passable | interesting
-    X = np.zeros_like(passable)
-
-    def _fn(p):
-        if passable_or_interesting[p]:
-            X[p] = True
-            return True
-        return False
-
-    depth_first_search(blocks.shape[:3], pos, _fn)
-    return X & interesting
+    labels, _ = label(passable_or_interesting, structure=ADJACENT)
+    l = labels[tuple(pos)]
+    if l == 0:
+        return np.zeros_like(passable)
+    return (labels == l) & interesting
 
 
 def find_closest_component(mask, relpos):
@@ -117,57 +115,95 @@ def connected_components(X, unique_idm=False):
     """Find all connected nonzero components in a array X.
     X is either rank 3 (volume) or rank 4 (volume-idm)
     If unique_idm == True, different block types are different
-    components
+    components.  Connectivity includes diagonal adjacency.
+
+    Components are ordered by the scan (C) order of the location they were
+    found from.  If unique_idm == True, a location diagonally adjacent to an
+    already found component of a different block type is never used to start
+    a new component; so a component all of whose locations are adjacent to
+    earlier components is dropped.
 
     Returns a list of lists of indices of connected components
     """
-    visited = np.zeros((X.shape[0], X.shape[1], X.shape[2]), dtype="bool")
-    components = []
-    current_component = set()
-    diag_adj = build_safe_diag_adjacent([0, X.shape[0], 0, X.shape[1], 0, X.shape[2]])
-
     if len(X.shape) == 3:
         X = np.expand_dims(X, axis=3)
-
-    def is_air(X, i, j, k):
-        return X[i, j, k, 0] == 0
+    nonair = X[:, :, :, 0] != 0
 
     if not unique_idm:
+        labels, num_labels = label(nonair, structure=DIAG_ADJACENT)
+        members, offsets = _group_by_label(labels[nonair], np.flatnonzero(nonair), num_labels)
+        # labels are not guaranteed to be numbered in scan order
+        firsts = np.argsort(members[offsets[:-1]])
+        return [_label_locs(members[offsets[i] : offsets[i + 1]], X.shape[:3]) for i in firsts]
+
+    # label each block type separately, and give the labels disjoint ranges
+    channels = X.reshape(-1, X.shape[3]).T.astype("int64")
+    channels -= channels.min(axis=1, keepdims=True)
+    idm_codes = np.ravel_multi_index(tuple(channels), channels.max(axis=1) + 1)
+    idm_codes = idm_codes.reshape(X.shape[:3])
+    labels = np.zeros(X.shape[:3], dtype="int32")
+    num_labels = 0
+    for idm_code in np.unique(idm_codes[nonair]):
+        idm_labels, n = label(nonair & (idm_codes == idm_code), structure=DIAG_ADJACENT)
+        labels[idm_labels > 0] = idm_labels[idm_labels > 0] + num_labels
+        num_labels += n
+    members, offsets = _group_by_label(labels[nonair], np.flatnonzero(nonair), num_labels)
+    contacts, contact_offsets = _label_contacts(labels, num_labels)
+
+    # a component "covers" its diagonal neighbors.  replay the scan:
+    # a component is found from the first of its locations (in scan order) that is not
+    # covered by a component found from an earlier location.  only locations touching
+    # another component can be covered, so track just those.
+    covered = np.zeros(labels.size, dtype="bool")
+    seeds = [(members[offsets[i]], i, offsets[i]) for i in range(num_labels)]
+    heapq.heapify(seeds)
+    components = []
+    while seeds:
+        flat_idx, i, j = heapq.heappop(seeds)
+        if covered[flat_idx]:
+            uncovered = np.flatnonzero(~covered[members[j + 1 : offsets[i + 1]]])
+            if len(uncovered) > 0:
+                j = j + 1 + uncovered[0]
+                heapq.heappush(seeds, (members[j], i, j))
+            continue
+        covered[contacts[contact_offsets[i] : contact_offsets[i + 1]]] = True
+        components.append(_label_locs(members[offsets[i] : offsets[i + 1]], X.shape[:3]))
+    return components
 
-        def _build_fn(X, current_component, idm):
-            def _fn(p):
-                if X[p[0], p[1], p[2], 0]:
-                    current_component.add(p)
-                    return True
-
-            return _fn
-
-    else:
-
-        def _build_fn(X, current_component, idm):
-            def _fn(p):
-                if tuple(X[p]) == idm:
-                    current_component.add(p)
-                    return True
 
-            return _fn
+def _group_by_label(labels, values, num_labels, keep_order=True):
+    """labels and values are 1d arrays of the same length, with labels in 1, ..., num_labels.
+    Returns (grouped, offsets), where grouped[offsets[i] : offsets[i + 1]] are the values
+    with label i + 1, in their original order if keep_order"""
+    grouped = values[np.argsort(labels, kind="stable" if keep_order else None)]
+    offsets = np.zeros(num_labels + 1, dtype="int64")
+    np.cumsum(np.bincount(labels, minlength=num_labels + 1)[1:], out=offsets[1:])
+    return grouped, offsets
+
+
+def _label_contacts(labels, num_labels):
+    """Returns the flat indices of the locations diagonally adjacent to each label,
+    that have a different nonzero label, grouped as in _group_by_label"""
+    flat_idx = np.arange(labels.size).reshape(labels.shape)
+    src = []
+    dst = []
+    for d in np.argwhere(DIAG_ADJACENT) - 1:
+        # only half of the offsets, the other direction is added with each pair
+        if tuple(d) <= (0, 0, 0):
+            continue
+        a = tuple(slice(0, n - o) if o >= 0 else slice(-o, n) for o, n in zip(d, labels.shape))
+        b = tuple(slice(o, n) if o >= 0 else slice(0, n + o) for o, n in zip(d, labels.shape))
+        la = labels[a]
+        lb = labels[b]
+        touching = (la != lb) & (la > 0) & (lb > 0)
+        src.extend([la[touching], lb[touching]])
+        dst.extend([flat_idx[b][touching], flat_idx[a][touching]])
+    return _group_by_label(np.concatenate(src), np.concatenate(dst), num_labels, False)
 
-    for i in range(visited.shape[0]):
-        for j in range(visited.shape[1]):
-            for k in range(visited.shape[2]):
-                if visited[i, j, k]:
-                    continue
-                visited[i, j, k] = True
-                if is_air(X, i, j, k):
-                    continue
-                # found a new component
-                pos = (i, j, k)
-                _fn = _build_fn(X, current_component, tuple(X[i, j, k, :]))
-                visited |= depth_first_search(X.shape[:3], pos, _fn, diag_adj)
-                components.append(list(current_component))
-                current_component.clear()
 
-    return components
+def _label_locs(flat_idx, shape):
+    """converts flat indices into a list of index tuples"""
+    return list(zip(*(l.tolist() for l in np.unravel_index(flat_idx, shape))))
 
 
 def check_between(entities, get_locs_from_entity, fat_scale=0.2):
@@ -382,81 +418,110 @@ def get_nearby_airtouching_blocks(
     return blocktypes, all_components, all_tags
 
 
+def _surface_maps(agent, location, radius, max_height):
+    """Returns (height_map, idm_map) for the (2 * radius + 1) square of columns
+    centred on location: the height of the highest block at or below max_height
+    in each column that is not air, a mobile block (383), location itself or
+    the agent's position, and the idm of that block.  The blocks are fetched
+    a slab of 2 * radius + 1 layers at a time, going down until every column
+    has been resolved."""
+    sx, sy, sz = location
+    map_size = radius * 2 + 1
+    height_map = np.zeros((map_size, map_size), dtype="int64")
+    idm_map = np.zeros((map_size, map_size, 2), dtype="int64")
+    resolved = np.zeros((map_size, map_size), dtype="bool")
+    top = max_height
+    while not resolved.all():
+        bottom = top - map_size + 1
+        B = agent.get_blocks(sx - radius, sx + radius, bottom, top, sz - radius, sz + radius)
+        B = B.transpose(2, 1, 0, 3)  # yzx -> xzy
+        solid = (B[:, :, :, 0] != 0) & (B[:, :, :, 0] != 383)
+        for px, py, pz in (location, agent.pos):
+            i, j, k = px - sx + radius, pz - sz + radius, py - bottom
+            if all(c == int(c) for c in (i, j, k)) and 0 <= i < map_size and 0 <= j < map_size:
+                if 0 <= k < solid.shape[2]:
+                    solid[int(i), int(j), int(k)] = False
+        found = solid.any(axis=2) & ~resolved
+        k = solid.shape[2] - 1 - solid[:, :, ::-1].argmax(axis=2)
+        height_map[found] = bottom + k[found]
+        I, J = found.nonzero()
+        idm_map[I, J] = B[I, J, k[found]]
+        resolved |= found
+        top = bottom - 1
+    return height_map, idm_map
+
+
 def get_all_nearby_holes(agent, location, block_data, fill_idmeta, radius=15, store_inst_seg=True):
     """Returns:
     a list of holes. Each hole is an InstSegNode"""
     sx, sy, sz = location
-    max_height = sy + 5
+    max_height = sy + 5  # fudge factor 5
     map_size = radius * 2 + 1
-    height_map = [[sz] * map_size for i in range(map_size)]
-    hid_map = [[-1] * map_size for i in range(map_size)]
-    idm_map = [[(0, 0)] * map_size for i in range(map_size)]
-    visited = set([])
-    global current_connected_comp, current_idm
-    current_connected_comp = []
-    current_idm = (2, 0)
-
-    # utility functions
-    def get_block_info(x, z):  # fudge factor 5
-        height = max_height
-        while True:
-            B = agent.get_blocks(x, x, height, height, z, z)
-            if (
-                (B[0, 0, 0, 0] != 0)
-                and (x != sx or z != sz or height != sy)
-                and (x != agent.pos[0] or z != agent.pos[2] or height != agent.pos[1])
-                and (B[0, 0, 0, 0] != 383)
-            ):  # if it's not a mobile block (agent, speaker, mobs)
-                return height, tuple(B[0, 0, 0])
-            height -= 1
-
+    height_map, idm_map = _surface_maps(agent, location, radius, max_height)
+    hid_map = np.full((map_size, map_size), -1, dtype="int64")
+    # visited[x, z] is the last level y at which column (x, z) was visited.  levels
+    # are popped from the queue in increasing order, so this is the same as keeping
+    # the set of visited (x, y, z)
+    visited = np.full((map_size, map_size), -(2 ** 62), dtype="int64")
     gx = [0, 0, -1, 1]
     gz = [1, -1, 0, 0]
 
-    def dfs(x, y, z):
-        """Traverse current connected component and return minimum
-        height of all surrounding blocks"""
-        build_height = 100000
-        if (x, y, z) in visited:
-            return build_height
-        global current_connected_comp, current_idm
-        current_connected_comp.append((x - radius + sx, y, z - radius + sz))  # absolute positions
-        visited.add((x, y, z))
-        for d in range(4):
-            nx = x + gx[d]
-            nz = z + gz[d]
-            if nx >= 0 and nz >= 0 and nx < map_size and nz < map_size:
-                if height_map[x][z] == height_map[nx][nz]:
-                    build_height = min(build_height, dfs(nx, y, nz))
-                else:
-                    build_height = min(build_height, height_map[nx][nz])
-                    current_idm = idm_map[nx][nz]
-            else:
+    def flood(x, y, z):
+        """Traverse the connected component of (x, z) at level y, in the order a
+        recursive depth first search would.  Returns the component (absolute
+        positions), the idm of the last differing neighbour seen (or (2, 0)) and
+        the minimum height of all surrounding blocks, or -100000 if the component
+        runs off the map"""
+        component = [(x - radius + sx, y, z - radius + sz)]
+        idm = (2, 0)
+        visited[x, z] = y
+        h = height_map[x, z]
+        # each frame is [x, z, next direction, build height]
+        stack = [[x, z, 0, 100000]]
+        while True:
+            frame = stack[-1]
+            cx, cz, d, build_height = frame
+            if d < 4:
+                frame[2] = d + 1
+                nx = cx + gx[d]
+                nz = cz + gz[d]
+                if nx >= 0 and nz >= 0 and nx < map_size and nz < map_size:
+                    nh = height_map[nx, nz]
+                    if nh != h:
+                        frame[3] = min(build_height, nh)
+                        idm = idm_map[nx, nz]
+                    elif visited[nx, nz] != y:
+                        visited[nx, nz] = y
+                        component.append((nx - radius + sx, y, nz - radius + sz))
+                        stack.append([nx, nz, 0, 100000])
+                    continue
                 # bad ... hole is not within defined radius
-                return -100000
-        return build_height
+                build_height = -100000
+            stack.pop()
+            if not stack:
+                return component, tuple(int(i) for i in idm), int(build_height)
+            stack[-1][3] = min(stack[-1][3], build_height)
 
     # find all holes
-    blocks_queue = []
-    for i in range(map_size):
-        for j in range(map_size):
-            height_map[i][j], idm_map[i][j] = get_block_info(i - radius + sx, j - radius + sz)
-            heapq.heappush(blocks_queue, (height_map[i][j] + 1, (i, height_map[i][j] + 1, j)))
+    blocks_queue = [
+        (int(height_map[i, j]) + 1, (i, int(height_map[i, j]) + 1, j))
+        for i in range(map_size)
+        for j in range(map_size)
+    ]
+    heapq.heapify(blocks_queue)
     holes = []
     while len(blocks_queue) > 0:
         hxyz = heapq.heappop(blocks_queue)
         h, (x, y, z) = hxyz  # NB: relative positions
-        if (x, y, z) in visited or y > max_height:
+        if visited[x, z] == y or y > max_height:
             continue
-        assert h == height_map[x][z] + 1, " h=%d heightmap=%d, x,z=%d,%d" % (
+        assert h == height_map[x, z] + 1, " h=%d heightmap=%d, x,z=%d,%d" % (
             h,
-            height_map[x][z],
+            height_map[x, z],
             x,
             z,
         )  # sanity check
-        current_connected_comp = []
-        current_idm = (2, 0)
-        build_height = dfs(x, y, z)
+        current_connected_comp, current_idm, build_height = flood(x, y, z)
         if build_height >= h:
             holes.append((current_connected_comp.copy(), current_idm))
             cur_hid = len(holes) - 1
@@ -464,11 +529,11 @@ def get_all_nearby_holes(agent, location, block_data, fill_idmeta, radius=15, st
                 x, y, z = xyz
                 rx, ry, rz = x - sx + radius, y + 1, z - sz + radius
                 heapq.heappush(blocks_queue, (ry, (rx, ry, rz)))
-                height_map[rx][rz] += 1
-                if hid_map[rx][rz] != -1:
-                    holes[cur_hid][0].extend(holes[hid_map[rx][rz]][0])
-                    holes[hid_map[rx][rz]] = ([], (0, 0))
-                hid_map[rx][rz] = cur_hid
+                height_map[rx, rz] += 1
+                if hid_map[rx, rz] != -1:
+                    holes[cur_hid][0].extend(holes[hid_map[rx, rz]][0])
+                    holes[hid_map[rx, rz]] = ([], (0, 0))
+                hid_map[rx, rz] = cur_hid
 
     # A bug in the algorithm above produces holes that include non-air blocks.
     # Just patch the problem here, since this function will eventually be
@@ -0,0 +1,282 @@
+"""
+Copyright (c) Facebook, Inc. and its affiliates.
+"""
+import heapq
+import logging
+import unittest
+from timeit import Timer
+import numpy as np
+from droidlet.base_util import depth_first_search
+from droidlet.perception.craftassist.heuristic_perception import (
+    accessible_interesting_blocks,
+    build_safe_diag_adjacent,
+    connected_components,
+    get_all_nearby_holes,
+)
+from droidlet.lowlevel.minecraft.mc_util import fill_idmeta
+
+
+# the pure-python implementations these are checked against
+def dfs_connected_components(X, unique_idm=False):
+    visited = np.zeros((X.shape[0], X.shape[1], X.shape[2]), dtype="bool")
+    components = []
+    current_component = set()
+    diag_adj = build_safe_diag_adjacent([0, X.shape[0], 0, X.shape[1], 0, X.shape[2]])
+    if len(X.shape) == 3:
+        X = np.expand_dims(X, axis=3)
+
+    def _build_fn(idm):
+        def _fn(p):
+            if (tuple(X[p]) == idm) if unique_idm else X[p[0], p[1], p[2], 0]:
+                current_component.add(p)
+                return True
+
+        return _fn
+
+    for i in range(visited.shape[0]):
+        for j in range(visited.shape[1]):
+            for k in range(visited.shape[2]):
+                if visited[i, j, k]:
+                    continue
+                visited[i, j, k] = True
+                if X[i, j, k, 0] == 0:
+                    continue
+                _fn = _build_fn(tuple(X[i, j, k, :]))
+                visited |= depth_first_search(X.shape[:3], (i, j, k), _fn, diag_adj)
+                components.append(list(current_component))
+                current_component.clear()
+    return components
+
+
+def dfs_accessible_interesting_blocks(blocks, pos, boring_blocks, passable_blocks):
+    passable = np.isin(blocks, passable_blocks)
+    interesting = np.isin(blocks, boring_blocks, invert=True)
+    passable_or_interesting = passable | interesting
+    X = np.zeros_like(passable)
+
+    def _fn(p):
+        if passable_or_interesting[p]:
+            X[p] = True
+            return True
+        return False
+
+    depth_first_search(blocks.shape[:3], pos, _fn)
+    return X & interesting
+
+
+def dfs_get_all_nearby_holes(agent, location, fill_idmeta, radius=15):
+    sx, sy, sz = location
+    max_height = sy + 5
+    map_size = radius * 2 + 1
+    height_map = [[sz] * map_size for i in range(map_size)]
+    hid_map = [[-1] * map_size for i in range(map_size)]
+    idm_map = [[(0, 0)] * map_size for i in range(map_size)]
+    visited = set([])
+    state = {"comp": [], "idm": (2, 0)}
+
+    def get_block_info(x, z):
+        height = max_height
+        while True:
+            B = agent.get_blocks(x, x, height, height, z, z)
+            if (
+                (B[0, 0, 0, 0] != 0)
+                and (x != sx or z != sz or height != sy)
+                and (x != agent.pos[0] or z != agent.pos[2] or height != agent.pos[1])
+                and (B[0, 0, 0, 0] != 383)
+            ):
+                return height, tuple(B[0, 0, 0])
+            height -= 1
+
+    gx = [0, 0, -1, 1]
+    gz = [1, -1, 0, 0]
+
+    def dfs(x, y, z):
+        build_height = 100000
+        if (x, y, z) in visited:
+            return build_height
+        state["comp"].append((x - radius + sx, y, z - radius + sz))
+        visited.add((x, y, z))
+        for d in range(4):
+            nx = x + gx[d]
+            nz = z + gz[d]
+            if nx >= 0 and nz >= 0 and nx < map_size and nz < map_size:
+                if height_map[x][z] == height_map[nx][nz]:
+                    build_height = min(build_height, dfs(nx, y, nz))
+                else:
+                    build_height = min(build_height, height_map[nx][nz])
+                    state["idm"] = idm_map[nx][nz]
+            else:
+                return -100000
+        return build_height
+
+    blocks_queue = []
+    for i in range(map_size):
+        for j in range(map_size):
+            height_map[i][j], idm_map[i][j] = get_block_info(i - radius + sx, j - radius + sz)
+            heapq.heappush(blocks_queue, (height_map[i][j] + 1, (i, height_map[i][j] + 1, j)))
+    holes = []
+    while len(blocks_queue) > 0:
+        h, (x, y, z) = heapq.heappop(blocks_queue)
+        if (x, y, z) in visited or y > max_height:
+            continue
+        state["comp"] = []
+        state["idm"] = (2, 0)
+        build_height = dfs(x, y, z)
+        if build_height >= h:
+            holes.append((state["comp"].copy(), state["idm"]))
+            cur_hid = len(holes) - 1
+            for xyz in state["comp"]:
+                x, y, z = xyz
+                rx, ry, rz = x - sx + radius, y + 1, z - sz + radius
+                heapq.heappush(blocks_queue, (ry, (rx, ry, rz)))
+                height_map[rx][rz] += 1
+                if hid_map[rx][rz] != -1:
+                    holes[cur_hid][0].extend(holes[hid_map[rx][rz]][0])
+                    holes[hid_map[rx][rz]] = ([], (0, 0))
+                hid_map[rx][rz] = cur_hid
+    for i, (xyzs, idm) in enumerate(holes):
+        blocks = fill_idmeta(agent, xyzs)
+        holes[i] = ([xyz for xyz, (d, _) in blocks if d == 0], idm)
+    return [h for h in holes if len(h[0]) > 0]
+
+
+class FakeWorldAgent:
+    """get_blocks over a numpy world of idms in xyz order, with bedrock below it
+    and air above"""
+
+    def __init__(self, world, pos):
+        self.world = world
+        self.pos = pos
+
+    def get_blocks(self, xa, xb, ya, yb, za, zb):
+        B = np.zeros((yb - ya + 1, zb - za + 1, xb - xa + 1, 2), dtype="int64")
+        for y in range(ya, yb + 1):
+            for z in range(za, zb + 1):
+                for x in range(xa, xb + 1):
+                    if y < 0:
+                        B[y - ya, z - za, x - xa] = (7, 0)
+                    elif y < self.world.shape[1]:
+                        B[y - ya, z - za, x - xa] = self.world[x, y, z]
+        return B
+
+
+def random_terrain(rng, size, height):
+    """a world with a random height map, with a few mobile (383) blocks on top"""
+    world = np.zeros((size, height, size, 2), dtype="int64")
+    ground = rng.integers(1, height - 6, size=(size, size))
+    for x in range(size):
+        for z in range(size):
+            world[x, : ground[x, z], z] = (rng.choice([1, 2, 3]), rng.integers(0, 2))
+            if rng.random() < 0.05:
+                world[x, ground[x, z], z] = (383, 0)
+    return world
+
+
+def random_blocks(rng, shape, density, bids):
+    bid = rng.choice(bids, size=shape)
+    meta = rng.integers(0, 2, size=shape)
+    bid[rng.random(shape) > density] = 0
+    return np.stack([bid, meta * (bid > 0)], axis=3)
+
+
+class ConnectedComponentsTest(unittest.TestCase):
+    def assert_same_components(self, X, unique_idm):
+        expected = dfs_connected_components(X, unique_idm=unique_idm)
+        actual = connected_components(X, unique_idm=unique_idm)
+        assert [set(c) for c in actual] == [set(c) for c in expected]
+
+    def test_parity(self):
+        rng = np.random.default_rng(0)
+        for shape in [(1, 1, 1), (5, 7, 3), (12, 12, 12), (20, 3, 9)]:
+            for density in [0.0, 0.05, 0.2, 0.5, 1.0]:
+                X = random_blocks(rng, shape, density, [1, 2, 3])
+                for unique_idm in [False, True]:
+                    self.assert_same_components(X, unique_idm)
+                    self.assert_same_components(X[:, :, :, 0], unique_idm)
+
+    def test_diagonal_and_idm(self):
+        X = np.zeros((4, 4, 4, 2), dtype="int64")
+        X[0, 0, 0] = (1, 0)
+        X[1, 1, 1] = (1, 0)
+        X[3, 3, 3] = (2, 0)
+        X[3, 3, 0] = (1, 0)
+        X[3, 2, 0] = (1, 1)
+        assert len(connected_components(X)) == 3
+        components = connected_components(X, unique_idm=True)
+        assert [set(c) for c in components] == [
+            {(0, 0, 0), (1, 1, 1)},
+            {(3, 2, 0)},
+            {(3, 3, 3)},
+        ]
+        # (3, 3, 0) is adjacent to (3, 2, 0), found first; it doesn't start a component
+        self.assert_same_components(X, True)
+
+
+class AccessibleInterestingBlocksTest(unittest.TestCase):
+    def test_parity(self):
+        rng = np.random.default_rng(0)
+        boring_blocks = [0, 1, 2]
+        passable_blocks = [0, 5]
+        for _ in range(20):
+            blocks = rng.choice([0, 0, 0, 1, 2, 3, 4, 5], size=(15, 15, 15))
+            # the old search wraps around at the low faces through negative indexing;
+            # wall the volume off with an impassable boring block so that can't happen
+            blocks[[0, -1], :, :] = 1
+            blocks[:, [0, -1], :] = 1
+            blocks[:, :, [0, -1]] = 1
+            pos = tuple(rng.integers(1, 14, size=3))
+            expected = dfs_accessible_interesting_blocks(
+                blocks, pos, boring_blocks, passable_blocks
+            )
+            actual = accessible_interesting_blocks(blocks, pos, boring_blocks, passable_blocks)
+            assert (actual == expected).all()
+
+
+class NearbyHolesTest(unittest.TestCase):
+    def test_parity(self):
+        rng = np.random.default_rng(0)
+        for radius in [1, 3, 6]:
+            for _ in range(10):
+                world = random_terrain(rng, 2 * radius + 5, 10)
+                # anywhere the searched square (and the blocks around it) is in the world
+                x, z = (int(c) for c in rng.integers(radius + 1, radius + 4, size=2))
+                location = (x, 3, z)
+                agent = FakeWorldAgent(world, (location[0] + 1, 4, location[2]))
+                expected = dfs_get_all_nearby_holes(agent, location, fill_idmeta, radius)
+                actual = get_all_nearby_holes(agent, location, None, fill_idmeta, radius)
+                assert actual == expected
+
+    def test_flat_pit(self):
+        """a pit too large for a recursive search"""
+        world = np.zeros((51, 8, 51, 2), dtype="int64")
+        world[:, :5] = (1, 0)
+        world[7:44, 2:5, 7:44] = (0, 0)
+        agent = FakeWorldAgent(world, (25, 4, 25))
+        holes = get_all_nearby_holes(agent, (25, 4, 25), None, fill_idmeta, 20)
+        assert len(holes) == 1
+        xyzs, idm = holes[0]
+        assert idm == (1, 0)
+        assert len(set(xyzs)) == 37 * 37 * 3
+
+
+class HeuristicPerceptionBenchmark(unittest.TestCase):
+    def test_perceive_cube(self):
+        """labels a 41^3 cube, the size heuristic perception runs over around the agent"""
+        rng = np.random.default_rng(0)
+        X = random_blocks(rng, (41, 41, 41), 0.3, [1, 2, 3, 4])
+        for unique_idm in [False, True]:
+            t = Timer(lambda: connected_components(X, unique_idm=unique_idm))
+            logging.info(
+                "connected_components unique_idm={} runtime {} s".format(
+                    unique_idm, t.timeit(number=1)
+                )
+            )
+        t = Timer(lambda: accessible_interesting_blocks(X[:, :, :, 0], (20, 20, 20), [0, 1], [0]))
+        logging.info("accessible_interesting_blocks runtime {} s".format(t.timeit(number=1)))
+
+    def test_nearby_holes(self):
+        rng = np.random.default_rng(0)
+        world = random_terrain(rng, 35, 12)
+        agent = FakeWorldAgent(world, (18, 8, 17))
+        t = Timer(lambda: get_all_nearby_holes(agent, (17, 7, 17), None, fill_idmeta, 15))
+        logging.info("get_all_nearby_holes runtime {} s".format(t.timeit(number=1)))
@@ -47,10 +47,14 @@ class Perception:
             return rgb_depth, detections, humans, xyz
 
         self.vprocess = BackgroundTask(
-            init_fn=slow_perceive_init, init_args=(model_data_dir,), process_fn=slow_perceive_run
+            init_fn=slow_perceive_init,
+            init_args=(model_data_dir,),
+            process_fn=slow_perceive_run,
+            queue_depth=1,
+            drop_oldest=True,
+            shared_memory=True,
         )
         self.vprocess.start()
-        self.slow_vision_ready = True
 
         self.vision = self.setup_vision_handlers()
         self.audio = None
@@ -90,13 +94,11 @@ class Perception:
 
         """
 
-        if self.slow_vision_ready:
-            self.vprocess.put(rgb_depth, xyz)
-            self.slow_vision_ready = False
+        # a frame still waiting for SlowPerception is dropped for this newer one
+        self.vprocess.put(rgb_depth, xyz)
 
         try:
             old_image, detections, humans, old_xyz = self.vprocess.get(block=force)
-            self.slow_vision_ready = True
         except queue.Empty:
             old_image, detections, humans, old_xyz = None, None, None, None
 
@@ -5,10 +5,11 @@ import logging
 import os
 from typing import Dict
 from .nsp_transformer_model.query_model import NSPBertModel as Model
+from .utils.parse_cache import ParseCache, file_checksum
 
 
 class DroidletSemanticParsingModel:
-    def __init__(self, models_dir, data_dir):
+    def __init__(self, models_dir, data_dir, parse_cache_path="", cpu_inference=""):
         """The SemanticParsingModel converts natural language
         commands to logical forms.
 
@@ -23,18 +24,29 @@ class DroidletSemanticParsingModel:
         - agent (str): the agent that processed the command
         - time (int): current time in UTC
 
+        Model outputs are cached by preprocessed chat, in memory and, if
+        parse_cache_path is set, in a sqlite file keyed by the model checksum.
+
         args:
             models_dir (str): path to semantic parsing models
             data_dir (str): path to ground truth data directory
+            parse_cache_path (str): sqlite file to store parses in, not stored on disk if empty
+            cpu_inference (str): "quantize" to run a dynamically int8 quantized model on CPU
         """
         # Instantiate the main model
         nlu_model_dir = os.path.join(models_dir, "ttad_bert_updated")
         logging.info("using model_dir={}".format(nlu_model_dir))
 
         if os.path.isdir(data_dir) and os.path.isdir(nlu_model_dir):
-            self.model = Model(model_dir=nlu_model_dir, data_dir=data_dir)
+            self.model = Model(
+                model_dir=nlu_model_dir, data_dir=data_dir, cpu_inference=cpu_inference
+            )
         else:
             raise NotADirectoryError
+        model_checksum = "{}:{}".format(
+            file_checksum(os.path.join(nlu_model_dir, "caip_test_model.pth")), cpu_inference
+        )
+        self.parse_cache = ParseCache(model_checksum, parse_cache_path)
 
     def query_for_logical_form(self, chat: str) -> Dict:
         """Get logical form output for a given chat command.
@@ -62,6 +74,11 @@ class DroidletSemanticParsingModel:
                 }]
             }
         """
+        logical_form = self.parse_cache.get(chat)
+        if logical_form is not None:
+            logging.info("Found cached parse for {}".format(chat))
+            return logical_form
         logging.info("Querying the semantic parsing model")
         logical_form = self.model.parse(chat=chat)
+        self.parse_cache.put(chat, logical_form)
         return logical_form
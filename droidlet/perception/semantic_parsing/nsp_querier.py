@@ -42,11 +42,16 @@ class NSPQuerier(object):
         )
         try:
             self.parsing_model = DroidletSemanticParsingModel(
-                opts.nsp_models_dir, opts.nsp_data_dir
+                opts.nsp_models_dir,
+                opts.nsp_data_dir,
+                parse_cache_path=getattr(opts, "nsp_parse_cache", ""),
+                cpu_inference=getattr(opts, "nsp_cpu_inference", ""),
             )
         except NotADirectoryError:
             # No parsing model
             self.parsing_model = None
+        # built on first use, see validate_parse_tree
+        self.json_validator = None
         # Read the ground truth dataset file: ground_truth/datasets folder
         self.ground_truth_actions = get_ground_truth(
             self.opts.no_ground_truth, self.opts.ground_truth_data_dir
@@ -159,12 +164,13 @@ class NSPQuerier(object):
         Returns:
             True if parse tree is valid, False if not.
         """
-        # RefResolver initialization requires a base schema and URI
-        schema_dir = "{}/".format(
-            pkg_resources.resource_filename("droidlet.documents", "json_schema")
-        )
-        json_validator = JSONValidator(schema_dir, span_type="all")
-        is_valid_json = json_validator.validate_instance(parse_tree, debug)
+        if self.json_validator is None:
+            # RefResolver initialization requires a base schema and URI
+            schema_dir = "{}/".format(
+                pkg_resources.resource_filename("droidlet.documents", "json_schema")
+            )
+            self.json_validator = JSONValidator(schema_dir, span_type="all")
+        is_valid_json = self.json_validator.validate_instance(parse_tree, debug)
         return is_valid_json
 
     def get_logical_form(self, chat: str, parsing_model) -> Dict:
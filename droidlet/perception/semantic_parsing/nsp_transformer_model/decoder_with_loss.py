@@ -85,29 +85,42 @@ class DecoderWithLoss(nn.Module):
         self.fixed_span_loss = torch.nn.CrossEntropyLoss(ignore_index=-1, reduction="none")
         self.tree_to_text = args.tree_to_text
 
-    def step(self, y, y_mask, x_reps, x_mask):
+    def step(self, y, y_mask, x_reps, x_mask, past_key_values=None, use_cache=False):
         """Without loss, used at prediction time.
 
         TODO: add previously computed y_rep, currently y only has the node indices, not spans.
 
+        With use_cache=True the self- and cross-attention keys and values are returned
+        in res["past_key_values"]. When these are passed back in on the next call, the
+        decoder and the output heads only run over the positions of y that are not
+        cached yet, so the scores only cover those positions.
+
         Args:
             y: targets
             y_mask: mask for targets
             x_reps: encoder hidden states
             x_mask: input mask
+            past_key_values: keys and values returned by a previous call with use_cache=True
+            use_cache (bool): whether to return the keys and values
 
         Returns:
             Dictionary containing scores from each output head
 
         """
-        y_rep = self.bert(
-            labels=y,
-            input_ids=y,
+        past_length = past_key_values[0][0].shape[2] if past_key_values is not None else 0
+        y_new = y[:, past_length:]
+        model_out = self.bert(
+            labels=y_new,
+            input_ids=y_new,
             attention_mask=y_mask,
             encoder_hidden_states=x_reps,
             encoder_attention_mask=x_mask,
-        )[0]
-        y_mask_target = y_mask
+            past_key_values=past_key_values,
+            use_cache=use_cache,
+            return_dict=False,
+        )
+        y_rep = model_out[0]
+        y_mask_target = y_mask[:, past_length:]
         lm_scores = self.lm_head(y_rep)
         y_span_pre_b = y_rep
         for hw in self.span_b_proj:
@@ -154,6 +167,9 @@ class DecoderWithLoss(nn.Module):
             "text_span_end_scores": torch.log_softmax(text_span_end_scores, dim=-1).detach(),
             "fixed_value_scores": torch.log_softmax(fixed_value_scores, dim=-1).detach(),
         }
+        if use_cache:
+            # model_out is (sequence_output, pooled_output, past_key_values)
+            res["past_key_values"] = model_out[2]
         return res
 
     def forward(self, labels, y, y_mask, x_reps, x_mask, is_eval=False):
@@ -9,7 +9,7 @@ import pickle
 import torch
 
 from .utils_model import build_model, load_model
-from .utils_parsing import beam_search
+from .utils_parsing import beam_search_batch
 from .utils_parsing import *
 from .decoder_with_loss import *
 from .encoder_decoder import *
@@ -34,9 +34,11 @@ class NSPBertModel(object):
         data_dir (str): Path to directory containing all datasets used by the NSP model.
             Note that this data is not used in inference, rather we load from the ground truth
             data directory.
+        cpu_inference (str): "quantize" to run on CPU with the linear layers dynamically
+            quantized to int8, which is much faster than float32 on CPU
     """
 
-    def __init__(self, model_dir, data_dir, model_name="caip_test_model"):
+    def __init__(self, model_dir, data_dir, model_name="caip_test_model", cpu_inference=""):
         sd, tree_voc, tree_idxs, args, full_tree_voc = load_model(model_dir)
         decoder_with_loss, encoder_decoder, tokenizer = build_model(args, full_tree_voc[1])
         args.data_dir = data_dir
@@ -44,7 +46,14 @@ class NSPBertModel(object):
         self.dataset = CAIPDataset(self.tokenizer, args, prefix="", full_tree_voc=full_tree_voc)
         self.encoder_decoder = encoder_decoder
         self.encoder_decoder.load_state_dict(sd, strict=True)
-        if torch.cuda.is_available():
+        if cpu_inference == "quantize":
+            self.encoder_decoder.eval()
+            self.encoder_decoder = torch.quantization.quantize_dynamic(
+                self.encoder_decoder, {torch.nn.Linear}, dtype=torch.qint8
+            )
+        elif cpu_inference:
+            raise ValueError("unknown cpu_inference mode {}".format(cpu_inference))
+        elif torch.cuda.is_available():
             self.encoder_decoder.cuda()
         self.encoder_decoder.eval()
 
@@ -59,11 +68,27 @@ class NSPBertModel(object):
             dict: Logical form.
 
         """
-        btr = beam_search(
-            chat, self.encoder_decoder, self.tokenizer, self.dataset, beam_size, well_formed_pen
-        )
-        if btr[0][0].get("dialogue_type", "NONE") == "NOOP" and math.exp(btr[0][1]) < noop_thres:
-            tree = btr[1][0]
-        else:
-            tree = btr[0][0]
-        return tree
+        return self.parse_batch([chat], noop_thres, beam_size, well_formed_pen)[0]
+
+    def parse_batch(self, chats, noop_thres=0.95, beam_size=5, well_formed_pen=1e2):
+        """Same as parse, for several chats decoded together, see `beam_search_batch`
+
+        Args:
+            chats (list[str]): Preprocessed chat commands.
+
+        Returns:
+            list[dict]: Logical form of each chat.
+
+        """
+        trees = []
+        for btr in beam_search_batch(
+            chats, self.encoder_decoder, self.tokenizer, self.dataset, beam_size, well_formed_pen
+        ):
+            if (
+                btr[0][0].get("dialogue_type", "NONE") == "NOOP"
+                and math.exp(btr[0][1]) < noop_thres
+            ):
+                trees.append(btr[1][0])
+            else:
+                trees.append(btr[0][0])
+        return trees
@@ -21,133 +21,175 @@ def beam_search(txt, model, tokenizer, dataset, beam_size=5, well_formed_pen=1e2
         logical form (dict)
 
     """
-    model_device = model.decoder.lm_head.predictions.decoder.weight.device
+    return beam_search_batch([txt], model, tokenizer, dataset, beam_size, well_formed_pen)[0]
+
+
+def reorder_cache(past_key_values, beam_ids):
+    """Select the decoder self-attention keys and values of the beams that were kept.
+    The cross-attention keys and values are the same for every beam of a chat and
+    beams are never moved across chats, so these are kept as they are.
+    """
+    return tuple(
+        (layer_past[0].index_select(0, beam_ids), layer_past[1].index_select(0, beam_ids))
+        + tuple(layer_past[2:])
+        for layer_past in past_key_values
+    )
+
+
+def span_argmax(b_scores, e_scores, invalid_scores):
+    """Best (beginning, end) pair for each row of B x T beginning and end scores,
+    invalid_scores is added to the B x T x T joint scores"""
+    be_scores = b_scores[:, :, None] + e_scores[:, None, :] + invalid_scores
+    be_ids = be_scores.view(be_scores.shape[0], -1).argmax(dim=-1)
+    return be_ids // b_scores.shape[-1], be_ids % b_scores.shape[-1]
+
+
+def beam_search_batch(txts, model, tokenizer, dataset, beam_size=5, well_formed_pen=1e2):
+    """Beam search decoding of several chats at once, see `beam_search`.
+    The decoder keys and values are cached, so each step only runs the decoder
+    over the last predicted node.
+
+    Args:
+        txts (list[str]): chat inputs
+        model: model class with pretrained model
+        tokenizer: pretrained tokenizer
+        beam_size (int): Number of branches to keep in beam search
+        well_formed_pen (float): penalization for poorly formed trees
+
+    Returns:
+        list with the beam search result of each chat
+
+    """
+    # the linear layers have no weight parameter once quantized
+    model_device = model.decoder.bert.embeddings.word_embeddings.weight.device
     # prepare batch
-    text, idx_maps = tokenize_mapidx(txt, tokenizer)
-    idx_rev_map = [(0, 0)] * len(text.split())
-    for line_id, idx_map in enumerate(idx_maps):
-        for pre_id, (a, b) in enumerate(idx_map):
-            idx_rev_map[a] = (line_id, pre_id)
-            idx_rev_map[b] = (line_id, pre_id)
-    idx_rev_map[-1] = idx_rev_map[-2]
-    tree = [("<S>", -1, -1, -1, -1, -1)]
-    text_idx_ls = dataset.tokenizer.convert_tokens_to_ids(text.split())
-    tree_idx_ls = [
-        [dataset.tree_idxs[w], bi, ei, text_span_bi, text_span_ei, fixed_val]
-        for w, bi, ei, text_span_bi, text_span_ei, fixed_val in tree
-    ]
-    pre_batch = [(text_idx_ls, tree_idx_ls, (text, txt, {}))]
+    idx_rev_maps = []
+    pre_batch = []
+    for txt in txts:
+        text, idx_maps = tokenize_mapidx(txt, tokenizer)
+        idx_rev_map = [(0, 0)] * len(text.split())
+        for line_id, idx_map in enumerate(idx_maps):
+            for pre_id, (a, b) in enumerate(idx_map):
+                idx_rev_map[a] = (line_id, pre_id)
+                idx_rev_map[b] = (line_id, pre_id)
+        idx_rev_map[-1] = idx_rev_map[-2]
+        idx_rev_maps.append(idx_rev_map)
+        tree = [("<S>", -1, -1, -1, -1, -1)]
+        text_idx_ls = dataset.tokenizer.convert_tokens_to_ids(text.split())
+        tree_idx_ls = [
+            [dataset.tree_idxs[w], bi, ei, text_span_bi, text_span_ei, fixed_val]
+            for w, bi, ei, text_span_bi, text_span_ei, fixed_val in tree
+        ]
+        pre_batch.append((text_idx_ls, tree_idx_ls, (text, txt, {})))
     batch = caip_collate(pre_batch, tokenizer)
     batch = [t.to(model_device) for t in batch[:4]]
-    x, x_mask, y, y_mask = batch
+    x, x_mask, _, y_mask = batch
+    n_chats, x_len = x.shape
+    n_rows = n_chats * beam_size
     x_reps = model.encoder(input_ids=x, attention_mask=x_mask)[0].detach()
-    x_mask = x_mask.expand(beam_size, -1)
-    x_reps = x_reps.expand(beam_size, -1, -1)
+    x_reps = x_reps.repeat_interleave(beam_size, dim=0)
+    x_mask = x_mask.repeat_interleave(beam_size, dim=0)
+    # spans are invalid if beginning > end or if they cover padding
+    x_pad = (1 - x_mask).type_as(x_reps) * -1e9
+    invalid_span_scores = (
+        torch.ones(x_len, x_len, device=model_device).tril(diagonal=-1)[None, :, :] * -1e9
+        + x_pad[:, :, None]
+        + x_pad[:, None, :]
+    )
     # start decoding
-    y = torch.LongTensor([[dataset.tree_idxs["<S>"]] for _ in range(beam_size)]).to(
-        model_device
-    )  # B x 1
-    beam_scores = torch.Tensor([-1e9 for _ in range(beam_size)]).to(model_device)  # B
-    beam_scores[0] = 0
-    beam_seqs = [[("<S>", -1, -1, -1, -1, -1)] for _ in range(beam_size)]
-    finished = [False for _ in range(beam_size)]
+    y = torch.full((n_rows, 1), dataset.tree_idxs["<S>"], dtype=torch.long, device=model_device)
+    y_mask = y_mask.new_ones((n_rows, 1))
+    beam_scores = torch.full((n_chats, beam_size), -1e9, device=model_device)
+    beam_scores[:, 0] = 0
+    beam_scores = beam_scores.view(-1)  # B
+    # beams are only selected among those of the same chat
+    chat_offsets = torch.arange(0, n_rows, beam_size, device=model_device)[:, None]
+    beam_seqs = [[("<S>", -1, -1, -1, -1, -1)] for _ in range(n_rows)]
+    finished = [False for _ in range(n_rows)]
+    finished_mask = torch.zeros(n_rows, dtype=torch.bool, device=model_device)
+    end_idx = dataset.tree_idxs["</S>"]
     fixed_value_vocab_size = len(fixed_span_values_voc)
-    pad_scores = torch.Tensor([-1e9] * (len(dataset.tree_voc) - fixed_value_vocab_size)).to(
-        model_device
+    pad_scores = torch.full(
+        (len(dataset.tree_voc) - fixed_value_vocab_size,), -1e9, device=model_device
     )
     pad_scores[dataset.tree_idxs["[PAD]"]] = 0
+    past_key_values = None
     for i in range(100):
-        outputs = model.decoder.step(y, y_mask, x_reps, x_mask)
-        # next word, grab the final token
+        outputs = model.decoder.step(
+            y, y_mask, x_reps, x_mask, past_key_values=past_key_values, use_cache=True
+        )
+        # next word, the decoder only scored the final token
         lm_scores = outputs["lm_scores"][:, -1, :]  # B x V
-        for i, fshed in enumerate(finished):
-            if fshed:
-                # set predictions to padding tokens
-                lm_scores[i] = pad_scores
+        # set predictions of finished beams to padding tokens
+        lm_scores = torch.where(finished_mask[:, None], pad_scores[None, :], lm_scores)
         beam_lm_scores = lm_scores + beam_scores[:, None]  # B x V
-        beam_lm_lin = beam_lm_scores.view(-1)
-        # get the highest probability tokens
-        s_scores, s_ids = beam_lm_lin.sort(dim=-1, descending=True)
-        s_beam_ids = s_ids // beam_lm_scores.shape[-1]
-        s_word_ids = s_ids % beam_lm_scores.shape[-1]
+        beam_lm_lin = beam_lm_scores.view(n_chats, -1)
+        # get the highest probability tokens of each chat
+        s_scores, s_ids = beam_lm_lin.topk(beam_size, dim=-1)
         # re-order and add next token
-        beam_scores = s_scores[:beam_size]
-        n_beam_ids = s_beam_ids[:beam_size]
-        n_word_ids = s_word_ids[:beam_size]
-        # convert tokens to words
-        n_words = [dataset.tree_voc[nw_id.item()] for nw_id in n_word_ids]
+        beam_scores = s_scores.view(-1)
+        n_beam_ids = (s_ids // beam_lm_scores.shape[-1] + chat_offsets).view(-1)
+        n_word_ids = (s_ids % beam_lm_scores.shape[-1]).view(-1)
         y = torch.cat([y[n_beam_ids], n_word_ids[:, None]], dim=1)
         # find out which of the beams are finished
-        pre_finished = [finished[b_id.item()] for b_id in n_beam_ids]
-        new_finished = [w_id.item() == dataset.tree_idxs["</S>"] for w_id in n_word_ids]
-        finished = [p or n for p, n in zip(pre_finished, new_finished)]
-        n_mask = 1 - torch.Tensor(finished).type_as(y_mask)
-        y_mask = torch.cat([y_mask[n_beam_ids], n_mask[:, None]], dim=1)
+        finished_mask = finished_mask[n_beam_ids] | (n_word_ids == end_idx)
+        y_mask = torch.cat([y_mask[n_beam_ids], (~finished_mask).type_as(y_mask)[:, None]], dim=1)
+        past_key_values = reorder_cache(outputs["past_key_values"], n_beam_ids)
         # predicted span
-        span_b_scores = outputs["span_b_scores"][:, -1, :][n_beam_ids]  # B x T
-        span_e_scores = outputs["span_e_scores"][:, -1, :][n_beam_ids]  # B x T
-        span_be_scores = span_b_scores[:, :, None] + span_e_scores[:, None, :]
-        # scores are invalid if beginning > end
-        # Create triangular matrix with negative infinity for invalid combos
-        invalid_scores = torch.tril(torch.ones(span_be_scores.shape), diagonal=-1) * -1e9
-        # Make invalid scores very small
-        span_be_scores += invalid_scores.type_as(span_be_scores)
-        # Create linearized view
-        span_be_lin = span_be_scores.view(span_be_scores.shape[0], -1)
-        # Sort linearized scores by descending order
-        _, s_sbe_ids = span_be_lin.sort(dim=-1, descending=True)
-        # Grab token IDs for top scores
-        s_sb_ids = s_sbe_ids[:, 0] // span_b_scores.shape[-1]
-        s_se_ids = s_sbe_ids[:, 0] % span_b_scores.shape[-1]
-        beam_b_ids = [bb_id.item() for bb_id in s_sb_ids]
-        beam_e_ids = [be_id.item() for be_id in s_se_ids]
-
+        span_b_ids, span_e_ids = span_argmax(
+            outputs["span_b_scores"][:, -1, :][n_beam_ids],
+            outputs["span_e_scores"][:, -1, :][n_beam_ids],
+            invalid_span_scores,
+        )
         # predict text spans
-        text_span_start_scores = outputs["text_span_start_scores"][:, -1, :][n_beam_ids]  # B x T
-        text_span_end_scores = outputs["text_span_end_scores"][:, -1, :][n_beam_ids]  # B x T
-        text_span_scores = text_span_start_scores[:, :, None] + text_span_end_scores[:, None, :]
-        invalid_text_span_scores = (
-            torch.tril(torch.ones(text_span_scores.shape), diagonal=-1) * -1e9
+        text_span_start_ids, text_span_end_ids = span_argmax(
+            outputs["text_span_start_scores"][:, -1, :][n_beam_ids],
+            outputs["text_span_end_scores"][:, -1, :][n_beam_ids],
+            invalid_span_scores,
         )
-        text_span_scores += invalid_text_span_scores.type_as(text_span_scores)
-        text_span_lin_scores = text_span_scores.view(text_span_scores.shape[0], -1)
-        _, text_span_ids = text_span_lin_scores.sort(dim=-1, descending=True)
-        text_span_start_ids = text_span_ids[:, 0] // text_span_start_scores.shape[-1]
-        text_span_end_ids = text_span_ids[:, 0] % text_span_start_scores.shape[-1]
-        text_span_beam_start_ids = [bb_id.item() for bb_id in text_span_start_ids]
-        text_span_beam_end_ids = [be_id.item() for be_id in text_span_end_ids]
-
         # predict fixed values
         fixed_value_scores = outputs["fixed_value_scores"][:, -1, :][n_beam_ids]  # B x T
-        fixed_value_lin_scores = fixed_value_scores.view(-1)
         # get the highest probability tokens
-        fixed_value_ranked_scores, fixed_value_ids = fixed_value_lin_scores.sort(
-            dim=-1, descending=True
-        )
-        fixed_value_beam_ids = fixed_value_ids // fixed_value_scores.shape[-1]
-        # map back to which word in sequence, since
-        fixed_value_word_ids = fixed_value_ids % fixed_value_scores.shape[-1]
-        # re-order and add next token
-        fixed_value_beam_scores = fixed_value_ranked_scores[:beam_size]
-        fixed_value_beam_ids = fixed_value_beam_ids[:beam_size]
-        fixed_value_word_ids = fixed_value_word_ids[:beam_size]
-        # convert tokens to words
-        fixed_value_words = [fixed_span_values_voc[nw_id.item()] for nw_id in fixed_value_word_ids]
-
+        _, fixed_value_ids = fixed_value_scores.view(n_chats, -1).topk(beam_size, dim=-1)
+        # map back to which word in sequence
+        fixed_value_word_ids = (fixed_value_ids % fixed_value_scores.shape[-1]).view(-1)
+        # a single copy to host for the step
+        (
+            n_beam_ids_ls,
+            n_word_ids_ls,
+            beam_b_ids,
+            beam_e_ids,
+            text_span_beam_start_ids,
+            text_span_beam_end_ids,
+            fixed_value_word_ids_ls,
+        ) = torch.stack(
+            [
+                n_beam_ids,
+                n_word_ids,
+                span_b_ids,
+                span_e_ids,
+                text_span_start_ids,
+                text_span_end_ids,
+                fixed_value_word_ids,
+            ]
+        ).tolist()
+        finished = [
+            finished[b_id] or w_id == end_idx for b_id, w_id in zip(n_beam_ids_ls, n_word_ids_ls)
+        ]
         # update beam_seq
         beam_seqs = [
-            beam_seqs[n_beam_ids[i].item()]
+            beam_seqs[n_beam_ids_ls[i]]
             + [
                 (
-                    n_words[i],
+                    dataset.tree_voc[n_word_ids_ls[i]],
                     beam_b_ids[i],
                     beam_e_ids[i],
                     text_span_beam_start_ids[i],
                     text_span_beam_end_ids[i],
-                    fixed_value_words[i],
+                    fixed_span_values_voc[fixed_value_word_ids_ls[i]],
                 )
             ]
-            for i in range(beam_size)
+            for i in range(n_rows)
         ]
         # penalize poorly formed trees
         for i, seq in enumerate(beam_seqs):
@@ -179,14 +221,22 @@ def beam_search(txt, model, tokenizer, dataset, beam_size=5, well_formed_pen=1e2
         ]
         for res in beam_seqs
     ]
-    # delinearize predicted sequences into tree
-    beam_trees = [seq_to_tree(dataset.full_tree, res[1:-1], idx_rev_map)[0] for res in beam_seqs]
-    pre_res = [
-        (tree, score.item(), seq) for tree, score, seq in zip(beam_trees, beam_scores, beam_seqs)
-    ]
-    # sort one last time to have well-formed trees on top
-    res = sorted(pre_res, key=lambda x: x[1], reverse=True)
-    return res
+    beam_scores = beam_scores.tolist()
+    results = []
+    for c, idx_rev_map in enumerate(idx_rev_maps):
+        chat_rows = range(c * beam_size, (c + 1) * beam_size)
+        # delinearize predicted sequences into tree
+        pre_res = [
+            (
+                seq_to_tree(dataset.full_tree, beam_seqs[r][1:-1], idx_rev_map)[0],
+                beam_scores[r],
+                beam_seqs[r],
+            )
+            for r in chat_rows
+        ]
+        # sort one last time to have well-formed trees on top
+        results.append(sorted(pre_res, key=lambda x: x[1], reverse=True))
+    return results
 
 
 def compute_accuracy(outputs, y):
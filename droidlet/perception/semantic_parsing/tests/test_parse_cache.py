@@ -0,0 +1,40 @@
+"""
+Copyright (c) Facebook, Inc. and its affiliates.
+"""
+import os
+import tempfile
+import unittest
+from droidlet.perception.semantic_parsing.utils.parse_cache import ParseCache
+
+COME_HERE = {
+    "dialogue_type": "HUMAN_GIVE_COMMAND",
+    "action_sequence": [{"action_type": "MOVE", "location": {"text_span": [0, [1, 1]]}}],
+}
+
+
+class TestParseCache(unittest.TestCase):
+    def test_lru(self):
+        cache = ParseCache("model_a", max_size=2)
+        cache.put("come here", COME_HERE)
+        cache.put("dance", {"dialogue_type": "NOOP"})
+        assert cache.get("come here") == COME_HERE
+        cache.put("hello", {"dialogue_type": "GREET"})
+        # "dance" was the least recently used
+        assert cache.get("dance") is None
+        assert cache.get("come here") == COME_HERE
+        assert (cache.hits, cache.misses) == (2, 1)
+        # callers get their own copy
+        cache.get("come here")["dialogue_type"] = "NOOP"
+        assert cache.get("come here") == COME_HERE
+
+    def test_persistent(self):
+        with tempfile.TemporaryDirectory() as tmpdir:
+            db_path = os.path.join(tmpdir, "parses.db")
+            ParseCache("model_a", db_path).put("come here", COME_HERE)
+            assert ParseCache("model_a", db_path).get("come here") == COME_HERE
+            # a parse from another model is never returned
+            assert ParseCache("model_b", db_path).get("come here") is None
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,87 @@
+"""
+Copyright (c) Facebook, Inc. and its affiliates.
+"""
+import hashlib
+import json
+import logging
+import sqlite3
+from collections import OrderedDict
+
+
+def file_checksum(path, chunk_size=2 ** 20):
+    """md5 hex digest of the contents of the file at path"""
+    h = hashlib.md5()
+    with open(path, "rb") as fd:
+        for chunk in iter(lambda: fd.read(chunk_size), b""):
+            h.update(chunk)
+    return h.hexdigest()
+
+
+class ParseCache:
+    def __init__(self, model_checksum, db_path="", max_size=1024):
+        """LRU cache of the logical forms output by the parsing model, keyed by the
+        preprocessed chat.  If db_path is given the entries are also written to a
+        sqlite file, so they survive restarts; entries written by another model
+        (with another model_checksum) are never returned.
+
+        args:
+            model_checksum (str): identifies the model (and inference mode) the parses come from
+            db_path (str): sqlite file storing the parses, in memory only if empty
+            max_size (int): number of parses kept in memory
+        """
+        self.model_checksum = model_checksum
+        self.max_size = max_size
+        # chat -> json string of the logical form, so every get returns a fresh copy
+        self.lru = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.db = None
+        if db_path:
+            try:
+                self.db = sqlite3.connect(db_path, check_same_thread=False)
+                self.db.execute(
+                    """CREATE TABLE IF NOT EXISTS Parses (
+                        model_checksum TEXT NOT NULL,
+                        chat TEXT NOT NULL,
+                        logical_form TEXT NOT NULL,
+                        PRIMARY KEY (model_checksum, chat))"""
+                )
+                self.db.commit()
+            except sqlite3.Error as e:
+                logging.warning("Not storing parses in {}: {}".format(db_path, e))
+                self.db = None
+
+    def _remember(self, chat, lf_str):
+        self.lru[chat] = lf_str
+        self.lru.move_to_end(chat)
+        if len(self.lru) > self.max_size:
+            self.lru.popitem(last=False)
+
+    def get(self, chat):
+        """Returns the cached logical form for chat, or None if there isn't one."""
+        lf_str = self.lru.get(chat)
+        if lf_str is not None:
+            self.lru.move_to_end(chat)
+        elif self.db is not None:
+            r = self.db.execute(
+                "SELECT logical_form FROM Parses WHERE model_checksum=? AND chat=?",
+                (self.model_checksum, chat),
+            ).fetchone()
+            if r is not None:
+                lf_str = r[0]
+                self._remember(chat, lf_str)
+        if lf_str is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        return json.loads(lf_str)
+
+    def put(self, chat, logical_form):
+        lf_str = json.dumps(logical_form)
+        self._remember(chat, lf_str)
+        if self.db is not None:
+            self.db.execute(
+                "INSERT OR REPLACE INTO Parses (model_checksum, chat, logical_form) VALUES (?,?,?)",
+                (self.model_checksum, chat, lf_str),
+            )
+            self.db.commit()
@@ -1,4 +1,5 @@
-from jsonschema import validate, exceptions, RefResolver, Draft7Validator
+from jsonschema import RefResolver, Draft7Validator
+from jsonschema.exceptions import best_match
 import json
 from pprint import pprint
 import argparse
@@ -52,6 +53,9 @@ class JSONValidator:
                 resolver.store[schema_name + ".schema.json"] = json_schema
         self.base_schema = base_schema
         self.resolver = resolver
+        # validate() checks the schema and builds a validator on every call, do that once
+        Draft7Validator.check_schema(base_schema)
+        self.validator = Draft7Validator(base_schema, resolver=resolver)
 
     def validate_data(self, data_path, test_mode=False):
         """
@@ -72,9 +76,8 @@ class JSONValidator:
                 else:
                     command, action_dict = parts
                 parse_tree = json.loads(action_dict)
-                try:
-                    validate(instance=parse_tree, schema=self.base_schema, resolver=self.resolver)
-                except exceptions.ValidationError as e:
+                e = best_match(self.validator.iter_errors(parse_tree))
+                if e is not None:
                     print(command)
                     pprint(parse_tree)
                     print(e)
@@ -97,9 +100,8 @@ class JSONValidator:
         Returns:
             True if logical form passes the schema validation, else returns False.
         """
-        try:
-            validate(instance=parse_tree, schema=self.base_schema, resolver=self.resolver)
-        except exceptions.ValidationError as e:
+        e = best_match(self.validator.iter_errors(parse_tree))
+        if e is not None:
             # Option to print debug information
             if debug:
                 print("Error validating:\n{}\n".format(parse_tree))
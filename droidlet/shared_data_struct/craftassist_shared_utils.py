@@ -1,11 +1,10 @@
 import logging
 import time
 import numpy as np
-from collections import namedtuple
+from collections import namedtuple, OrderedDict
 
 from droidlet.base_util import adjacent, get_bounds, manhat_dist
 from droidlet.lowlevel.minecraft.craftassist_cuberite_utils.block_data import PASSABLE_BLOCKS
-from droidlet.shared_data_structs import PriorityQueue
 
 # mainHand is the item in the player or agent's hand, that will be placed by a place block action
 # it is defined in lowlevel/minecraft/client/src/types.h as Item, and has fields id, meta
@@ -72,91 +71,193 @@ def astar(agent, target, approx=0, pos="agent"):
     """Find a path from the agent's pos to the target.
 
     Args:
-    - agent: the Agent object
+    - agent: the Agent object; if it has a path_planner (a PathPlanner), that is used,
+        so that paths to the same target are reused
     - target: an absolute (x, y, z)
     - approx: proximity to target before search is complete (0 = exact)
     - pos: (optional) checks path from specified tuple
 
-    Returns: a list of (x, y, z) positions from start to target
+    Returns: a list of (x, y, z) positions from target to start
     """
     t_start = time.time()
     if type(pos) is str and pos == "agent":
         pos = agent.pos
     logging.debug("A* from {} -> {} ± {}".format(pos, target, approx))
 
-    corners = np.array([pos, target]).astype("int32")
-    mx, my, mz = corners.min(axis=0) - 10
-    Mx, My, Mz = corners.max(axis=0) + 10
-    my, My = max(my, 0), min(My, 255)
-    blocks = agent.get_blocks(mx, Mx, my, My, mz, Mz)
-    obstacles = np.isin(blocks[:, :, :, 0], PASSABLE_BLOCKS, invert=True)
-    obstacles = obstacles[:-1, :, :] | obstacles[1:, :, :]  # check head and feet
-    start, goal = (corners - [mx, my, mz])[:, [1, 2, 0]]
-    path = _astar(obstacles, start, goal, approx)
+    planner = getattr(agent, "path_planner", None) or PathPlanner(max_goals=0)
+    path = planner.plan(agent.get_blocks, pos, target, approx)
     if path is not None:
-        path = [(p[2] + mx, p[0] + my, p[1] + mz) for p in reversed(path)]
+        path = list(reversed(path))
 
     t_elapsed = time.time() - t_start
     logging.debug("A* returned {}-len path in {}".format(len(path) if path else "None", t_elapsed))
     return path
 
 
-def _astar(X, start, goal, approx=0):
-    """Find a path through X from start to goal.
+def _get_obstacles(get_blocks, corner, shape):
+    """the cells where the agent doesn't fit (its feet or head are blocked) in the box
+    from corner (an absolute x, y, z), as a (y, z, x) array shaped shape"""
+    mx, my, mz = corner
+    sy, sz, sx = shape
+    blocks = get_blocks(mx, mx + sx - 1, my, my + sy, mz, mz + sz - 1)
+    obstacles = np.isin(blocks[:, :, :, 0], PASSABLE_BLOCKS, invert=True)
+    return obstacles[:-1, :, :] | obstacles[1:, :, :]  # check head and feet
+
+
+def _spread(X):
+    """Return the cells of X and the cells adjacent to them"""
+    Y = X.copy()
+    Y[1:] |= X[:-1]
+    Y[:-1] |= X[1:]
+    Y[:, 1:] |= X[:, :-1]
+    Y[:, :-1] |= X[:, 1:]
+    Y[:, :, 1:] |= X[:, :, :-1]
+    Y[:, :, :-1] |= X[:, :, 1:]
+    return Y
+
+
+# how many steps past the start a distance field is searched, so that it still has
+# the start's neighbourhood when the start moves a bit
+PATH_SLACK = 4
+
+
+def _distance_field(X, goal, approx=0, start=None, slack=PATH_SLACK):
+    """The number of steps from each cell of X to the goal.
 
     Args:
     - X: a 3d array of obstacles, i.e. False -> passable, True -> not passable
-    - start/goal: relative positions in X
-    - approx: proximity to goal before search is complete (0 = exact)
+    - goal: relative position in X
+    - approx: the cells within this manhattan distance of the goal are at distance 0
+    - start: (optional) relative position in X; stop the search slack steps after
+        reaching it, instead of when all the cells reachable from the goal are reached
+
+    Returns: an int32 array shaped like X, -1 in the cells that weren't reached
+    """
+    free = ~X
+    if start is not None:
+        start = tuple(start)
+        free[start] = True
+    ranges = [np.abs(np.arange(n) - g) for n, g in zip(X.shape, goal)]
+    near_goal = ranges[0][:, None, None] + ranges[1][None, :, None] + ranges[2][None, None, :]
+    frontier = (near_goal <= approx) & free
+    D = np.full(X.shape, -1, "int32")
+    D[frontier] = 0
+    free &= ~frontier
+    d, stop = 0, None
+    while frontier.any():
+        if stop is None and start is not None and D[start] >= 0:
+            stop = d + slack
+        if stop is not None and d >= stop:
+            break
+        d += 1
+        frontier = _spread(frontier) & free
+        D[frontier] = d
+        free &= ~frontier
+    return D
+
+
+def _descend(D, start, goal):
+    """Follow the distance field D from start to a cell at distance 0.
+
+    of the neighbours one step closer, the path takes the one nearest the goal, breaking
+    ties on position like the heap of an A* search, so it ends where A* would
 
     Returns: a list of relative positions, from start to goal
     """
-    start = tuple(start)
     goal = tuple(goal)
+    p = tuple(start)
+    path = [p]
+    for d in range(D[p] - 1, -1, -1):
+        steps = [
+            a for a in adjacent(p) if all(0 <= a[i] < D.shape[i] for i in range(3)) and D[a] == d
+        ]
+        p = min(steps, key=lambda a: (manhat_dist(a, goal), a))
+        path.append(p)
+    return path
+
+
+class GoalDistances:
+    """the distance field to a goal over a box of the world, and the obstacles it was built
+    from.  only the distances below valid_below are still right after blocks changed"""
+
+    def __init__(self, corner, X, D):
+        self.corner = corner
+        self.X = X
+        self.D = D
+        self.valid_below = np.inf
+
+    def update_obstacles(self, X):
+        changed = self.X != X
+        if not changed.any():
+            return
+        # the distance of a cell only depends on those of its neighbours
+        changed = _spread(changed) & (self.D >= 0)
+        if changed.any():
+            self.valid_below = min(self.valid_below, self.D[changed].min())
+        self.X = X
+
+
+class PathPlanner:
+    """Plans paths through the blocks of the world, keeping the distance fields to
+    the last max_goals goals.
+
+    a distance field is searched from the goal (by a breadth first search over the whole
+    box at once), so when the start moves off the path or nearby blocks change, the path
+    from the new start is usually read off the same field without searching again.
+
+    Args:
+    - max_goals: number of goals to keep distance fields for
+    - margin: the searched box extends this far past the start and the goal
+    """
+
+    def __init__(self, max_goals=8, margin=10):
+        self.max_goals = max_goals
+        self.margin = margin
+        self.fields = OrderedDict()
+        self.searches = 0
+
+    def plan(self, get_blocks, start, target, approx=0):
+        """Find a path from start to the target.
+
+        Args:
+        - get_blocks: returns the blocks in a box of the world, as agent.get_blocks
+        - start/target: absolute (x, y, z)
+        - approx: proximity to target before search is complete (0 = exact)
+
+        Returns: a list of (x, y, z) positions from start to target, or None
+        """
+        key = (tuple(int(c) for c in target), approx)
+        field = self.fields.get(key)
+        if field is not None:
+            s = tuple((np.array(start, dtype="int32") - field.corner)[[1, 2, 0]])
+            if all(0 <= s[i] < field.X.shape[i] for i in range(3)):
+                field.update_obstacles(_get_obstacles(get_blocks, field.corner, field.X.shape))
+                if 0 <= field.D[s] <= field.valid_below:
+                    self.fields.move_to_end(key)
+                    g = (np.array(key[0], dtype="int32") - field.corner)[[1, 2, 0]]
+                    return self.to_world(_descend(field.D, s, g), field.corner)
+
+        corners = np.array([start, target]).astype("int32")
+        mx, my, mz = corners.min(axis=0) - self.margin
+        Mx, My, Mz = corners.max(axis=0) + self.margin
+        my, My = max(my, 0), min(My, 255)
+        corner = np.array((mx, my, mz))
+        X = _get_obstacles(get_blocks, corner, (My - my, Mz - mz + 1, Mx - mx + 1))
+        s, g = (corners - corner)[:, [1, 2, 0]]
+        D = _distance_field(X, g, approx, start=s)
+        self.searches += 1
+        if self.max_goals > 0:
+            self.fields[key] = GoalDistances(corner, X, D)
+            self.fields.move_to_end(key)
+            while len(self.fields) > self.max_goals:
+                self.fields.popitem(last=False)
+        if D[tuple(s)] < 0:
+            return None
+        return self.to_world(_descend(D, s, g), corner)
 
-    visited = set()
-    came_from = {}
-    q = PriorityQueue()
-    q.push(start, manhat_dist(start, goal))
-    G = np.full_like(X, np.iinfo(np.uint32).max, "uint32")
-    G[start] = 0
-
-    while len(q) > 0:
-        _, p = q.pop()
-
-        if manhat_dist(p, goal) <= approx:
-            path = []
-            while p in came_from:
-                path.append(p)
-                p = came_from[p]
-            return [start] + list(reversed(path))
-
-        visited.add(p)
-        for a in adjacent(p):
-            if (
-                a in visited
-                or a[0] < 0
-                or a[0] >= X.shape[0]
-                or a[1] < 0
-                or a[1] >= X.shape[1]
-                or a[2] < 0
-                or a[2] >= X.shape[2]
-                or X[a]
-            ):
-                continue
-
-            g = G[p] + 1
-            if g >= G[a]:
-                continue
-            came_from[a] = p
-            G[a] = g
-            f = g + manhat_dist(a, goal)
-            if q.contains(a):
-                q.replace(a, f)
-            else:
-                q.push(a, f)
-
-    return None
+    @staticmethod
+    def to_world(path, corner):
+        return [(p[2] + corner[0], p[0] + corner[1], p[1] + corner[2]) for p in path]
 
 
 def arrange(arrangement, schematic=None, shapeparams={}):
@@ -0,0 +1,108 @@
+"""
+Copyright (c) Facebook, Inc. and its affiliates.
+"""
+import unittest
+import numpy as np
+from droidlet.shared_data_struct.craftassist_shared_utils import PathPlanner
+
+STONE = 1
+
+
+class BlocksWorld:
+    """an xyz array of block ids, air past its edges, with get_blocks as agent.get_blocks"""
+
+    def __init__(self, size, ground_height, num_pillars, seed):
+        self.ids = np.zeros(size, dtype="int32")
+        self.ids[:, :ground_height, :] = STONE
+        rng = np.random.RandomState(seed)
+        for _ in range(num_pillars):
+            x, z = rng.randint(0, size[0]), rng.randint(0, size[2])
+            self.ids[x, ground_height : ground_height + rng.randint(1, 5), z] = STONE
+
+    def get_blocks(self, xa, xb, ya, yb, za, zb):
+        out = np.zeros((yb - ya + 1, zb - za + 1, xb - xa + 1, 2), dtype="int32")
+        for y in range(ya, yb + 1):
+            for z in range(za, zb + 1):
+                for x in range(xa, xb + 1):
+                    if all(0 <= c < n for c, n in zip((x, y, z), self.ids.shape)):
+                        out[y - ya, z - za, x - xa, 0] = self.ids[x, y, z]
+        return out
+
+    def fits(self, pos):
+        """are the feet and the head of someone standing at pos in air?"""
+        x, y, z = pos
+        return not self.get_blocks(x, x, y, y + 1, z, z)[:, 0, 0, 0].any()
+
+
+class PathPlannerTest(unittest.TestCase):
+    def setUp(self):
+        self.world = BlocksWorld((24, 12, 24), 4, 60, seed=0)
+        self.start, self.target = (2, 4, 3), (20, 4, 19)
+        for p in (self.start, self.target):
+            self.world.ids[p[0], p[1] :, p[2]] = 0
+
+    def check_path(self, planner, start, target):
+        """the planner's path is as short as one planned from scratch, and can be walked"""
+        path = planner.plan(self.world.get_blocks, start, target)
+        fresh = PathPlanner(max_goals=0).plan(self.world.get_blocks, start, target)
+        self.assertIsNotNone(path)
+        self.assertEqual(len(path), len(fresh))
+        self.assertEqual(tuple(path[0]), tuple(start))
+        self.assertEqual(tuple(path[-1]), tuple(target))
+        for a, b in zip(path, path[1:]):
+            self.assertEqual(np.abs(np.subtract(a, b)).sum(), 1)
+            self.assertTrue(self.world.fits(b))
+        return path
+
+    def test_block_changes(self):
+        planner = PathPlanner()
+        path = self.check_path(planner, self.start, self.target)
+        self.assertEqual(planner.searches, 1)
+
+        # a block farther from the goal than the start doesn't change the field
+        self.world.ids[0, 11, 0] = STONE
+        path = self.check_path(planner, path[1], self.target)
+        self.assertEqual(planner.searches, 1)
+
+        # a block put on the path, and blocks taken away next to it
+        for i in range(3):
+            x, y, z = path[len(path) // 2]
+            if i == 0:
+                self.world.ids[x, y, z] = STONE
+            else:
+                self.world.ids[x, : y + 3, z + 1] = 0
+                self.world.ids[x + 1, : y + 3, z] = 0
+            path = self.check_path(planner, path[1], self.target)
+
+    def test_unreachable(self):
+        x, y, z = self.target
+        self.world.ids[x - 1 : x + 2, y - 1 : y + 3, z - 1 : z + 2] = STONE
+        self.world.ids[x, y : y + 2, z] = 0
+        planner = PathPlanner()
+        self.assertIsNone(planner.plan(self.world.get_blocks, self.start, self.target))
+        self.assertIsNone(planner.plan(self.world.get_blocks, self.start, self.target))
+
+        # opening the box makes the target reachable again
+        self.world.ids[x - 1, y : y + 2, z] = 0
+        self.check_path(planner, self.start, self.target)
+
+    def test_evict_goals(self):
+        planner = PathPlanner(max_goals=2)
+        targets = [(20, 4, 19), (12, 4, 20), (20, 4, 5)]
+        for t in targets:
+            self.world.ids[t[0], t[1] :, t[2]] = 0
+        for t in targets:
+            self.check_path(planner, self.start, t)
+        self.assertEqual(planner.searches, 3)
+        self.assertEqual([k[0] for k in planner.fields], targets[1:])
+
+        # the last two goals are kept, the first one was evicted
+        self.check_path(planner, self.start, targets[1])
+        self.assertEqual(planner.searches, 3)
+        self.check_path(planner, self.start, targets[0])
+        self.assertEqual(planner.searches, 4)
+        self.assertEqual([k[0] for k in planner.fields], [targets[1], targets[0]])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -115,6 +115,8 @@ class MockOpt:
         self.no_default_behavior = False
         self.nsp_models_dir = ""
         self.nsp_data_dir = ""
+        self.nsp_parse_cache = ""
+        self.nsp_cpu_inference = ""
         self.ground_truth_data_dir = ""
         self.semseg_model_path = ""
         self.no_ground_truth = True
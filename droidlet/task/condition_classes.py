@@ -13,6 +13,37 @@ class Condition:
         raise NotImplementedError("Implemented by subclass")
 
 
+class WatchedCondition(Condition):
+    """
+    a Condition whose value only depends on the rows of some memids in the memory's
+    watched tables (see AgentMemory.get_watch_version).  check() only evaluates it
+    again if one of those rows was written since the last evaluation, otherwise
+    it returns the last value; so conditions of tasks waiting on other tasks
+    don't query the db every tick.  subclasses implement watched_memids() and evaluate().
+    """
+
+    def __init__(self, memory):
+        super().__init__(memory)
+        self.value = None
+        self.watch_version = None
+
+    def watched_memids(self):
+        raise NotImplementedError("Implemented by subclass")
+
+    def evaluate(self) -> bool:
+        raise NotImplementedError("Implemented by subclass")
+
+    def check(self):
+        get_watch_version = getattr(self.memory, "get_watch_version", None)
+        if get_watch_version is None:
+            return self.evaluate()
+        version = get_watch_version(memids=self.watched_memids())
+        if version != self.watch_version:
+            self.value = self.evaluate()
+            self.watch_version = version
+        return self.value
+
+
 class SwitchCondition(Condition):
     """
     switched to True or False by self.set_status(status).
@@ -91,13 +122,16 @@ class OrCondition(Condition):
         return False
 
 
-class TaskStatusCondition(Condition):
+class TaskStatusCondition(WatchedCondition):
     def __init__(self, memory, task_memid, status="finished"):
         super().__init__(memory)
         self.status = status
         self.task_memid = task_memid
 
-    def check(self):
+    def watched_memids(self):
+        return [self.task_memid]
+
+    def evaluate(self):
         T = None
         if self.memory.check_memid_exists(self.task_memid, "Tasks"):
             T = self.memory.get_mem_by_id(self.task_memid)
@@ -216,13 +250,16 @@ class Comparator(Condition):
 
 
 # FIXME this is just a comparator
-class TaskRunCountCondition(Condition):
+class TaskRunCountCondition(WatchedCondition):
     def __init__(self, memory, task_memid, N=1):
         super().__init__(memory)
         self.N = N
         self.task_memid = task_memid
 
-    def check(self):
+    def watched_memids(self):
+        return [self.task_memid]
+
+    def evaluate(self):
         if self.memory.check_memid_exists(self.task_memid, "Tasks"):
             T = self.memory.get_mem_by_id(self.task_memid)
             if T.run_count >= self.N:
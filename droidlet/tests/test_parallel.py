@@ -1,4 +1,6 @@
-from droidlet.parallel import BackgroundTask
+import time
+import numpy as np
+from droidlet.parallel import BackgroundTask, SharedMemoryQueue
 
 
 class Foo:
@@ -27,11 +29,104 @@ class Foo:
 import unittest
 
 
+def frame_init():
+    return None
+
+
+def frame_process(state, rgb, depth, delay=0.0):
+    time.sleep(delay)
+    return np.sum(rgb), depth * 2
+
+
+def wait_started(b):
+    # the child's startup takes seconds, so get the result of a small frame before timing
+    # anything; it is too small to go through shared memory
+    b.put(np.zeros((1, 1, 3), dtype=np.uint8), np.zeros((1, 1), dtype=np.float32))
+    b.get()
+
+
 class TestBackgroundtask(unittest.TestCase):
     def test_background_task(self):
         foo = Foo()
         foo.forward()
 
+    def test_shared_memory(self):
+        b = BackgroundTask(frame_init, (), frame_process, shared_memory=True)
+        b.start()
+        wait_started(b)
+        rgb = np.random.randint(0, 255, size=(480, 640, 3), dtype=np.uint8)
+        for i in range(3):
+            depth = np.full((480, 640), i, dtype=np.float32)
+            b.put(rgb, depth)
+            total, doubled = b.get(timeout=10)
+            self.assertEqual(total, rgb.sum())
+            self.assertTrue((doubled == 2 * i).all())
+        self.assertEqual(b.stats()["received"], 4)
+        b.stop()
+        b.join()
+
+    def test_drop_oldest(self):
+        b = BackgroundTask(frame_init, (), frame_process, queue_depth=1, drop_oldest=True)
+        b.start()
+        wait_started(b)
+        depth = np.zeros((4, 4), dtype=np.float32)
+        for i in range(6):
+            b.put(i, depth + i, 0.5)
+        results = [b.get(timeout=10) for _ in range(6 - b.stats()["dropped"])]
+        # the last frame is never dropped
+        self.assertTrue((results[-1][1] == 10).all())
+        self.assertGreater(b.stats()["dropped"], 0)
+        # stop wakes the child up, which waits for inputs without polling
+        b.stop()
+        b.join()
+
+
+def frame(i):
+    return np.full((256, 256, 3), i, dtype=np.uint8)
+
+
+def wait_released(q):
+    # the reader hands slots back through a queue, wait for them to reach the writer
+    while q._released.empty():
+        time.sleep(0.01)
+
+
+class TestSharedMemoryQueue(unittest.TestCase):
+    def test_slots_reused(self):
+        q = SharedMemoryQueue(shared_memory=True, num_slots=2)
+        handles = []
+        q.put(frame(0))
+        q.put(frame(1))
+        for i in range(6):
+            message = q._queue.get(timeout=5)
+            handles.append(message[2])
+            self.assertTrue((q._unpack(message) == i).all())
+            wait_released(q)
+            q.put(frame(i + 2))
+        # every frame went through the one ring, the two slots taking turns
+        self.assertNotIn(None, handles)
+        self.assertEqual(len({h[0] for h in handles}), 1)
+        self.assertEqual([h[1] for h in handles], [1, 0] * 3)
+        # with both slots in use, a frame goes through the queue
+        q.put(frame(8))
+        messages = [q._queue.get(timeout=5) for _ in range(3)]
+        self.assertIsNone(messages[-1][2])
+        for i, message in zip(range(6, 9), messages):
+            self.assertTrue((q._unpack(message) == i).all())
+        self.assertEqual(q.stats()["received"], 9)
+        q.close()
+
+    def test_drop_oldest(self):
+        q = SharedMemoryQueue(maxsize=1, drop_oldest=True, shared_memory=True)
+        for i in range(5):
+            q.put(frame(i))
+        self.assertTrue((q.get(timeout=5) == 4).all())
+        stats = q.stats()
+        self.assertEqual((stats["sent"], stats["received"], stats["dropped"]), (5, 1, 4))
+        # the slots of the dropped frames are free again
+        self.assertEqual(len(q._free), q.num_slots - 1)
+        q.close()
+
 
 if __name__ == "__main__":
     foo = Foo()
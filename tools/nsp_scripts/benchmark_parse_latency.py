@@ -0,0 +1,73 @@
+"""
+Copyright (c) Facebook, Inc. and its affiliates.
+"""
+# flake8: noqa
+
+import argparse
+import glob
+import os
+import time
+import numpy as np
+from droidlet.perception.semantic_parsing.nsp_model_wrapper import DroidletSemanticParsingModel
+from droidlet.perception.semantic_parsing.utils.preprocess import preprocess_chat
+
+
+def load_commands(data_dir):
+    """Commands of every [command] | [parse_tree] (optionally prefixed by a data type) row
+    in the .txt files under data_dir"""
+    commands = []
+    for path in sorted(glob.glob(os.path.join(data_dir, "**/*.txt"), recursive=True)):
+        with open(path) as fd:
+            for line in fd:
+                parts = line.strip().split("|")
+                if len(parts) >= 2:
+                    commands.append(parts[-2].strip('"'))
+    return commands
+
+
+def report(label, latencies):
+    latencies = np.array(latencies) * 1000
+    print(
+        "{}: {} parses, p50 {:.1f} ms, p99 {:.1f} ms, mean {:.1f} ms".format(
+            label,
+            len(latencies),
+            np.percentile(latencies, 50),
+            np.percentile(latencies, 99),
+            latencies.mean(),
+        )
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--models_dir", default="droidlet/artifacts/models/nlu/")
+    parser.add_argument(
+        "--data_dir",
+        default="droidlet/artifacts/datasets/annotated_data/",
+        help="commands are read from the .txt files in here",
+    )
+    parser.add_argument("--cpu_inference", default="", choices=["", "quantize"])
+    parser.add_argument(
+        "--num_commands", type=int, default=1000, help="parse at most this many commands"
+    )
+    args = parser.parse_args()
+
+    # the parse cache is in memory only, so the first pass always queries the model
+    model = DroidletSemanticParsingModel(
+        args.models_dir, args.data_dir, cpu_inference=args.cpu_inference
+    )
+    commands = [preprocess_chat(c) for c in load_commands(args.data_dir)]
+    # repeated commands would be served from the cache in the first pass
+    commands = list(dict.fromkeys(commands))[: args.num_commands]
+    model.parse_cache.max_size = len(commands)
+    for label in ["model", "cached"]:
+        latencies = []
+        for chat in commands:
+            t = time.perf_counter()
+            model.query_for_logical_form(chat)
+            latencies.append(time.perf_counter() - t)
+        report(label, latencies)
+
+
+if __name__ == "__main__":
+    main()